@@ -0,0 +1,22 @@
+import os
+from contextlib import contextmanager
+
+
+@contextmanager
+def atomic_write(path, mode="w"):
+    """Open `path + ".tmp"` for writing and move it over `path` once the block succeeds
+
+    Readers see either the old file or the complete new one, never a partial
+    write. The parent directory is created if needed; on an error the temp
+    file is removed and `path` is left as it was.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, mode) as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -0,0 +1,60 @@
+"""Time chunked (map-reduce) summarization with 1 worker against a worker pool
+
+    python benchmarks/bench_chunked.py --emails 2000 --cases 20 --workers 1 2 4
+
+Builds uncapped case texts from a seeded BulkGenerator corpus and runs
+summarize_chunked once per --workers value, without the summary cache, on the
+same loaded model. Reports wall time, windows per second and the speedup over
+the first value; outputs are compared so a faster run that changed them shows.
+Workers are capped at the core count, so on a single core every row runs serially.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ingest_emails import BulkGenerator
+from nlp_preprocessing import CASE_PATTERN, strip_html
+from summarization import (BACKEND, BATCH_SIZE, CHUNK_TOKENS, MODEL_NAME, add_case_text, split_windows,
+                           summarize_chunked, summarizers)
+
+
+def case_texts(n_emails, n_cases, seed):
+    texts = {}
+    for message in BulkGenerator(seed=seed, n_cases=n_cases).messages(n_emails):
+        body = strip_html(message["body"]["content"])
+        case_ids = CASE_PATTERN.findall(message["subject"]) + CASE_PATTERN.findall(body)
+        add_case_text(texts, case_ids, body, limit=None)
+    return texts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--emails", type=int, default=2000)
+    parser.add_argument("--cases", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--window-tokens", type=int, default=CHUNK_TOKENS)
+    parser.add_argument("--model", default=MODEL_NAME, help="model name or local path")
+    parser.add_argument("--backend", default=BACKEND)
+    args = parser.parse_args()
+
+    texts = case_texts(args.emails, args.cases, args.seed)
+    summarizer = summarizers.get(args.model, args.backend)
+    windows = sum(len(split_windows(t, summarizer.tokenizer, args.window_tokens)) for t in texts.values())
+    print(f"{len(texts)} cases, {windows} first-level windows, {os.cpu_count()} cores")
+
+    baseline, reference = None, None
+    print(f"{'workers':>7} {'seconds':>8} {'windows/s':>10} {'speedup':>8} {'same output':>12}")
+    for workers in args.workers:
+        start = time.perf_counter()
+        results = summarize_chunked(texts, summarizer, args.batch_size, workers=workers,
+                                    window_tokens=args.window_tokens)
+        seconds = time.perf_counter() - start
+        baseline = baseline or seconds
+        reference = reference or results
+        print(f"{workers:>7} {seconds:8.1f} {windows / seconds:10.2f} {baseline / seconds:7.2f}x "
+              f"{str(results == reference):>12}")
@@ -0,0 +1,292 @@
+"""End-to-end pipeline benchmark with JSON output for comparing commits
+
+    python benchmarks/bench_pipeline.py --sizes 100,1000,10000,100000 --output bench.json
+    python benchmarks/bench_pipeline.py --sizes 1000 --compare bench.json
+
+Corpora come from ingest_emails.generate_email_batch with a fixed seed, so a
+given --seed and size always yields the same messages (only the timestamps,
+which are relative to now, differ). --generator bulk uses the vectorized
+ingest_emails.BulkGenerator instead, which is what makes 1M+ corpora practical.
+Summaries use a stub summarizer unless --summarizer names a model (a small one
+such as sshleifer/distilbart-cnn-6-6).
+Neo4j writes go to a stub driver that counts queries and rows instead of
+touching a database.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import types
+import uuid
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import ingest_emails
+import knowledge_graph
+import neo
+from graph_analytics import compute_analytics, compute_structure, with_structure
+from nlp_preprocessing import preprocess_emails
+from summarization import generate_case_summaries
+
+ENDPOINTS = [
+    "/",
+    "/cases",
+    "/cases/{case_id}",
+    "/graph/json",
+    "/graph/json?limit=500",
+    "/graph/json?center={case_id}&depth=2",
+    "/analytics/centrality?limit=50",
+    "/analytics/case-overlap?limit=100",
+    "/pipeline/status",
+    "/metrics",
+]
+
+
+def seeded_corpus(n, seed, generator="faker"):
+    """Same seed and n -> same messages; a smaller corpus is a prefix of a larger one"""
+    if generator == "bulk":
+        messages = list(ingest_emails.BulkGenerator(seed).messages(n))
+        return {"@odata.context": ingest_emails.GRAPH_CONTEXT, "value": messages}
+    random.seed(seed)
+    ingest_emails.fake.seed_instance(seed)
+    # uuid4 reads os.urandom, so draw ids from the seeded RNG instead
+    ingest_emails.uuid = types.SimpleNamespace(
+        uuid4=lambda: uuid.UUID(int=random.getrandbits(128), version=4)
+    )
+    try:
+        return ingest_emails.generate_email_batch(n=n)
+    finally:
+        ingest_emails.uuid = uuid
+
+
+class StubSummarizer:
+    """Stands in for a transformers summarization pipeline; returns the first words"""
+
+    def __call__(self, texts, **kwargs):
+        texts = [texts] if isinstance(texts, str) else texts
+        return [{"summary_text": " ".join(t.split()[:30])} for t in texts]
+
+
+class _Result:
+    def consume(self):
+        return None
+
+    def __iter__(self):
+        return iter(())
+
+
+class StubNeo4jDriver:
+    """Accepts every query, returns no records, and counts queries, transactions and rows"""
+
+    def __init__(self):
+        self.queries = 0
+        self.transactions = 0
+        self.rows = 0
+
+    def session(self, **kwargs):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def run(self, query, parameters=None, **kwargs):
+        self.queries += 1
+        rows = kwargs.get("rows", (parameters or {}).get("rows"))
+        self.rows += len(rows) if rows is not None else 0
+        return _Result()
+
+    def execute_write(self, fn, *args, **kwargs):
+        self.transactions += 1
+        return fn(self, *args, **kwargs)
+
+    execute_read = execute_write
+
+    def close(self):
+        pass
+
+
+def timed(results, size, name, fn, items, quiet=True, **extra):
+    """Run fn once, append a result row and return fn's value"""
+    out = io.StringIO() if quiet else sys.stdout
+    with contextlib.redirect_stdout(out):
+        start = time.perf_counter()
+        value = fn()
+        seconds = time.perf_counter() - start
+    results.append({
+        "size": size,
+        "name": name,
+        "seconds": seconds,
+        "items": items,
+        "items_per_sec": items / seconds if seconds > 0 else None,
+        **extra,
+    })
+    print(f"{size:>7} {name:<28} {seconds:9.3f}s  {items:>8} items", file=sys.stderr)
+    return value
+
+
+def bench_api(results, size, entities, summaries, graph, analytics, repeat):
+    """Latency of the read endpoints against an in-memory snapshot, no server or scheduler"""
+    from fastapi.testclient import TestClient
+    import main
+    from graph_backend import NetworkXBackend
+
+    backend = NetworkXBackend(path=None)
+    backend.graph = graph
+    main.store.graph = backend
+    main.store.snapshot = main.Snapshot(
+        entities=entities,
+        summaries=summaries,
+        graph_json=knowledge_graph.graph_to_json(graph),
+        case_index=main.build_case_index(entities, summaries),
+        analytics=analytics,
+        last_update=datetime.now(timezone.utc),
+    )
+    case_id = summaries["case_id"].iloc[0] if not summaries.empty else "0"
+
+    client = TestClient(main.app)
+    for template in ENDPOINTS:
+        path = template.format(case_id=case_id)
+        latencies = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            response = client.get(path)
+            latencies.append(time.perf_counter() - start)
+        latencies.sort()
+        results.append({
+            "size": size,
+            "name": f"GET {template}",
+            "seconds": statistics.mean(latencies),
+            "p50": latencies[len(latencies) // 2],
+            "p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+            "status": response.status_code,
+            "bytes": len(response.content),
+            "items": repeat,
+            "items_per_sec": repeat / sum(latencies),
+        })
+        print(f"{size:>7} {'GET ' + template:<28} {statistics.mean(latencies) * 1000:8.2f}ms  "
+              f"status {response.status_code}", file=sys.stderr)
+
+
+def run_size(size, args, summarizer):
+    results = []
+    email_json = timed(results, size, "generate_corpus", lambda: seeded_corpus(size, args.seed, args.generator), size)
+
+    entities = timed(results, size, "preprocess_emails", lambda: preprocess_emails(email_json), size)
+
+    case_ids = sorted({c for ids in entities["case_ids"] for c in ids})
+    summaries = timed(
+        results, size, "generate_case_summaries",
+        lambda: generate_case_summaries(email_json, case_ids, summarizer=summarizer),
+        len(case_ids),
+        model=args.summarizer or "stub",
+    )
+
+    graph = timed(results, size, "knowledge_graph.build_graph",
+                  lambda: knowledge_graph.build_graph(entities), size)
+
+    driver = StubNeo4jDriver()
+    timed(results, size, "neo.build_graph", lambda: neo.build_graph(entities, driver, incremental=False), size)
+    results[-1].update(queries=driver.queries, transactions=driver.transactions, rows=driver.rows)
+
+    analytics = timed(results, size, "compute_analytics", lambda: compute_analytics(entities), size)
+    structure = timed(results, size, "compute_structure", lambda: compute_structure(entities), size)
+    analytics = with_structure(analytics, structure)
+
+    if not args.skip_api:
+        bench_api(results, size, entities, summaries, graph, analytics, args.repeat)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline_path, threshold):
+    """Print current/baseline time ratios; returns the rows slower than threshold"""
+    with open(baseline_path) as f:
+        baseline = {(r["size"], r["name"]): r for r in json.load(f)["results"]}
+    regressions = []
+    print(f"\nvs {baseline_path}:", file=sys.stderr)
+    for r in report["results"]:
+        base = baseline.get((r["size"], r["name"]))
+        if not base or not base["seconds"]:
+            continue
+        ratio = r["seconds"] / base["seconds"]
+        flag = "  REGRESSION" if ratio > threshold else ""
+        print(f"{r['size']:>7} {r['name']:<28} {ratio:6.2f}x{flag}", file=sys.stderr)
+        if flag:
+            regressions.append(r)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="100,1000,10000,100000",
+                        help="comma separated corpus sizes")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--generator", choices=["faker", "bulk"], default="faker")
+    parser.add_argument("--summarizer", default=None,
+                        help="Hugging Face model to summarize with (default: stub)")
+    parser.add_argument("--repeat", type=int, default=20, help="requests per endpoint")
+    parser.add_argument("--skip-api", action="store_true")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--compare", help="baseline JSON report to compare against")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="slowdown ratio reported as a regression")
+    args = parser.parse_args()
+
+    if args.summarizer:
+        from transformers import pipeline as hf_pipeline
+        summarizer = hf_pipeline("summarization", model=args.summarizer)
+    else:
+        summarizer = StubSummarizer()
+
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = os.path.abspath(args.compare) if args.compare else None
+    # main.py reads and writes data/ relative to the working directory; keep that out of the repo
+    os.environ.setdefault("GRAPH_BACKEND", "networkx")
+    workdir = tempfile.mkdtemp(prefix="bench_pipeline_")
+    os.environ.setdefault("SNAPSHOT_DIR", os.path.join(workdir, "snapshot"))
+    os.chdir(workdir)
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    report = {
+        "commit": git_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": args.seed,
+        "generator": args.generator,
+        "summarizer": args.summarizer or "stub",
+        "results": [],
+    }
+    for size in sizes:
+        report["results"].extend(run_size(size, args, summarizer))
+
+    text = json.dumps(report, indent=2, default=str)
+    if output:
+        with open(output, "w") as f:
+            f.write(text)
+        print(f"Wrote {output}", file=sys.stderr)
+    else:
+        print(text)
+
+    if baseline:
+        sys.exit(1 if compare(report, baseline, args.threshold) else 0)
@@ -0,0 +1,50 @@
+"""Compare per-email nlp() calls with the batched nlp.pipe engine and the rule-based modes
+
+    python benchmarks/bench_preprocess.py --n 10000 --batch-size 256 --n-process 2
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import spacy
+from ingest_emails import generate_email_batch
+from nlp_preprocessing import email_text, entities_from_doc, extract_entities_stream
+
+
+def run_baseline(emails):
+    """Original behaviour: full pipeline, one nlp() call per email"""
+    full_nlp = spacy.load("en_core_web_sm")
+    return [entities_from_doc(e, full_nlp(email_text(e))) for e in emails]
+
+
+def run_batched(emails, batch_size, n_process, mode="ner"):
+    return list(extract_entities_stream(iter(emails), batch_size=batch_size, n_process=n_process, mode=mode))
+
+
+def timed(label, fn, n):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<10} {elapsed:8.2f}s  {n / elapsed:10.1f} emails/sec")
+    return elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=10000)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--n-process", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"Generating {args.n} emails...")
+    emails = generate_email_batch(n=args.n)["value"]
+
+    before = timed("before", lambda: run_baseline(emails), args.n)
+    after = timed("after", lambda: run_batched(emails, args.batch_size, args.n_process), args.n)
+    print(f"speedup    {before / after:.1f}x")
+    for mode in ("auto", "rules"):
+        elapsed = timed(mode, lambda: run_batched(emails, args.batch_size, args.n_process, mode), args.n)
+        print(f"speedup    {before / elapsed:.1f}x")
@@ -0,0 +1,136 @@
+"""Compare summarization backends on the cases in the pipeline's snapshot
+
+    python benchmarks/bench_summarization.py --variants pytorch int8 onnx \
+        int8:sshleifer/distilbart-cnn-12-6 --cases 50
+
+A variant is `backend` or `backend:model` (model defaults to SUMMARIZER_MODEL).
+Each variant runs in a fresh interpreter so load time and peak RSS are its own.
+Inputs are the case texts stored in the snapshot, capped the way the pipeline
+caps them in truncate mode, and every output is scored with ROUGE-L F1 against
+the stored summary, which is what the current pytorch backend produced.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def rouge_l(candidate, reference):
+    """ROUGE-L F1 over lowercased word tokens"""
+    a, b = candidate.lower().split(), reference.lower().split()
+    if not a or not b:
+        return 0.0
+    previous = [0] * (len(b) + 1)
+    for x in a:
+        current = [0]
+        for j, y in enumerate(b):
+            current.append(previous[j] + 1 if x == y else max(previous[j + 1], current[j]))
+        previous = current
+    lcs = previous[-1]
+    if not lcs:
+        return 0.0
+    precision, recall = lcs / len(a), lcs / len(b)
+    return 2 * precision * recall / (precision + recall)
+
+
+def load_cases(limit):
+    import snapshot
+    from summarization import MAX_INPUT_CHARS
+    if not snapshot.exists():
+        sys.exit(f"No snapshot in {snapshot.SNAPSHOT_DIR}; run the pipeline first")
+    _, stored, case_texts, _ = snapshot.read_snapshot()
+    stored = stored.dropna()
+    stored = stored.head(limit) if limit else stored
+    texts = {c: case_texts[c][:MAX_INPUT_CHARS] for c in stored["case_id"] if case_texts.get(c)}
+    references = {c: s for c, s in zip(stored["case_id"], stored["summary"]) if c in texts}
+    return texts, references
+
+
+def run_variant(backend, model, limit, batch_size):
+    """Body of the child process: load, summarize every case once, report on stdout"""
+    import resource
+    import time
+    from summarization import summarizers, summarize_texts
+
+    texts, references = load_cases(limit)
+    start = time.perf_counter()
+    summarizer = summarizers.get(model, backend)
+    load_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = summarize_texts(texts, summarizer, batch_size=batch_size)
+    seconds = time.perf_counter() - start
+
+    tokenizer = summarizer.tokenizer
+    input_tokens = sum(len(tokenizer(t)["input_ids"]) for t in texts.values())
+    output_tokens = sum(len(tokenizer(s)["input_ids"]) for s in results.values())
+    scores = [rouge_l(results.get(c, ""), references[c]) for c in references]
+    stats = next(iter(summarizers.stats().values()))
+    return {
+        "cases": len(texts),
+        "load_seconds": load_seconds,
+        "seconds": seconds,
+        "input_tokens_per_sec": input_tokens / seconds,
+        "output_tokens_per_sec": output_tokens / seconds,
+        "model_bytes": stats["memory_bytes"],
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        "rouge_l": sum(scores) / len(scores) if scores else None,
+    }
+
+
+def parse_variant(value, default_model):
+    backend, _, model = value.partition(":")
+    return backend, model or default_model
+
+
+def _mb(value):
+    return f"{value / 2**20:9.0f}" if value else f"{'-':>9}"
+
+
+if __name__ == "__main__":
+    from summarization import BACKENDS, MODEL_NAME
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--variants", nargs="+", default=list(BACKENDS),
+                        help="backend or backend:model, e.g. pytorch int8 onnx:sshleifer/distilbart-cnn-12-6")
+    parser.add_argument("--cases", type=int, default=50, help="0 for every stored case")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--output", help="write the report as JSON")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        backend, model = parse_variant(args.child, MODEL_NAME)
+        print(json.dumps(run_variant(backend, model, args.cases, args.batch_size)))
+        sys.exit(0)
+
+    report = {}
+    for variant in args.variants:
+        backend, model = parse_variant(variant, MODEL_NAME)
+        print(f"Running {backend} on {model}...")
+        result = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", f"{backend}:{model}",
+                                 "--cases", str(args.cases), "--batch-size", str(args.batch_size)],
+                                cwd=ROOT, capture_output=True, text=True)
+        if result.returncode != 0:
+            print(f"  failed:\n{result.stderr[-2000:]}")
+            continue
+        # The child's report is its last stdout line; anything before it is summarizer logging
+        report[f"{backend}:{model}"] = json.loads(result.stdout.strip().splitlines()[-1])
+
+    baseline = report.get(f"pytorch:{MODEL_NAME}")
+    print(f"\n{'variant':<45} {'load s':>7} {'run s':>7} {'in tok/s':>9} {'out tok/s':>9} "
+          f"{'model MB':>9} {'peak MB':>9} {'ROUGE-L':>8} {'speedup':>8}")
+    for name, r in report.items():
+        speedup = f"{baseline['seconds'] / r['seconds']:7.1f}x" if baseline else f"{'-':>8}"
+        print(f"{name:<45} {r['load_seconds']:7.1f} {r['seconds']:7.1f} {r['input_tokens_per_sec']:9.0f} "
+              f"{r['output_tokens_per_sec']:9.1f} {_mb(r['model_bytes'])} {_mb(r['peak_rss_bytes'])} "
+              f"{r['rouge_l'] or 0:8.3f} {speedup}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,75 @@
+"""Fail if importing main.py blows the startup budget or pulls in model/driver libraries
+
+    python benchmarks/check_startup.py --budget 2.0
+
+Each run imports main in a fresh interpreter (GRAPH_BACKEND=networkx unless set,
+so no Neo4j credentials are needed) and the fastest of --runs is compared with
+the budget. The slowest imports are listed from python -X importtime. Exits 1
+when over budget or when any of HEAVY_MODULES got imported eagerly.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Loaded on first use or by the background warm-up, never by `import main`
+HEAVY_MODULES = ["transformers", "torch", "spacy", "neo4j"]
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import main
+print(json.dumps({"seconds": time.perf_counter() - start,
+                  "heavy": [m for m in %r if m in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+
+def probe(env):
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", PROBE], cwd=ROOT, env=env,
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        sys.exit(f"import main failed:\n{result.stderr[-2000:]}")
+    # The probe's own output is the last stdout line; anything before it is main's logging
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def slowest_imports(importtime, top):
+    rows = []
+    for line in importtime.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Nesting is shown as two spaces per level; keep main and what it imports directly
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth <= 1:
+            rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--budget", type=float, default=float(os.getenv("STARTUP_BUDGET_SECONDS", "2.0")),
+                        help="max seconds for `import main`")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    env = {**os.environ, "GRAPH_BACKEND": os.getenv("GRAPH_BACKEND", "networkx")}
+    runs = [probe(env) for _ in range(args.runs)]
+    best, importtime = min(runs, key=lambda r: r[0]["seconds"])
+
+    print(f"import main: {best['seconds']:.2f}s (budget {args.budget:.2f}s, best of {args.runs})")
+    for cumulative, name in slowest_imports(importtime, args.top):
+        print(f"  {cumulative / 1e6:6.3f}s  {name}")
+
+    failures = []
+    if best["seconds"] > args.budget:
+        failures.append(f"import took {best['seconds']:.2f}s, over the {args.budget:.2f}s budget")
+    if best["heavy"]:
+        failures.append(f"imported eagerly: {', '.join(best['heavy'])}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,30 @@
+def build_case_index(entities, summaries):
+    """Materialize case_id -> participants, teams, email ids and summary in one pass"""
+    cases = {}
+    if not entities.empty:
+        for email_id, case_ids, participants, teams in zip(
+            entities["email_id"], entities["case_ids"], entities["participants"], entities["teams"]
+        ):
+            # case_ids can repeat within one email ("Case 1983" in subject and body)
+            for case_id in set(case_ids):
+                entry = cases.setdefault(case_id, {"participants": set(), "teams": set(), "email_ids": []})
+                entry["participants"].update(participants)
+                entry["teams"].update(teams)
+                entry["email_ids"].append(email_id)
+
+    summary_by_case = {}
+    if not summaries.empty:
+        summary_by_case = dict(zip(summaries["case_id"].astype(str), summaries["summary"]))
+
+    index = {}
+    for case_id in list(cases) + [c for c in summary_by_case if c not in cases]:
+        entry = cases.get(case_id, {"participants": (), "teams": (), "email_ids": []})
+        index[case_id] = {
+            "case_id": case_id,
+            "summary": summary_by_case.get(case_id),
+            "participants": sorted(entry["participants"]),
+            "teams": sorted(entry["teams"]),
+            "emails": len(entry["email_ids"]),
+            "email_ids": entry["email_ids"],
+        }
+    return index
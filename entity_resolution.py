@@ -0,0 +1,185 @@
+import json
+import os
+import re
+import threading
+from difflib import SequenceMatcher
+from atomic_file import atomic_write
+
+# NER picks up the words around a name ("Inform Thomas", "Dawn Aguirre MD")
+LEADING_NOISE = ["inform", "loop in", "cc", "coordinate with", "contact", "ask", "tell", "ping", "per", "dear", "hi"]
+TITLES = {"mr", "mrs", "ms", "miss", "dr", "prof", "sgt", "capt", "col", "maj", "lt", "gen", "hon"}
+SUFFIXES = {"md", "dds", "dvm", "phd", "jr", "sr", "ii", "iii", "iv", "esq"}
+NAME_TOKEN = re.compile(r"[a-z][a-z'\-]*")
+# Full names in the same block at least this similar are the same person
+MATCH_THRESHOLD = float(os.getenv("ENTITY_MATCH_THRESHOLD", "0.88"))
+
+ADDRESS_FIELDS = ["from", "toRecipients", "ccRecipients", "bccRecipients"]
+
+
+def name_tokens(name):
+    """Lowercased name tokens without leading filler words, titles or suffixes"""
+    text = name.lower().strip()
+    for noise in LEADING_NOISE:
+        if text.startswith(noise + " ") or text.startswith(noise + ":"):
+            text = text[len(noise) + 1:]
+            break
+    tokens = [t.strip("'-") for t in NAME_TOKEN.findall(text)]
+    return [t for t in tokens if t and t not in TITLES and t not in SUFFIXES]
+
+
+def block_keys(tokens):
+    """Blocking keys: only people sharing a key are ever compared"""
+    if not tokens:
+        return []
+    if len(tokens) == 1:
+        return [f"first:{tokens[0]}"]
+    return [f"last:{tokens[-1]}:{tokens[0][0]}", f"first:{tokens[0]}"]
+
+
+def message_people(message):
+    """(address, name) for everyone on the message's address fields"""
+    people = []
+    for field in ADDRESS_FIELDS:
+        value = message.get(field) or []
+        for recipient in [value] if isinstance(value, dict) else value:
+            address = recipient["emailAddress"].get("address")
+            if address:
+                people.append((address.lower(), recipient["emailAddress"].get("name") or address))
+    return people
+
+
+class PersonResolver:
+    """Maps participant names to canonical people, keyed on email address
+
+    Everyone seen on an address field becomes a person identified by their
+    address; the first name seen for it is the display name, so graph nodes keep
+    a stable name. Names without an address (NER mentions in the body) are
+    resolved through blocking: exact normalized match first, then fuzzy match
+    against people sharing a surname/first-initial or first-name block, and a
+    first-name-only mention goes to the single matching participant of the
+    message (or the single matching person overall). Full-name results are
+    cached per alias and saved, so later runs only resolve new names; bare first
+    names are resolved per message and never cached.
+    """
+
+    def __init__(self, path="data/person_map.json"):
+        self.path = path
+        self._lock = threading.Lock()
+        self.load()
+
+    def _reset(self):
+        self.people = {}      # person id -> display name
+        self.names = {}       # person id -> name the person was first seen under
+        self.aliases = {}     # raw name -> person id, the cached canonical map
+        self.normalized = {}  # normalized full name -> person id
+        self.blocks = {}      # block key -> person ids
+        self._displays = set()
+        self.comparisons = 0
+
+    def _add_person(self, person_id, name, display=None):
+        if display is None:
+            display = name
+            if display in self._displays:
+                # Two addresses with one name stay two people
+                display = f"{name} <{person_id}>"
+        self.people[person_id] = display
+        self.names[person_id] = name
+        self._displays.add(display)
+        tokens = name_tokens(name)
+        if tokens:
+            self.normalized.setdefault(" ".join(tokens), person_id)
+        for key in block_keys(tokens):
+            self.blocks.setdefault(key, []).append(person_id)
+
+    def observe(self, message):
+        """Learn the address-backed people on one message; returns {name: person id} for it"""
+        seen = {}
+        for address, name in message_people(message):
+            if address not in self.people:
+                self._add_person(address, name)
+            self.aliases.setdefault(name, address)
+            seen[name] = address
+        return seen
+
+    def _match_first_name(self, first, local):
+        """The person a bare first name means: the single such participant of the message, else the single one known"""
+        candidates = [p for p in self.blocks.get(f"first:{first}", []) if not p.startswith("name:")]
+        in_message = set(p for p in candidates if p in local)
+        if len(in_message) == 1:
+            return in_message.pop()
+        return candidates[0] if len(set(candidates)) == 1 else None
+
+    def _match(self, tokens):
+        key = " ".join(tokens)
+        if key in self.normalized:
+            return self.normalized[key]
+        candidates = dict.fromkeys(c for k in block_keys(tokens) for c in self.blocks.get(k, []))
+        best, best_score = None, MATCH_THRESHOLD
+        for candidate in candidates:
+            self.comparisons += 1
+            score = SequenceMatcher(None, key, " ".join(name_tokens(self.names[candidate]))).ratio()
+            if score > best_score or (best is None and score == best_score):
+                best, best_score = candidate, score
+        return best
+
+    def _name_only(self, tokens):
+        person_id = "name:" + " ".join(tokens)
+        if person_id not in self.people:
+            self._add_person(person_id, " ".join(t.capitalize() for t in tokens))
+        return person_id
+
+    def resolve(self, name, local=()):
+        """Person id for a name, creating a name-only person when nothing matches"""
+        tokens = name_tokens(name)
+        if not tokens:
+            return None
+        if len(tokens) == 1:
+            # A bare first name depends on who is on the message, so it is never cached as an alias
+            return self._match_first_name(tokens[0], set(local)) or self._name_only(tokens)
+        person_id = self.aliases.get(name)
+        if person_id is None:
+            person_id = self._match(tokens) or self._name_only(tokens)
+            self.aliases[name] = person_id
+        return person_id
+
+    def resolve_entities(self, messages, entities):
+        """Copy of entities with participants replaced by canonical display names"""
+        resolved = []
+        with self._lock:
+            for message, participants in zip(messages, entities["participants"]):
+                local = self.observe(message)
+                ids = [local.get(name) or self.resolve(name, local.values()) for name in participants]
+                resolved.append(list(dict.fromkeys(self.people[i] for i in ids if i)))
+        entities = entities.copy()
+        entities["participants"] = resolved
+        return entities
+
+    def stats(self):
+        return {"people": len(self.people), "aliases": len(self.aliases), "blocks": len(self.blocks),
+                "comparisons": self.comparisons}
+
+    def load(self):
+        """Replace the in-memory map with the saved one (empty when nothing is saved)"""
+        with self._lock:
+            self._reset()
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Could not load person map: {e}")
+            return
+        with self._lock:
+            for person_id, name, display in state["people"]:
+                self._add_person(person_id, name, display)
+            self.aliases = state["aliases"]
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            # People are saved in creation order so display names come back the same
+            state = {"people": [(i, self.names[i], d) for i, d in self.people.items()], "aliases": self.aliases}
+            with atomic_write(self.path) as f:
+                json.dump(state, f)
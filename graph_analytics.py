@@ -0,0 +1,218 @@
+import hashlib
+import os
+from datetime import datetime, timezone
+import networkx as nx
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from scipy.sparse.csgraph import connected_components
+
+# Components larger than this get sampled (approximate) betweenness
+BETWEENNESS_SAMPLES = int(os.getenv("BETWEENNESS_SAMPLES", "500"))
+# Overlapping cases kept per case; 0 keeps every pair that shares a participant
+CASE_OVERLAP_TOP_K = int(os.getenv("CASE_OVERLAP_TOP_K", "20"))
+
+
+def incidence(entities, column):
+    """Sparse email x value matrix for one list column, plus the value labels"""
+    exploded = entities[column].explode().dropna().astype(str).str.strip()
+    exploded = exploded[exploded != ""]
+    pairs = pd.DataFrame({"row": exploded.index, "value": exploded.values}).drop_duplicates()
+    codes, labels = pd.factorize(pairs["value"])
+    matrix = sp.csr_matrix(
+        (np.ones(len(pairs), dtype=np.int32), (pairs["row"].to_numpy(), codes)),
+        shape=(len(entities), len(labels)),
+    )
+    return matrix, list(labels)
+
+
+def build_adjacency(entities):
+    """Block adjacency over persons, teams and cases with the knowledge graph's edges
+
+    Person-person weights count shared emails (COMMUNICATED_IN); person-case
+    (INVOLVED_IN) and team-case (HANDLES) entries are 1.
+    """
+    entities = entities.reset_index(drop=True)
+    email_person, persons = incidence(entities, "participants")
+    email_team, teams = incidence(entities, "teams")
+    email_case, cases = incidence(entities, "case_ids")
+
+    person_person = (email_person.T @ email_person).tolil()
+    person_person.setdiag(0)
+    person_person = person_person.tocsr()
+    person_person.eliminate_zeros()
+    person_case = ((email_person.T @ email_case) > 0).astype(np.int32)
+    team_case = ((email_team.T @ email_case) > 0).astype(np.int32)
+
+    n_p, n_t, n_c = len(persons), len(teams), len(cases)
+    adjacency = sp.bmat([
+        [person_person, sp.csr_matrix((n_p, n_t)), person_case],
+        [sp.csr_matrix((n_t, n_p)), sp.csr_matrix((n_t, n_t)), team_case],
+        [person_case.T, team_case.T, sp.csr_matrix((n_c, n_c))],
+    ], format="csr")
+    nodes = [("Person", p) for p in persons] + [("Team", t) for t in teams] + [("Case", c) for c in cases]
+    return adjacency, nodes, person_case, team_case, cases
+
+
+def case_overlap(person_case, team_case, cases, top_k=CASE_OVERLAP_TOP_K):
+    """Case pairs sharing at least one participant, each case's `top_k` strongest pairs
+
+    Teams are few, so nearly every case shares one with every other; shared
+    teams only rank and annotate pairs that already share a participant.
+    """
+    shared_people = sp.triu(person_case.T @ person_case, k=1).tocoo()
+    i, j, people = shared_people.row, shared_people.col, shared_people.data
+    if not len(i):
+        return []
+    teams = np.asarray((team_case.T @ team_case).tocsr()[i, j]).ravel()
+
+    if top_k:
+        # Rank every pair from both of its cases and keep it if either ranks it in its top_k
+        case, other = np.concatenate([i, j]), np.concatenate([j, i])
+        pair = np.tile(np.arange(len(i)), 2)
+        # Ties go to the other case with the lowest id, as in the final sort
+        label_rank = np.argsort(np.argsort(np.asarray(cases, dtype=str)))
+        order = np.lexsort((label_rank[other], -np.tile(teams, 2), -np.tile(people, 2), case))
+        case, pair = case[order], pair[order]
+        starts = np.flatnonzero(np.r_[True, case[1:] != case[:-1]])
+        rank = np.arange(len(case)) - np.repeat(starts, np.diff(np.r_[starts, len(case)]))
+        keep = np.unique(pair[rank < top_k])
+        i, j, people, teams = i[keep], j[keep], people[keep], teams[keep]
+
+    labels = np.asarray(cases, dtype=object)
+    overlap = pd.DataFrame({
+        "case_a": labels[i],
+        "case_b": labels[j],
+        "shared_participants": people.astype(int),
+        "shared_teams": teams.astype(int),
+    }).sort_values(["shared_participants", "shared_teams", "case_a", "case_b"],
+                   ascending=[False, False, True, True])
+    return overlap.to_dict("records")
+
+
+class AnalyticsCache:
+    """Per-component betweenness and communities, reused while a component is unchanged
+
+    New emails only ever add nodes and edges, so a component whose members and
+    total edge weight match a cached entry has not been touched. That only pays
+    off for mailboxes that split into several components; a typical mailbox is
+    one large component which any new email touches, so compute_structure runs
+    in full and is kept off the pipeline's critical path.
+    """
+
+    def __init__(self):
+        self._components = {}
+        self.last_recomputed = 0
+
+    @staticmethod
+    def _key(names, sub):
+        digest = hashlib.sha1()
+        for type_, name in names:
+            digest.update(f"{type_}:{name}\0".encode())
+        digest.update(str(sub.sum()).encode())
+        return digest.hexdigest()
+
+    def component_results(self, adjacency, nodes):
+        n_components, labels = connected_components(adjacency, directed=False)
+        members = [[] for _ in range(n_components)]
+        for idx, label in enumerate(labels):
+            members[label].append(idx)
+
+        results, recomputed = {}, 0
+        for idx in members:
+            sub = adjacency[idx][:, idx]
+            names = [nodes[i] for i in idx]
+            key = self._key(names, sub)
+            if key not in self._components:
+                self._components[key] = _analyze_component(sub, names)
+                recomputed += 1
+            results[key] = self._components[key]
+
+        # Forget components that no longer exist (they were merged or grew)
+        self._components = results
+        self.last_recomputed = recomputed
+        return list(results.values())
+
+
+def _analyze_component(sub, names):
+    G = nx.from_scipy_sparse_array(sub)
+    n = G.number_of_nodes()
+    k = BETWEENNESS_SAMPLES if n > BETWEENNESS_SAMPLES else None
+    betweenness = nx.betweenness_centrality(G, k=k, normalized=False, seed=0)
+    communities = nx.community.louvain_communities(G, weight="weight", seed=0) if n > 1 else [{0}]
+    return {
+        "betweenness": {names[i]: value for i, value in betweenness.items()},
+        "communities": [[names[i] for i in sorted(c)] for c in communities],
+    }
+
+
+def compute_analytics(entities):
+    """Degree centrality and case overlap for an entities DataFrame
+
+    Betweenness and communities cost far more on a large connected mailbox, so
+    they come from compute_structure and are merged in with with_structure.
+    """
+    if entities.empty:
+        return {"nodes": [], "case_overlap": [], "computed_at": datetime.now(timezone.utc)}
+
+    adjacency, nodes, person_case, team_case, cases = build_adjacency(entities)
+    degree = adjacency.getnnz(axis=1) / max(len(nodes) - 1, 1)
+    return {
+        "nodes": [
+            {"id": name, "type": type_, "degree": float(degree[i])}
+            for i, (type_, name) in enumerate(nodes)
+        ],
+        "case_overlap": case_overlap(person_case, team_case, cases),
+        "computed_at": datetime.now(timezone.utc),
+    }
+
+
+def compute_structure(entities, cache=None):
+    """Betweenness centrality and communities, per connected component"""
+    cache = cache or AnalyticsCache()
+    if entities.empty:
+        return {"betweenness": {}, "communities": [], "components": 0, "recomputed_components": 0,
+                "computed_at": datetime.now(timezone.utc)}
+
+    adjacency, nodes, _, _, _ = build_adjacency(entities)
+    n = len(nodes)
+    components = cache.component_results(adjacency, nodes)
+    # Betweenness is computed per component; only the normalization depends on the whole graph
+    scale = 2.0 / ((n - 1) * (n - 2)) if n > 2 else 1.0
+    betweenness = {}
+    communities = []
+    for component in components:
+        betweenness.update((node, value * scale) for node, value in component["betweenness"].items())
+        communities.extend(component["communities"])
+    communities.sort(key=len, reverse=True)
+    return {
+        "betweenness": betweenness,
+        "communities": communities,
+        "components": len(components),
+        "recomputed_components": cache.last_recomputed,
+        "computed_at": datetime.now(timezone.utc),
+    }
+
+
+def with_structure(analytics, structure):
+    """Copy of `analytics` with betweenness and community ids on its nodes and the communities list"""
+    community_of = {}
+    for i, community in enumerate(structure["communities"]):
+        for node in community:
+            community_of[node] = i
+    betweenness = structure["betweenness"]
+    return dict(
+        analytics,
+        nodes=[
+            dict(node, betweenness=betweenness.get((node["type"], node["id"]), 0.0),
+                 community=community_of.get((node["type"], node["id"])))
+            for node in analytics["nodes"]
+        ],
+        communities=[
+            {"id": i, "size": len(c), "members": [{"id": name, "type": type_} for type_, name in c]}
+            for i, c in enumerate(structure["communities"])
+        ],
+        components=structure["components"],
+        recomputed_components=structure["recomputed_components"],
+        structure_computed_at=structure["computed_at"],
+    )
@@ -0,0 +1,231 @@
+import bisect
+import json
+import os
+import threading
+import networkx as nx
+from atomic_file import atomic_write
+import knowledge_graph
+import neo
+from neo import NODE_TYPES, MAX_EGO_DEPTH
+from metrics import CountingDriver
+
+GRAPH_BACKEND = os.getenv("GRAPH_BACKEND", "neo4j").lower()
+GRAPH_SNAPSHOT_PATH = os.getenv("GRAPH_SNAPSHOT_PATH", "data/graph.pickle")
+# Graph watermark of the Neo4j backend; the networkx one is kept inside its pickle
+GRAPH_STATE_PATH = os.getenv("GRAPH_STATE_PATH", "data/graph_state.json")
+
+
+class GraphBackend:
+    """Storage the pipeline writes entities into and the API reads the graph from"""
+
+    name = None
+
+    def upsert(self, entity_df):
+        """Merge emails not yet in the graph; returns write counts"""
+        raise NotImplementedError
+
+    def rebuild(self, entity_df):
+        """Drop the graph and build it again from entity_df"""
+        raise NotImplementedError
+
+    def to_json(self):
+        raise NotImplementedError
+
+    def iter_graph(self, node_types=None, center=None, depth=1, min_weight=None, cursor=None, limit=None):
+        """Yield (kind, key, item) for nodes then links, resuming after `cursor`"""
+        raise NotImplementedError
+
+    def read_watermark(self):
+        """How many snapshot entity rows are in the graph, in snapshot order; 0 when unknown"""
+        return 0
+
+    def write_watermark(self, rows):
+        """Record that the first `rows` snapshot entity rows are in the graph; persisted by save()"""
+
+    def save(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class Neo4jBackend(GraphBackend):
+    name = "neo4j"
+
+    def __init__(self, driver, uri=None, state_path=GRAPH_STATE_PATH):
+        self.driver = driver
+        self.uri = uri
+        self.state_path = state_path
+        self._watermark = None
+
+    def upsert(self, entity_df):
+        return neo.build_graph(entity_df, self.driver)
+
+    def rebuild(self, entity_df):
+        return neo.rebuild_graph(entity_df, self.driver)
+
+    def to_json(self):
+        return neo.graph_to_json(self.driver)
+
+    def iter_graph(self, node_types=None, center=None, depth=1, min_weight=None, cursor=None, limit=None):
+        return neo.iter_graph(self.driver, node_types, center, depth, min_weight, cursor, limit)
+
+    def read_watermark(self):
+        if not os.path.exists(self.state_path):
+            return 0
+        with open(self.state_path, "r") as f:
+            state = json.load(f)
+        # Written for another database, the rows say nothing about this one
+        return state["rows"] if state.get("uri") == self.uri else 0
+
+    def write_watermark(self, rows):
+        self._watermark = rows
+
+    def save(self):
+        if self._watermark is None:
+            return
+        with atomic_write(self.state_path) as f:
+            json.dump({"uri": self.uri, "rows": self._watermark}, f)
+
+    def close(self):
+        self.driver.close()
+        print("Closed Neo4j connection")
+
+
+class NetworkXBackend(GraphBackend):
+    """In-process graph, updated per email and persisted as a pickle snapshot"""
+
+    name = "networkx"
+
+    def __init__(self, path=GRAPH_SNAPSHOT_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self.graph = nx.Graph()
+        self._pages = None
+        if path and os.path.exists(path):
+            self.graph = knowledge_graph.load_graph(path)
+            print(f"Loaded graph snapshot {path} ({self.graph.number_of_nodes()} nodes)")
+
+    def upsert(self, entity_df):
+        with self._lock:
+            written = knowledge_graph.update_graph(self.graph, entity_df)
+            if written:
+                self._pages = None
+        return {"emails_written": written, "emails_skipped": len(entity_df) - written}
+
+    def rebuild(self, entity_df):
+        graph = knowledge_graph.build_graph(entity_df)
+        with self._lock:
+            self.graph = graph
+            self._pages = None
+        return {"emails_written": len(entity_df), "emails_skipped": 0}
+
+    def read_watermark(self):
+        # Kept on the graph itself, so it is saved with it and a rebuilt graph starts from 0
+        with self._lock:
+            return self.graph.graph.get("snapshot_rows", 0)
+
+    def write_watermark(self, rows):
+        with self._lock:
+            self.graph.graph["snapshot_rows"] = rows
+
+    def to_json(self):
+        with self._lock:
+            return knowledge_graph.graph_to_json(self.graph)
+
+    def _scope(self, G, node_types, center, depth):
+        if center is not None:
+            by_name = [n for n, d in G.nodes(data=True) if d.get("name", n) == center]
+            if not by_name:
+                return []
+            depth = max(0, min(int(depth), MAX_EGO_DEPTH))
+            scope = set()
+            for node in by_name:
+                scope.update(nx.single_source_shortest_path_length(G, node, cutoff=depth))
+        else:
+            scope = G.nodes
+        if node_types:
+            scope = [n for n in scope if G.nodes[n].get("type") in node_types]
+        return scope
+
+    def _page_index(self):
+        """Sorted nodes and links with their cursor keys, built once per graph version
+
+        Keys and order mirror neo.graph_segments so a cursor means the same thing
+        on both backends. Edges are undirected here, so each is turned the way
+        Neo4j stores it: towards the case, and person to person in name order.
+        upsert and rebuild drop the index; the caller holds the lock.
+        """
+        if self._pages is None:
+            G = self.graph
+            keys = {n: (d.get("type"), d.get("name", n)) for n, d in G.nodes(data=True)}
+            nodes = sorted(
+                ((keys[n], n, {"id": d.get("name", n), "type": d.get("type"), "color": d.get("color")})
+                 for n, d in G.nodes(data=True)),
+                key=lambda node: node[0],
+            )
+            links = []
+            for s, t, d in G.edges(data=True):
+                s, t = sorted((s, t), key=lambda n: (keys[n][0] == "Case", keys[n]))
+                relation = d.get("relation", "").upper()
+                weight = d.get("weight", 1)
+                links.append((keys[s] + keys[t] + (relation,), s, t, weight,
+                              {"source": keys[s][1], "target": keys[t][1], "relation": relation, "weight": weight}))
+            links.sort(key=lambda link: link[0])
+            self._pages = (nodes, [node[0] for node in nodes], links, [link[0] for link in links])
+        return self._pages
+
+    def iter_graph(self, node_types=None, center=None, depth=1, min_weight=None, cursor=None, limit=None):
+        with self._lock:
+            nodes, node_keys, links, link_keys = self._page_index()
+            scope = set(self._scope(self.graph, None, center, depth)) if center is not None else None
+        types = set(node_types) if node_types else None
+
+        def wanted(n, type_):
+            return (scope is None or n in scope) and (types is None or type_ in types)
+
+        phase, after = cursor or ("node", None)
+        remaining = limit if limit is not None else float("inf")
+        if phase == "node":
+            start = bisect.bisect_right(node_keys, after) if after else 0
+            for i in range(start, len(nodes)):
+                key, n, item = nodes[i]
+                if remaining <= 0:
+                    return
+                if wanted(n, key[0]):
+                    remaining -= 1
+                    yield "node", key, item
+            after = None
+        start = bisect.bisect_right(link_keys, after) if after else 0
+        for i in range(start, len(links)):
+            key, s, t, weight, item = links[i]
+            if remaining <= 0:
+                return
+            if weight >= (min_weight or 0) and wanted(s, key[0]) and wanted(t, key[2]):
+                remaining -= 1
+                yield "link", key, item
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            knowledge_graph.save_graph(self.graph, self.path)
+
+
+def create_backend(name=GRAPH_BACKEND):
+    """Build the configured backend, or None if Neo4j was selected but is unreachable"""
+    if name == "networkx":
+        return NetworkXBackend()
+    if name != "neo4j":
+        raise RuntimeError(f"Unknown GRAPH_BACKEND {name!r}, expected 'neo4j' or 'networkx'")
+
+    from neo4j import GraphDatabase
+    uri = os.getenv("NEO4J_URI")
+    try:
+        driver = GraphDatabase.driver(uri, auth=(os.getenv("NEO4J_USERNAME"), os.getenv("NEO4J_PASSWORD")))
+        driver.verify_connectivity()
+        print(f"Connected to Neo4j at {uri}")
+        return Neo4jBackend(CountingDriver(driver), uri)
+    except Exception as e:
+        print(f"Warning: Could not connect to Neo4j: {e}")
+        return None
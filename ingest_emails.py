@@ -1,7 +1,10 @@
 
+import json
+import os
 import random
 import uuid
 from datetime import datetime, timedelta
+import numpy as np
 from faker import Faker
 
 fake = Faker()
@@ -65,8 +68,241 @@ def generate_email(case_id: int):
         "hasAttachments": random.choice([False, False, True])
     }
 
+GRAPH_CONTEXT = "https://graph.microsoft.com/v1.0/$metadata#users('mockuser')/messages"
+
 def generate_email_batch(n=10):
     return {
-        "@odata.context": "https://graph.microsoft.com/v1.0/$metadata#users('mockuser')/messages",
+        "@odata.context": GRAPH_CONTEXT,
         "value": [generate_email(case_id=random.randint(1000, 2000)) for _ in range(n)]
-    }
\ No newline at end of file
+    }
+
+
+# Messages are sampled in fixed blocks, each from its own seeded RNG, so message i
+# is the same whatever n, batch size or output format is asked for
+BLOCK_SIZE = 10_000
+
+
+def _zipf_weights(n, exponent):
+    """P(rank k) proportional to 1 / k**exponent; exponent 0 is uniform"""
+    weights = np.arange(1, n + 1, dtype=np.float64) ** -exponent
+    return weights / weights.sum()
+
+
+class BulkGenerator:
+    """Seeded, vectorized generator for large Graph-shaped corpora
+
+    Names, addresses and first names are drawn from Faker once into fixed pools;
+    per-message choices (case, recipients, template, timestamps, ids) are sampled
+    in NumPy blocks from seeded RNGs, so the same arguments always give the same
+    messages and a smaller corpus is a prefix of a larger one. Case sizes follow
+    a Zipf law with `case_zipf` (0 = uniform), and so does how often each person
+    appears (`people_zipf`).
+    """
+
+    def __init__(self, seed=0, n_cases=1000, case_zipf=1.1, n_people=2000, people_zipf=0.8,
+                 first_case_id=1000, days=30, start="2025-10-01T00:00:00"):
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+        pool_fake = Faker()
+        pool_fake.seed_instance(seed)
+        self.names = [pool_fake.name() for _ in range(n_people)]
+        self.addresses = [n.lower().replace(" ", ".") + "@armylegal.mil" for n in self.names]
+        self.first_names = [pool_fake.first_name() for _ in range(500)]
+        # Shuffle which ids are popular so the biggest cases are not always the lowest ids
+        self.case_ids = first_case_id + rng.permutation(n_cases)
+        self.case_p = _zipf_weights(n_cases, case_zipf)
+        self.people = rng.permutation(n_people)
+        self.people_p = _zipf_weights(n_people, people_zipf)
+        self.start = np.datetime64(start, "us")
+        self.span_us = days * 86400 * 10**6
+
+    def _people(self, rng, n):
+        return self.people[rng.choice(len(self.people), n, p=self.people_p)]
+
+    def _uuids(self, rng, n):
+        raw = np.frombuffer(rng.bytes(16 * n), dtype=np.uint8).reshape(n, 16).copy()
+        raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40  # version 4
+        raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80  # RFC 4122 variant
+        h = raw.tobytes().hex()
+        return [f"{h[i:i+8]}-{h[i+8:i+12]}-{h[i+12:i+16]}-{h[i+16:i+20]}-{h[i+20:i+32]}"
+                for i in range(0, 32 * n, 32)]
+
+    def block(self, index):
+        """Sample block `index` as columns: numpy arrays of indexes plus the formatted strings"""
+        rng = np.random.default_rng([self.seed, index])
+        n = BLOCK_SIZE
+        cases = self.case_ids[rng.choice(len(self.case_ids), n, p=self.case_p)]
+        counts = {"to": rng.integers(1, 4, n), "cc": rng.integers(0, 3, n), "bcc": rng.integers(0, 2, n)}
+        sent = self.start - rng.integers(0, self.span_us, n).astype("timedelta64[us]")
+        received = sent + rng.integers(10, 301, n).astype("timedelta64[s]")
+        topics = rng.integers(0, len(LEGAL_TOPICS), n)
+        templates = rng.integers(0, len(BODY_TEMPLATES), n)
+        teams = rng.integers(0, len(TEAMS), n)
+        mentions = rng.integers(0, len(self.first_names), (n, 2))
+        body_dates = np.datetime_as_string(self.start - rng.integers(0, 28, n).astype("timedelta64[D]"), unit="D")
+
+        bodies = [
+            BODY_TEMPLATES[t].format(case_id=c, team=TEAMS[tm], date=d,
+                                     cc_person=self.first_names[m[0]], mentioned_person=self.first_names[m[1]])
+            for c, t, tm, d, m in zip(cases.tolist(), templates.tolist(), teams.tolist(), body_dates, mentions)
+        ]
+        return {
+            "id": self._uuids(rng, n),
+            "conversationId": self._uuids(rng, n),
+            "internetMessageId": [f"<{u}@armylegal.mil>" for u in self._uuids(rng, n)],
+            "subject": [f"Case {c} - {LEGAL_TOPICS[t]}" for c, t in zip(cases.tolist(), topics.tolist())],
+            "bodyPreview": [(b[:100] + "...") if len(b) > 100 else b for b in bodies],
+            "content": [f"<html><body>{b}</body></html>" for b in bodies],
+            "from": self._people(rng, n),
+            # Recipient lists are flat person indexes plus offsets, one list per message
+            **{field: self._people(rng, int(c.sum())) for field, c in counts.items()},
+            **{f"{field}_offsets": np.concatenate([[0], np.cumsum(c)]) for field, c in counts.items()},
+            "sentDateTime": sent,
+            "receivedDateTime": received,
+            "hasAttachments": rng.random(n) < 1 / 3,
+        }
+
+    def _recipient(self, i):
+        return {"emailAddress": {"name": self.names[i], "address": self.addresses[i]}}
+
+    def _blocks(self, n):
+        """Column blocks covering the first n messages (the last one may run past n)"""
+        for index in range((n + BLOCK_SIZE - 1) // BLOCK_SIZE):
+            yield self.block(index)
+
+    def messages(self, n):
+        """Yield the first n Graph message dicts; recipient dicts are shared, copy before mutating"""
+        recipients = [self._recipient(i) for i in range(len(self.names))]
+        for first, cols in zip(range(0, n, BLOCK_SIZE), self._blocks(n)):
+            size = min(BLOCK_SIZE, n - first)
+            sent = np.char.add(np.datetime_as_string(cols["sentDateTime"], unit="us"), "Z")
+            received = np.char.add(np.datetime_as_string(cols["receivedDateTime"], unit="us"), "Z")
+            lists = {f: (cols[f].tolist(), cols[f"{f}_offsets"].tolist()) for f in ("to", "cc", "bcc")}
+            senders = cols["from"].tolist()
+            attachments = cols["hasAttachments"].tolist()
+            for i in range(size):
+                to, cc, bcc = ([recipients[p] for p in people[offsets[i]:offsets[i + 1]]]
+                               for people, offsets in lists.values())
+                yield {
+                    "id": cols["id"][i],
+                    "conversationId": cols["conversationId"][i],
+                    "internetMessageId": cols["internetMessageId"][i],
+                    "subject": cols["subject"][i],
+                    "bodyPreview": cols["bodyPreview"][i],
+                    "body": {"contentType": "html", "content": cols["content"][i]},
+                    "from": recipients[senders[i]],
+                    "toRecipients": to,
+                    "ccRecipients": cc,
+                    "bccRecipients": bcc,
+                    "sentDateTime": str(sent[i]),
+                    "receivedDateTime": str(received[i]),
+                    "hasAttachments": attachments[i],
+                }
+
+    def tables(self, n):
+        """Yield the first n messages as Arrow tables in the snapshot's email schema, one per block"""
+        import pyarrow as pa
+        from snapshot import EMAIL_SCHEMA
+
+        names, addresses = pa.array(self.names), pa.array(self.addresses)
+        for first, cols in zip(range(0, n, BLOCK_SIZE), self._blocks(n)):
+            table = self._block_table(cols, names, addresses, EMAIL_SCHEMA)
+            yield table.slice(0, min(BLOCK_SIZE, n - first))
+
+    def _block_table(self, cols, names, addresses, schema):
+        import pyarrow as pa
+
+        n = len(cols["id"])
+
+        def recipients(idx):
+            idx = pa.array(idx)
+            address = pa.StructArray.from_arrays([names.take(idx), addresses.take(idx)], ["name", "address"])
+            return pa.StructArray.from_arrays([address], ["emailAddress"])
+
+        def recipient_lists(field):
+            return pa.ListArray.from_arrays(pa.array(cols[f"{field}_offsets"], pa.int32()), recipients(cols[field]))
+
+        timestamp = pa.timestamp("us", tz="UTC")
+        columns = [
+            pa.array(cols["id"]),
+            pa.array(cols["conversationId"]),
+            pa.array(cols["internetMessageId"]),
+            pa.array(cols["subject"]),
+            pa.array(cols["bodyPreview"]),
+            pa.StructArray.from_arrays([pa.array(["html"] * n), pa.array(cols["content"])],
+                                       ["contentType", "content"]),
+            recipients(cols["from"]),
+            recipient_lists("to"),
+            recipient_lists("cc"),
+            recipient_lists("bcc"),
+            pa.array(cols["sentDateTime"]).cast(timestamp),
+            pa.array(cols["receivedDateTime"]).cast(timestamp),
+            pa.array(cols["hasAttachments"]),
+        ]
+        table = pa.Table.from_arrays(columns, schema=schema.remove_metadata())
+        return table.replace_schema_metadata({"odata_context": GRAPH_CONTEXT})
+
+    def write_shards(self, out_dir, n, fmt="parquet", shard_size=1_000_000):
+        """Stream n messages into out_dir/part-NNNNN.{jsonl,parquet}; returns the shard paths"""
+        if fmt not in ("jsonl", "parquet"):
+            raise ValueError(f"Unknown format {fmt!r}, expected 'jsonl' or 'parquet'")
+        os.makedirs(out_dir, exist_ok=True)
+        paths = []
+        writer = None
+        written = 0
+
+        def close():
+            if writer is not None:
+                writer.close()
+                print(f"Wrote {written - shard_size * (len(paths) - 1)} messages to {paths[-1]}")
+
+        def open_shard(schema=None):
+            path = os.path.join(out_dir, f"part-{len(paths):05d}.{fmt}")
+            paths.append(path)
+            if fmt == "parquet":
+                import pyarrow.parquet as pq
+                return pq.ParquetWriter(path, schema)
+            return open(path, "w")
+
+        if fmt == "parquet":
+            for table in self.tables(n):
+                while table.num_rows:
+                    if written % shard_size == 0:
+                        close()
+                        writer = open_shard(table.schema)
+                    take = min(table.num_rows, shard_size - written % shard_size)
+                    writer.write_table(table.slice(0, take))
+                    table = table.slice(take)
+                    written += take
+        else:
+            for message in self.messages(n):
+                if written % shard_size == 0:
+                    close()
+                    writer = open_shard()
+                writer.write(json.dumps(message) + "\n")
+                written += 1
+        close()
+        return paths
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Write a deterministic synthetic mailbox as shards")
+    parser.add_argument("out_dir")
+    parser.add_argument("--n", type=int, default=1_000_000)
+    parser.add_argument("--format", choices=["jsonl", "parquet"], default="parquet")
+    parser.add_argument("--shard-size", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cases", type=int, default=1000)
+    parser.add_argument("--case-zipf", type=float, default=1.1)
+    parser.add_argument("--people", type=int, default=2000)
+    parser.add_argument("--people-zipf", type=float, default=0.8)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    generator = BulkGenerator(args.seed, args.cases, args.case_zipf, args.people, args.people_zipf)
+    generator.write_shards(args.out_dir, args.n, args.format, args.shard_size)
+    elapsed = time.perf_counter() - start
+    print(f"{args.n} messages in {elapsed:.1f}s ({args.n / elapsed * 60:,.0f}/min)")
@@ -1,49 +1,75 @@
+import pickle
 import networkx as nx
+from atomic_file import atomic_write
 
-def build_graph(entity_df):
-    G = nx.Graph()
-    for _, row in entity_df.iterrows():
-        email_id = row["email_id"]
-        case_ids = row["case_ids"]
-        participants = row["participants"]
-        teams = row["teams"]
+def _clean(values):
+    return sorted({v.strip() for v in values if v and v.strip()})
+
+def add_email(G, email_id, case_ids, participants, teams):
+    """Merge one email's entities into G; replaying an email already in G is a no-op"""
+    seen = G.graph.setdefault("email_ids", set())
+    if email_id in seen:
+        return False
+    seen.add(email_id)
+
+    participants = _clean(participants)
+    teams = _clean(teams)
+    case_ids = _clean(case_ids)
+
+    for p in participants:
+        G.add_node(p, type="Person", color="lightblue", name=p)
+    for t in teams:
+        G.add_node(t, type="Team", color="orange", name=t)
+    for c in case_ids:
+        G.add_node(f"Case_{c}", type="Case", color="lightgreen", name=c)
+
+    for i, p1 in enumerate(participants):
+        for p2 in participants[i+1:]:
+            if G.has_edge(p1, p2):
+                G[p1][p2]["emails"].append(email_id)
+                G[p1][p2]["weight"] = len(G[p1][p2]["emails"])
+            else:
+                G.add_edge(p1, p2, relation="communicated_in", emails=[email_id], weight=1)
 
+    for c in case_ids:
+        case_node = f"Case_{c}"
         for p in participants:
-            if p and p.strip():  # Validate node name
-                G.add_node(p, type="Person", color="lightblue")
+            G.add_edge(p, case_node, relation="involved_in")
         for t in teams:
-            if t and t.strip():
-                G.add_node(t, type="Team", color="orange")
-        for c in case_ids:
-            if c and c.strip():
-                G.add_node(f"Case_{c}", type="Case", color="lightgreen")
-
-        for i, p1 in enumerate(participants):
-            if not p1 or not p1.strip():
-                continue
-            for p2 in participants[i+1:]:
-                if not p2 or not p2.strip():
-                    continue
-                if G.has_edge(p1, p2):
-                    G[p1][p2]['weight'] = G[p1][p2].get('weight', 1) + 1
-                else:
-                    G.add_edge(p1, p2, relation="communicated_in", email=email_id, weight=1)
-
-        for c in case_ids:
-            if not c or not c.strip():
-                continue
-            case_node = f"Case_{c}"
-            for p in participants:
-                if p and p.strip():
-                    G.add_edge(p, case_node, relation="involved_in")
-            for t in teams:
-                if t and t.strip():
-                    G.add_edge(t, case_node, relation="handles")
+            G.add_edge(t, case_node, relation="handles")
+    return True
+
+def update_graph(G, entity_df):
+    """Merge every email in entity_df into G; returns how many were new"""
+    if entity_df.empty:
+        return 0
+    added = 0
+    for email_id, case_ids, participants, teams in zip(
+        entity_df["email_id"], entity_df["case_ids"], entity_df["participants"], entity_df["teams"]
+    ):
+        added += add_email(G, email_id, case_ids, participants, teams)
+    return added
+
+def build_graph(entity_df):
+    G = nx.Graph()
+    update_graph(G, entity_df)
     return G
 
 def graph_to_json(G):
-    """Convert graph to JSON format for React"""
-    nodes = [{"id": n, "type": G.nodes[n].get("type")} for n in G.nodes()]
-    links = [{"source": s, "target": t, "weight": d.get("weight", 1)} 
+    """Convert graph to JSON format for React, in the same shape as neo.graph_to_json"""
+    nodes = [{"id": d.get("name", n), "type": d.get("type"), "color": d.get("color")}
+             for n, d in G.nodes(data=True)]
+    links = [{"source": G.nodes[s].get("name", s),
+              "target": G.nodes[t].get("name", t),
+              "relation": d.get("relation", "").upper(),
+              "weight": d.get("weight", 1)}
              for s, t, d in G.edges(data=True)]
-    return {"nodes": nodes, "links": links}
\ No newline at end of file
+    return {"nodes": nodes, "links": links}
+
+def save_graph(G, path):
+    with atomic_write(path, "wb") as f:
+        pickle.dump(G, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+def load_graph(path):
+    with open(path, "rb") as f:
+        return pickle.load(f)
@@ -0,0 +1,226 @@
+import json
+import os
+import random
+import threading
+import urllib.request
+from collections import OrderedDict
+from datetime import datetime, timezone
+from atomic_file import atomic_write
+from ingest_emails import GRAPH_CONTEXT, generate_email
+
+# Ids of this many recent messages are kept for dedup; older ones are covered by their received time
+SEEN_WINDOW = int(os.getenv("MAILBOX_SEEN_WINDOW", "10000"))
+
+
+class GeneratorSource:
+    """Replays the Faker generator as a mailbox that receives `batch_size` new messages per sync"""
+
+    def __init__(self, batch_size=20, page_size=100):
+        self.batch_size = batch_size
+        self.page_size = page_size
+
+    def pages(self, cursor=None):
+        """Yield (messages, cursor) pages; messages arrive now, whatever their sent time"""
+        received = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+        for start in range(0, self.batch_size, self.page_size):
+            page = []
+            for _ in range(min(self.page_size, self.batch_size - start)):
+                message = generate_email(case_id=random.randint(1000, 2000))
+                message["receivedDateTime"] = received
+                page.append(message)
+            yield page, received
+
+
+class GraphDeltaSource:
+    """Follows Microsoft Graph style delta links: @odata.nextLink pages, then @odata.deltaLink"""
+
+    def __init__(self, url, token=None, timeout=30):
+        self.url = url
+        self.token = token
+        self.timeout = timeout
+
+    def _get(self, url):
+        request = urllib.request.Request(url, headers={"Accept": "application/json"})
+        if self.token:
+            request.add_header("Authorization", f"Bearer {self.token}")
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.load(response)
+
+    def pages(self, cursor=None):
+        """Yield (messages, cursor) per page, fetching the next page only when asked for it
+
+        `cursor` is the delta link from the previous sync; the last page carries the new one.
+        """
+        url = cursor or self.url
+        while url:
+            page = self._get(url)
+            url = page.get("@odata.nextLink")
+            cursor = page.get("@odata.deltaLink", cursor)
+            yield page.get("value", []), cursor
+
+
+class MailboxIngestor:
+    """Delta cursor, high-water mark and seen-id state for incremental ingestion
+
+    Only the ids of the last `window` messages are kept. Messages that fall
+    out of the window raise `evicted_until` to their received time, and
+    anything received at or before it counts as seen, so the state stays
+    bounded however large the mailbox grows.
+    """
+
+    def __init__(self, path="data/ingest_state.json", window=SEEN_WINDOW):
+        self.path = path
+        self.window = window
+        self._lock = threading.Lock()
+        self.cursor = None
+        self.high_water_mark = None
+        self.seen_ids = OrderedDict()          # message id -> received time, oldest first
+        self.seen_message_ids = OrderedDict()  # internetMessageId -> received time
+        self.evicted_until = None
+        # Number of the snapshot commit the seen state above covers
+        self.snapshot_commit = None
+        self.duplicates = 0
+        self._pending = None
+        self.load()
+
+    def seed(self, messages):
+        """Mark messages already in the store as seen, e.g. when migrating an existing snapshot"""
+        with self._lock:
+            for message in messages:
+                self._remember(message["id"], message.get("internetMessageId"), message.get("receivedDateTime"))
+
+    def _add_recent(self, recent, key, received):
+        recent[key] = received
+        recent.move_to_end(key)
+        while len(recent) > self.window:
+            _, evicted = recent.popitem(last=False)
+            if evicted and (self.evicted_until is None or evicted > self.evicted_until):
+                self.evicted_until = evicted
+
+    def _remember(self, email_id, message_id, received):
+        self._add_recent(self.seen_ids, email_id, received)
+        if message_id:
+            self._add_recent(self.seen_message_ids, message_id, received)
+        if received and (self.high_water_mark is None or received > self.high_water_mark):
+            self.high_water_mark = received
+
+    def _is_new(self, message):
+        received = message.get("receivedDateTime")
+        if received and self.evicted_until and received <= self.evicted_until:
+            return False
+        return message["id"] not in self.seen_ids and \
+            message.get("internetMessageId") not in self.seen_message_ids
+
+    def iter_new(self, source):
+        """Yield messages from `source` that were not ingested before, page by page
+
+        Nothing is marked as seen until commit(), so a run that fails part way
+        through fetches the same delta again next time.
+        """
+        # id -> (internetMessageId, received) in ingest order
+        pending = self._pending = {"ids": {}, "message_ids": set(), "high_water_mark": None, "cursor": self.cursor}
+        for page, cursor in source.pages(self.cursor):
+            for message in page:
+                message_id = message.get("internetMessageId")
+                if not self._is_new(message) or message["id"] in pending["ids"] \
+                        or (message_id and message_id in pending["message_ids"]):
+                    self.duplicates += 1
+                    continue
+                received = message.get("receivedDateTime")
+                pending["ids"][message["id"]] = (message_id, received)
+                if message_id:
+                    pending["message_ids"].add(message_id)
+                if received and (pending["high_water_mark"] is None or received > pending["high_water_mark"]):
+                    pending["high_water_mark"] = received
+                yield message
+            pending["cursor"] = cursor
+
+    def ingest(self, source):
+        """Return the whole delta as a Graph messages response"""
+        return {"@odata.context": GRAPH_CONTEXT, "value": list(self.iter_new(source))}
+
+    def pending_state(self):
+        """Cursor and high-water mark as they will be after commit(), for the snapshot manifest"""
+        with self._lock:
+            pending = self._pending or {"cursor": self.cursor, "high_water_mark": None}
+            high_water_mark = max(filter(None, [self.high_water_mark, pending["high_water_mark"]]), default=None)
+            return {"cursor": pending["cursor"], "high_water_mark": high_water_mark}
+
+    def recover(self, state, messages, snapshot_commit):
+        """Catch up with a snapshot commit whose ingest state never got saved here
+
+        `state` is the ingest state recorded in the snapshot manifest and
+        `messages` the stored messages, which are all marked as seen.
+        """
+        with self._lock:
+            self._pending = None
+            for message in messages:
+                self._remember(message["id"], message.get("internetMessageId"), message.get("receivedDateTime"))
+            if state:
+                self.cursor = state["cursor"]
+                if state["high_water_mark"] and (self.high_water_mark is None
+                                                 or state["high_water_mark"] > self.high_water_mark):
+                    self.high_water_mark = state["high_water_mark"]
+            self.snapshot_commit = snapshot_commit
+        self.save()
+
+    def commit(self, snapshot_commit=None):
+        """Record the last ingested delta as done and persist the state
+
+        `snapshot_commit` is the snapshot commit that stored the delta, if any.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, None
+            if pending is None:
+                return
+            if snapshot_commit is not None:
+                self.snapshot_commit = snapshot_commit
+            for email_id, (message_id, received) in pending["ids"].items():
+                self._remember(email_id, message_id, received)
+            self.cursor = pending["cursor"]
+        self.save()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r") as f:
+            state = json.load(f)
+        self.cursor = state.get("cursor")
+        self.high_water_mark = state.get("high_water_mark")
+        self.evicted_until = state.get("evicted_until")
+        # Replayed through the window, in case it shrank since the save
+        for field, recent in (("seen_ids", self.seen_ids), ("seen_message_ids", self.seen_message_ids)):
+            for item in state.get(field, []):
+                # State files from before the window hold plain id lists without received times
+                key, received = item if isinstance(item, list) else (item, None)
+                self._add_recent(recent, key, received)
+        self.snapshot_commit = state.get("snapshot_commit")
+
+    def save(self):
+        with self._lock:
+            state = {
+                "cursor": self.cursor,
+                "high_water_mark": self.high_water_mark,
+                "evicted_until": self.evicted_until,
+                "seen_ids": list(self.seen_ids.items()),
+                "seen_message_ids": list(self.seen_message_ids.items()),
+                "snapshot_commit": self.snapshot_commit,
+            }
+        with atomic_write(self.path) as f:
+            json.dump(state, f)
+
+    def stats(self):
+        return {
+            "cursor": self.cursor,
+            "high_water_mark": self.high_water_mark,
+            "recent_ids": len(self.seen_ids),
+            "evicted_until": self.evicted_until,
+            "duplicates_skipped": self.duplicates,
+        }
+
+
+def create_source():
+    """MAILBOX_SOURCE=generator (default) or graph, with MAILBOX_DELTA_URL / MAILBOX_TOKEN"""
+    if os.getenv("MAILBOX_SOURCE", "generator") == "graph":
+        return GraphDeltaSource(os.environ["MAILBOX_DELTA_URL"], os.getenv("MAILBOX_TOKEN"))
+    return GeneratorSource(int(os.getenv("MAILBOX_BATCH_SIZE", "20")))
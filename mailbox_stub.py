@@ -0,0 +1,54 @@
+"""Local stand-in for the Microsoft Graph messages delta endpoint, fed by the Faker generator
+
+    uvicorn mailbox_stub:app --port 8001
+    MAILBOX_SOURCE=graph MAILBOX_DELTA_URL=http://localhost:8001/v1.0/users/mockuser/messages/delta
+"""
+import os
+import random
+from datetime import datetime, timezone
+from fastapi import FastAPI, Query, Request
+from ingest_emails import generate_email
+from mailbox_ingest import GRAPH_CONTEXT
+
+PAGE_SIZE = int(os.getenv("STUB_PAGE_SIZE", "10"))
+PER_SYNC = int(os.getenv("STUB_MESSAGES_PER_SYNC", "20"))
+# Fraction of each sync that re-sends an already delivered message, to exercise dedupe
+REPLAY_RATE = float(os.getenv("STUB_REPLAY_RATE", "0.1"))
+
+app = FastAPI(title="Mailbox delta stub")
+messages = []
+
+
+def _deliver(n):
+    received = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+    for _ in range(n):
+        message = generate_email(case_id=random.randint(1000, 2000))
+        message["receivedDateTime"] = received
+        messages.append(message)
+
+
+@app.get("/v1.0/users/{user}/messages/delta")
+def messages_delta(
+    request: Request,
+    user: str,
+    deltatoken: int = Query(None, alias="$deltatoken"),
+    skiptoken: int = Query(None, alias="$skiptoken"),
+):
+    if skiptoken is None:
+        # A new sync round: new mail arrives, starting from the previous delta token
+        _deliver(PER_SYNC)
+        start = deltatoken or 0
+    else:
+        start = skiptoken
+
+    page = messages[start:start + PAGE_SIZE]
+    if start > 0 and random.random() < REPLAY_RATE:
+        page = [messages[start - 1]] + page
+
+    base = str(request.url.remove_query_params(["$deltatoken", "$skiptoken"]))
+    body = {"@odata.context": GRAPH_CONTEXT, "value": page}
+    if start + PAGE_SIZE < len(messages):
+        body["@odata.nextLink"] = f"{base}?$skiptoken={start + PAGE_SIZE}"
+    else:
+        body["@odata.deltaLink"] = f"{base}?$deltatoken={len(messages)}"
+    return body
@@ -1,29 +1,54 @@
-from datetime import datetime
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import HTMLResponse
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field, replace
+from datetime import datetime, timedelta, timezone
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import HTMLResponse, PlainTextResponse, StreamingResponse
 from apscheduler.schedulers.background import BackgroundScheduler
 import pandas as pd
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
 import sys
 import os
-from neo4j import GraphDatabase
+import base64
+import heapq
+import json
+import threading
 import dotenv
 
 # Add current directory to path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 load_status = dotenv.load_dotenv("Neo4j-9a89c3df-Created-2025-10-09.txt")
-if load_status is False:
-    raise RuntimeError('Environment variables not loaded.')
 
-NEO4J_URI = os.getenv("NEO4J_URI")
-NEO4J_USER = os.getenv("NEO4J_USERNAME")
-NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
+# "neo4j" (default) or "networkx" for an in-process graph with no database
+from graph_backend import GRAPH_BACKEND
 
-if not all([NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD]):
-    raise RuntimeError('Missing required Neo4j environment variables (NEO4J_URI, NEO4J_USERNAME, NEO4J_PASSWORD)')
+if GRAPH_BACKEND == "neo4j":
+    if load_status is False:
+        raise RuntimeError('Environment variables not loaded.')
 
-app = FastAPI(title="Legal NLP API")
+    NEO4J_URI = os.getenv("NEO4J_URI")
+    NEO4J_USER = os.getenv("NEO4J_USERNAME")
+    NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
+
+    if not all([NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD]):
+        raise RuntimeError('Missing required Neo4j environment variables (NEO4J_URI, NEO4J_USERNAME, NEO4J_PASSWORD)')
+
+@asynccontextmanager
+async def lifespan(app):
+    """Owns the async Neo4j pool for the read endpoints; the scheduler is started and stopped with it"""
+    startup()
+    if GRAPH_BACKEND == "neo4j":
+        store.reader = create_reader(NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD)
+    try:
+        yield
+    finally:
+        if store.reader:
+            await store.reader.close()
+            store.reader = None
+        shutdown()
+
+app = FastAPI(title="Legal NLP API", lifespan=lifespan)
 
 origins = [
     "http://localhost:3000",
@@ -42,172 +67,651 @@ app.add_middleware(
 try:
     # from test import (generate_email_batch, preprocess_emails, build_graph, 
     #               generate_case_summaries, graph_to_json)
-    from ingest_emails import generate_email_batch
-    from nlp_preprocessing import preprocess_emails
-    # from knowledge_graph import build_graph, graph_to_json
-    from neo import build_graph, graph_to_json
-    from summarization import generate_case_summaries
+    from mailbox_ingest import MailboxIngestor, create_source
+    import pipeline
+    from graph_backend import create_backend, NODE_TYPES, MAX_EGO_DEPTH
+    from graph_analytics import AnalyticsCache, compute_analytics, compute_structure, with_structure
+    from summarization import summarize_cases, summarizers
+    from nlp_preprocessing import get_nlp
+    from summary_cache import SummaryCache
+    from case_index import build_case_index
+    from metrics import PipelineMetrics
+    from neo_async import GraphBusy, create_reader, is_unavailable
+    from response_cache import ResponseCache
+    from search_index import SearchIndex
+    from entity_resolution import PersonResolver
+    import snapshot
 
 except ImportError:
     print("ERROR: Cannot find test.py. Make sure test.py is in the same directory as api.py")
     sys.exit(1)
 
 
+@dataclass(frozen=True)
+class Snapshot:
+    """Everything the read endpoints serve; replaced as a whole, never mutated"""
+    entities: pd.DataFrame = field(default_factory=pd.DataFrame)
+    summaries: pd.DataFrame = field(default_factory=pd.DataFrame)
+    graph_json: dict = field(default_factory=dict)
+    case_index: dict = field(default_factory=dict)
+    case_texts: dict = field(default_factory=dict)
+    analytics: dict = field(default_factory=dict)
+    last_update: datetime = None
+    # When the served content last changed; also moves when graph or analytics are swapped in
+    modified_at: datetime = None
+
+    @property
+    def last_modified(self):
+        return self.modified_at or self.last_update
+
+    @property
+    def version(self):
+        return self.last_modified.strftime("%Y%m%dT%H%M%S%fZ") if self.last_modified else None
+
+
+def _next_modified(current):
+    """A modification time at least a whole second after the current one
+
+    Last-Modified and If-Modified-Since only carry whole seconds, so two
+    snapshots inside one second would otherwise compare as unchanged.
+    """
+    now = datetime.now(timezone.utc)
+    previous = current.last_modified
+    if previous and now < previous.replace(microsecond=0) + timedelta(seconds=1):
+        return previous.replace(microsecond=0) + timedelta(seconds=1)
+    return now
+
+
+def _replace_snapshot(current, **changes):
+    store.snapshot = replace(current, modified_at=_next_modified(current), **changes)
+
+
 class Store:
-    emails = {}
-    entities = pd.DataFrame()
-    summaries = pd.DataFrame()
-    graph_json = {}
-    # graph = None
-    last_update = None
-    neo4j_driver = None
+    snapshot = Snapshot()
+    pipeline = {"state": "idle", "stage": None, "progress": 0.0, "messages": 0,
+                "started_at": None, "finished_at": None, "error": None}
+    graph = None
+    # Async Neo4j reader for live graph queries; None on the networkx backend
+    reader = None
+    # Committed entities whose graph upsert failed, retried by the next run
+    graph_pending = []
 
 store = Store()
+summary_cache = SummaryCache(
+    "data/summary_cache.json",
+    max_entries=int(os.getenv("SUMMARY_CACHE_MAX_ENTRIES", "5000"))
+)
+analytics_cache = AnalyticsCache()
+ingestor = MailboxIngestor("data/ingest_state.json")
+mailbox = create_source()
+pipeline_metrics = PipelineMetrics()
+response_cache = ResponseCache()
+search_index = SearchIndex("data/search_index.pickle")
+person_resolver = PersonResolver("data/person_map.json")
+
+# Serializes everything that builds a new snapshot or writes the graph
+pipeline_lock = threading.Lock()
+# "stream" covers ingest -> extract_entities -> entity resolution -> snapshot parts -> search index, chunk by chunk.
+# The graph is only written after the snapshot commits, so a failed run never leaves emails in it that the
+# snapshot lacks; the search index and person map are reloaded from their last saved state instead.
+PIPELINE_STAGES = ["stream", "analytics", "summarize", "persist", "graph"]
+
+def _enter_stage(run, stage):
+    """Report `stage` on /pipeline/status and time it into the run's metrics"""
+    store.pipeline.update(stage=stage, progress=PIPELINE_STAGES.index(stage) / len(PIPELINE_STAGES))
+    return run.stage(stage)
 
 def run_pipeline():
-    """Run NLP pipeline"""
+    """Run NLP pipeline off the request path and swap in the result as one snapshot"""
+    if not pipeline_lock.acquire(blocking=False):
+        print("Pipeline already running, skipping this run")
+        return
+    store.pipeline.update(state="running", stage=None, progress=0.0, error=None,
+                          started_at=datetime.now(timezone.utc), finished_at=None)
+    run = pipeline_metrics.start_run()
+    committed = False
     try:
-        emails = generate_email_batch(n=20)
-        entities = preprocess_emails(emails)
-        # graph = build_graph(entities)
-        
-        if store.neo4j_driver:
-            build_graph(entities, store.neo4j_driver)
-            store.graph_json = graph_to_json(store.neo4j_driver)
-
+        current = store.snapshot
         os.makedirs("data", exist_ok=True)
         os.makedirs("static", exist_ok=True)
-        entities.to_csv("data/entities.csv", index=False)
-        
-        cases = list(set(sum(entities["case_ids"].tolist(), [])))
-        summaries = generate_case_summaries(emails, cases)
-        summaries.to_csv("data/summaries.csv", index=False)
-        
-        import json
-        with open("data/emails.json", "w") as f:
-            json.dump(emails, f)
-        
-        store.emails = emails
-        store.entities = entities
-        store.summaries = summaries
-        # store.graph = graph
-        # store.graph_json = graph_to_json(graph)
-        # with open("static/graph.json", "w") as f:
-        #     json.dump(store.graph_json, f)
-        store.last_update = datetime.utcnow()
-        
+
+        with _enter_stage(run, "stream") as stage:
+            manifest = snapshot.read_manifest()
+            if manifest and ingestor.snapshot_commit != manifest.get("commit", 0):
+                # The last snapshot commit's ingest state was never saved (or this is a fresh state file):
+                # take it from the manifest and dedupe against the stored messages
+                print("Recovering ingest state from the snapshot")
+                ingestor.recover(manifest.get("ingest"), snapshot.iter_emails(), manifest.get("commit", 0))
+            writer = snapshot.SnapshotWriter()
+            case_texts = dict(current.case_texts)
+            timings = {}
+            new_entities, touched, count = pipeline.run_stream(
+                ingestor.iter_new(mailbox), writer, case_texts,
+                progress=lambda n: store.pipeline.update(messages=n),
+                timings=timings,
+                index=search_index,
+                resolver=person_resolver,
+            )
+            stage.update(items=count, substages=timings)
+        print(f"Ingested {count} new messages ({ingestor.stats()})")
+        if not count:
+            ingestor.commit()
+            store.pipeline.update(state="done", stage=None, progress=1.0, finished_at=datetime.now(timezone.utc))
+            pipeline_metrics.finish_run(run, "done")
+            return
+
+        entities = pd.concat([current.entities, new_entities], ignore_index=True)
+        with _enter_stage(run, "analytics") as stage:
+            analytics = compute_analytics(entities)
+            stage["items"] = len(analytics["nodes"])
+
+        with _enter_stage(run, "summarize") as stage:
+            touched = sorted(touched)
+            texts = {c: case_texts[c] for c in touched if case_texts.get(c)}
+            results = summarize_cases(texts, cache=summary_cache)
+            new_summaries = pd.DataFrame([{"case_id": c, "summary": results[c]} for c in touched if results.get(c)],
+                                         columns=["case_id", "summary"])
+            kept = current.summaries
+            if not kept.empty:
+                kept = kept[~kept["case_id"].isin(touched)]
+            summaries = pd.concat([kept, new_summaries], ignore_index=True)
+            summary_cache.save()
+            stage["items"] = len(texts)
+        print(f"Summary cache: {summary_cache.stats()}")
+
+        with _enter_stage(run, "persist") as stage:
+            last_update = datetime.now(timezone.utc)
+            snapshot_commit = writer.commit(summaries, case_texts, created_at=last_update,
+                                            ingest=ingestor.pending_state())
+            ingestor.commit(snapshot_commit)
+            search_index.save()
+            person_resolver.save()
+            committed = True
+            stage["items"] = count
+
+        graph_json, graph_error = current.graph_json, None
+        if store.graph:
+            try:
+                with _enter_stage(run, "graph") as stage:
+                    graph_json = _apply_graph(new_entities, rows=len(entities))
+                    stage["items"] = len(graph_json.get("nodes", [])) + len(graph_json.get("links", []))
+            except Exception as e:
+                # The snapshot is committed either way; the graph catches up on the next run
+                graph_error = e
+
+        store.snapshot = Snapshot(
+            entities=entities,
+            summaries=summaries,
+            graph_json=graph_json,
+            case_index=build_case_index(entities, summaries),
+            case_texts=case_texts,
+            analytics=analytics,
+            last_update=last_update,
+            modified_at=_next_modified(current),
+        )
+        schedule_structure()
+        if graph_error:
+            raise graph_error
+        store.pipeline.update(state="done", stage=None, progress=1.0, finished_at=datetime.now(timezone.utc))
+        pipeline_metrics.finish_run(run, "done")
     except Exception as e:
+        if not committed:
+            # Drop index documents and people that came from emails the snapshot never got
+            search_index.load()
+            person_resolver.load()
+        store.pipeline.update(state="failed", error=str(e), finished_at=datetime.now(timezone.utc))
+        pipeline_metrics.finish_run(run, "failed", str(e))
         raise
+    finally:
+        pipeline_lock.release()
+
+def _apply_graph(new_entities, rows):
+    """Upsert committed entities, plus any a failed graph stage left behind, and export the graph
+
+    `rows` is the snapshot's entity row count, which is then all in the graph.
+    """
+    store.graph_pending.append(new_entities)
+    store.graph.upsert(pd.concat(store.graph_pending, ignore_index=True))
+    store.graph_pending = []
+    store.graph.write_watermark(rows)
+    store.graph.save()
+    return store.graph.to_json()
 
 def load_existing_data():
+    """Serve the last on-disk snapshot; graph and analytics are filled in by warm_snapshot"""
     try:
         print('Trying to pass through existing data')
-        if not os.path.exists("data/entities.csv"):
+        if not snapshot.exists() and not snapshot.migrate_legacy():
             return False
-        
-        store.entities = pd.read_csv("data/entities.csv")
-        store.summaries = pd.read_csv("data/summaries.csv")
-        
-        import ast, json
-
-        store.entities['case_ids'] = store.entities['case_ids'].apply(ast.literal_eval)
-        store.entities['participants'] = store.entities['participants'].apply(ast.literal_eval)
-        store.entities['teams'] = store.entities['teams'].apply(ast.literal_eval)
-
-        # Ensure case_id in summaries is a string
-        store.summaries['case_id'] = store.summaries['case_id'].astype(str)
-        
-        # Load emails
-        with open("data/emails.json", "r") as f:
-            store.emails = json.load(f)
-        
-        # import networkx as nx
-        store.last_update = datetime.fromtimestamp(os.path.getmtime("data/entities.csv"))
-        # graph = build_graph(store.entities)
-
-        if store.neo4j_driver:
-            build_graph(store.entities, store.neo4j_driver)
-            store.graph_json = graph_to_json(store.neo4j_driver)
-        
-        # store.graph = graph
-        # store.graph_json = graph_to_json(graph)
-
 
+        entities, summaries, case_texts, last_update = snapshot.read_snapshot()
+        store.snapshot = Snapshot(
+            entities=entities,
+            summaries=summaries,
+            case_index=build_case_index(entities, summaries),
+            case_texts=case_texts,
+            last_update=last_update,
+        )
         return True
     except Exception as e:
         print(f"Could not load existing data: {e}")
         return False
 
+def warm_models():
+    """Load spaCy (and the summarizer with WARM_MODELS=all) in the background so the first pipeline run does not wait"""
+    get_nlp()
+    if WARM_MODELS == "all":
+        summarizers.get()
+
+def connect_and_warm(initial_job):
+    """Connect the graph backend off the startup path, then warm or build the snapshot"""
+    store.graph = create_backend(GRAPH_BACKEND)
+    initial_job()
+
+def resolve_snapshot():
+    """One-time entity resolution of a snapshot stored before there was a person map
+
+    Rewrites the entity parts with canonical participants and rebuilds
+    everything derived from them; returns the resolved entities.
+    """
+    print("Resolving participants of the stored snapshot")
+    # Learn every addressed person first, so a mention resolves against the whole mailbox
+    for message in snapshot.iter_emails():
+        person_resolver.observe(message)
+    snapshot.compact(transform=person_resolver.resolve_entities)
+    person_resolver.save()
+    entities, summaries, case_texts, last_update = snapshot.read_snapshot()
+    _replace_snapshot(store.snapshot, entities=entities, case_index=build_case_index(entities, summaries))
+    if store.graph:
+        print(f"Graph rebuild: {store.graph.rebuild(entities)}")
+        store.graph.write_watermark(len(entities))
+        store.graph.save()
+    search_index.clear()
+    print(f"People: {person_resolver.stats()}")
+    return entities
+
+def warm_snapshot():
+    """Upsert snapshot rows the graph backend is missing and attach graph JSON and analytics
+
+    Rows up to the graph watermark are already in the graph; the rest were
+    committed by runs whose graph stage failed or never ran.
+    """
+    with pipeline_lock:
+        current = store.snapshot
+        if not person_resolver.people and not current.entities.empty:
+            resolve_snapshot()
+            current = store.snapshot
+        graph_json = current.graph_json
+        if store.graph:
+            rows = len(current.entities)
+            # A watermark past the end belongs to another snapshot; upsert everything
+            watermark = store.graph.read_watermark()
+            watermark = watermark if watermark <= rows else 0
+            if watermark < rows:
+                counts = store.graph.upsert(current.entities.iloc[watermark:].reset_index(drop=True))
+                print(f"Graph upsert of snapshot rows {watermark}-{rows}: {counts}")
+                store.graph.write_watermark(rows)
+                store.graph.save()
+            graph_json = store.graph.to_json()
+        analytics = compute_analytics(current.entities)
+        _replace_snapshot(current, graph_json=graph_json, analytics=analytics)
+        schedule_structure()
+        if not len(search_index) and not current.entities.empty:
+            build_search_index(current.entities)
+
+def schedule_structure():
+    """Queue a betweenness/communities refresh for the served snapshot, replacing any queued one"""
+    scheduler.add_job(refresh_structure, id="graph-structure", replace_existing=True,
+                      next_run_time=datetime.now())
+
+def refresh_structure():
+    """Compute betweenness and communities off the pipeline's critical path and merge them in
+
+    On a mailbox that is one large component this takes seconds to minutes, so
+    the snapshot is served with degree and case overlap first. A result for
+    entities that were replaced meanwhile is dropped; the newer run queued its own.
+    """
+    entities = store.snapshot.entities
+    structure = compute_structure(entities, analytics_cache)
+    with pipeline_lock:
+        current = store.snapshot
+        if current.entities is not entities or not current.analytics:
+            return
+        _replace_snapshot(current, analytics=with_structure(current.analytics, structure))
+    print(f"Graph structure: {structure['components']} components, "
+          f"{structure['recomputed_components']} recomputed")
+
+def build_search_index(entities):
+    """Index every stored email; used once when no saved index exists yet"""
+    rows = entities.set_index("email_id")
+    for messages in pipeline.chunked(snapshot.iter_emails(), pipeline.CHUNK_SIZE):
+        messages = [m for m in messages if m["id"] in rows.index]
+        search_index.add(messages, rows.loc[[m["id"] for m in messages]])
+    search_index.save()
+    print(f"Built search index: {search_index.stats()}")
+
 @app.get("/")
 def home():
     return {
         "status": "running",
-        "last_update": store.last_update,
-        "cases": len(set(sum(store.entities["case_ids"].tolist(), []))) if not store.entities.empty else 0
+        "last_update": store.snapshot.last_update,
+        "cases": len(store.snapshot.case_index),
+        "summary_cache": summary_cache.stats()
     }
 
+def _cached(request, key, build):
+    """Serve build()'s result serialized once per snapshot, with ETag/Last-Modified and 304s
+
+    `key` is made from the endpoint's validated parameters only, so unknown or
+    reordered query parameters share one entry.
+    """
+    snapshot = store.snapshot
+    return response_cache.get(snapshot, key, lambda: build(snapshot)).respond(request)
+
 @app.get("/cases")
-def get_cases():
+def get_cases(request: Request):
     """List all cases"""
-    if store.entities.empty:
-        raise HTTPException(404, "No data. Run /pipeline first")
-    
-    cases = {}
-    for _, row in store.entities.iterrows():
-        for case_id in row["case_ids"]:
-            if case_id not in cases:
-                cases[case_id] = {
-                    "case_id": case_id,
-                    "participants": set(),
-                    "teams": set(),
-                    "emails": 0
-                }
-            cases[case_id]["participants"].update(row["participants"])
-            cases[case_id]["teams"].update(row["teams"])
-            cases[case_id]["emails"] += 1
-    
-    for _, row in store.summaries.iterrows():
-        cid = str(row["case_id"])
-        if cid in cases:
-            cases[cid]["summary"] = row["summary"]
-    
-    return [
-        {
-            "case_id": k,
-            "summary": v.get("summary", "No summary"),
-            "participants": list(v["participants"]),
-            "teams": list(v["teams"]),
-            "emails": v["emails"]
-        }
-        for k, v in cases.items()
-    ]
+    def build(snapshot):
+        case_index = snapshot.case_index
+        if not case_index:
+            raise HTTPException(404, "No data. Run /pipeline first")
+
+        return [
+            {
+                "case_id": v["case_id"],
+                "summary": v["summary"] or "No summary",
+                "participants": v["participants"],
+                "teams": v["teams"],
+                "emails": v["emails"]
+            }
+            for v in case_index.values()
+        ]
+    return _cached(request, ("cases",), build)
 
 @app.get("/cases/{case_id}")
-def get_case(case_id: str):
+def get_case(case_id: str, request: Request):
     """Get case details"""
-    if store.summaries.empty:
-        raise HTTPException(404, "No data")
-    
-    row = store.summaries[store.summaries["case_id"] == case_id]
-    if row.empty:
-        raise HTTPException(404, f"Case {case_id} not found")
-    
-    related = store.entities[store.entities["case_ids"].apply(lambda x: case_id in x)]
-    
+    def build(snapshot):
+        case_index = snapshot.case_index
+        if not case_index:
+            raise HTTPException(404, "No data")
+
+        entry = case_index.get(case_id)
+        if entry is None or entry["summary"] is None:
+            raise HTTPException(404, f"Case {case_id} not found")
+
+        return entry
+    return _cached(request, ("case", case_id), build)
+
+
+def _encode_cursor(kind, key):
+    return base64.urlsafe_b64encode(json.dumps([kind, key]).encode()).decode()
+
+def _decode_cursor(cursor):
+    try:
+        decoded = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise HTTPException(400, "Invalid cursor")
+    # Keys are (type, name) for nodes and (source type, source, target type, target, relation) for links
+    if (not isinstance(decoded, list) or len(decoded) != 2 or decoded[0] not in ("node", "link")
+            or not isinstance(decoded[1], list) or len(decoded[1]) != (2 if decoded[0] == "node" else 5)
+            or not all(isinstance(part, str) for part in decoded[1]) or decoded[1][0] not in NODE_TYPES):
+        raise HTTPException(400, "Invalid cursor")
+    return decoded[0], tuple(decoded[1])
+
+def _graph_unavailable(e):
+    """503 for a busy or unreachable graph; any other error is re-raised as the bug it is"""
+    if isinstance(e, GraphBusy):
+        return HTTPException(503, str(e), headers={"Retry-After": "1"})
+    if is_unavailable(e):
+        return HTTPException(503, f"Graph query failed: {e}")
+    return e
+
+# Items per worker-thread hop when paging the in-process graph; a hop costs more than producing a page
+GRAPH_THREAD_BATCH = 256
+
+async def _unbatch(batches):
+    try:
+        async for batch in batches:
+            for item in batch:
+                yield item
+    finally:
+        await batches.aclose()
+
+async def _iter_live_graph(**filters):
+    """(kind, key, item) from the async reader, or from the in-process graph on a worker thread"""
+    if store.reader:
+        source = store.reader.iter_graph(**filters)
+    else:
+        source = _unbatch(iterate_in_threadpool(pipeline.chunked(store.graph.iter_graph(**filters),
+                                                                 GRAPH_THREAD_BATCH)))
+    try:
+        async for item in source:
+            yield item
+    finally:
+        # Closing the reader's generator is what gives back its query slot and session
+        await source.aclose()
+
+
+class _ClosingStreamingResponse(StreamingResponse):
+    """Closes the body generator however the response ends, so a client disconnect frees its graph slot at once"""
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.body_iterator.aclose()
+
+def _snapshot_graph(snapshot):
+    if not snapshot.graph_json:
+        raise HTTPException(404, "No graph data")
+    return snapshot.graph_json
+
+@app.get("/graph/json")
+async def get_graph_json(
+    request: Request,
+    node_type: list[str] = Query(None),
+    center: str = None,
+    depth: int = Query(1, ge=0, le=MAX_EGO_DEPTH),
+    min_weight: int = Query(None, ge=0),
+    cursor: str = None,
+    limit: int = Query(None, ge=1, le=10000),
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+):
+    """Full graph from the snapshot, or a filtered/paginated/streamed view queried live
+
+    node_type: only Person/Team/Case nodes (repeatable); center + depth: ego
+    subgraph around a case id or person/team name; min_weight: drop lighter
+    links; cursor + limit: page through nodes then links; format=ndjson:
+    stream one item per line instead of buffering the response, ending with a
+    {"kind": "cursor", "next_cursor": ...} line when limit is set.
+    """
+    live = node_type or center or min_weight or cursor or limit or format == "ndjson"
+    if not live:
+        # Serializing the whole graph is the expensive part, so keep it off the event loop
+        return await run_in_threadpool(_cached, request, ("graph",), _snapshot_graph)
+
+    if not store.reader and not store.graph:
+        raise HTTPException(503, "Graph backend is not available")
+    if node_type and set(node_type) - set(NODE_TYPES):
+        raise HTTPException(400, f"node_type must be one of {NODE_TYPES}")
+
+    items = _iter_live_graph(
+        node_types=node_type,
+        center=center,
+        depth=depth,
+        min_weight=min_weight,
+        cursor=_decode_cursor(cursor) if cursor else None,
+        limit=limit,
+    )
+
+    if format == "ndjson":
+        # Pull the first item before answering so a busy or unreachable graph is a 503, not a cut stream
+        try:
+            first = await anext(items, None)
+        except Exception as e:
+            raise _graph_unavailable(e)
+
+        async def lines():
+            count, last = 0, None
+            try:
+                if first is not None:
+                    kind, key, item = first
+                    yield json.dumps({"kind": kind, **item}) + "\n"
+                    count, last = 1, (kind, key)
+                    async for kind, key, item in items:
+                        yield json.dumps({"kind": kind, **item}) + "\n"
+                        count, last = count + 1, (kind, key)
+            finally:
+                await items.aclose()
+            if limit:
+                # Same rule as the JSON response: a full page may have more after it
+                next_cursor = _encode_cursor(*last) if last and count == limit else None
+                yield json.dumps({"kind": "cursor", "next_cursor": next_cursor}) + "\n"
+        return _ClosingStreamingResponse(lines(), media_type="application/x-ndjson")
+
+    graph = {"nodes": [], "links": [], "next_cursor": None}
+    last = None
+    try:
+        async for kind, key, item in items:
+            graph["nodes" if kind == "node" else "links"].append(item)
+            last = (kind, key)
+    except Exception as e:
+        raise _graph_unavailable(e)
+    if limit and last and len(graph["nodes"]) + len(graph["links"]) == limit:
+        graph["next_cursor"] = _encode_cursor(*last)
+    return graph
+
+
+@app.post("/graph/rebuild")
+def post_graph_rebuild():
+    """Wipe the graph and rebuild it from the current entities"""
+    if not store.graph:
+        raise HTTPException(503, "Graph backend is not available")
+    if not pipeline_lock.acquire(blocking=False):
+        raise HTTPException(409, "Pipeline is running, try again later")
+    try:
+        current = store.snapshot
+        if current.entities.empty:
+            raise HTTPException(404, "No data")
+        counts = store.graph.rebuild(current.entities)
+        store.graph.write_watermark(len(current.entities))
+        store.graph.save()
+        _replace_snapshot(current, graph_json=store.graph.to_json())
+        return counts
+    finally:
+        pipeline_lock.release()
+
+
+@app.get("/search")
+def search(
+    q: str = None,
+    case_id: str = None,
+    participant: str = None,
+    team: str = None,
+    start: datetime = None,
+    end: datetime = None,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=200),
+):
+    """Full-text search over email subjects and bodies, BM25-ranked
+
+    case_id/participant/team: exact (case-insensitive) matches on the extracted
+    entities; start/end: sentDateTime range [start, end). Without q, matching
+    emails come newest first.
+    """
+    if not any([q, case_id, participant, team, start, end]):
+        raise HTTPException(400, "Give a query or at least one filter")
+    return search_index.search(q, case_id, participant, team, start, end, offset, limit)
+
+
+@app.get("/pipeline/status")
+def get_pipeline_status():
+    """Progress of the background pipeline and age of the snapshot being served"""
     return {
-        "case_id": case_id,
-        "summary": row.iloc[0]["summary"],
-        "participants": list(set(sum(related["participants"].tolist(), []))),
-        "teams": list(set(sum(related["teams"].tolist(), []))),
-        "emails": len(related)
+        **store.pipeline,
+        "stages": PIPELINE_STAGES,
+        "ready": store.snapshot.last_update is not None,
+        "last_update": store.snapshot.last_update,
+        "snapshot_version": store.snapshot.version,
+        "response_cache": response_cache.stats(),
+        "search_index": search_index.stats(),
+        "people": person_resolver.stats(),
+        "ingest": ingestor.stats(),
+        "graph_reader": store.reader.stats() if store.reader else None,
     }
 
 
-@app.get("/graph/json")
-def get_graph_json():
-    if not store.graph_json:
-        raise HTTPException(404, "No graph data")
-    return store.graph_json
+@app.get("/pipeline/runs")
+def get_pipeline_runs(limit: int = Query(10, ge=1, le=100)):
+    """Recent runs, newest first, with time, throughput, memory and Neo4j queries per stage"""
+    return list(pipeline_metrics.history)[:limit]
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Prometheus metrics for the pipeline, caches and snapshot"""
+    cache = summary_cache.stats()
+    last_update = store.snapshot.last_update
+    gauges = {
+        "summary_cache_hits": ("Summary cache hits since start", cache["hits"]),
+        "summary_cache_misses": ("Summary cache misses since start", cache["misses"]),
+        "summary_cache_entries": ("Summaries held in the cache", cache["entries"]),
+        "summarizer_load_seconds": ("Time spent loading summarization models",
+                                    sum(m["load_seconds"] for m in summarizers.stats().values())),
+        "ingest_duplicates_skipped": ("Mailbox messages skipped as already ingested", ingestor.duplicates),
+        "snapshot_cases": ("Cases in the served snapshot", len(store.snapshot.case_index)),
+    }
+    if last_update:
+        gauges["snapshot_age_seconds"] = ("Age of the served snapshot",
+                                          (datetime.now(timezone.utc) - last_update).total_seconds())
+    return PlainTextResponse(pipeline_metrics.prometheus(gauges), media_type="text/plain; version=0.0.4")
+
+
+def _analytics(snapshot, structure=False):
+    analytics = snapshot.analytics
+    if not analytics:
+        raise HTTPException(404, "No analytics yet")
+    if structure and "communities" not in analytics:
+        raise HTTPException(503, "Betweenness and communities are still being computed",
+                            headers={"Retry-After": "30"})
+    return analytics
+
+@app.get("/analytics/centrality")
+def get_centrality(
+    request: Request,
+    metric: str = Query("betweenness", pattern="^(degree|betweenness)$"),
+    node_type: str = Query(None),
+    limit: int = Query(20, ge=1, le=1000),
+):
+    """Key people, teams and cases ranked by degree or betweenness centrality"""
+    def build(snapshot):
+        nodes = _analytics(snapshot, structure=metric == "betweenness")["nodes"]
+        if node_type:
+            nodes = [n for n in nodes if n["type"] == node_type]
+        return heapq.nlargest(limit, nodes, key=lambda n: n[metric])
+    return _cached(request, ("centrality", metric, node_type, limit), build)
+
+@app.get("/analytics/communities")
+def get_communities(request: Request, limit: int = Query(50, ge=1, le=1000)):
+    """Communities of people, teams and cases, largest first"""
+    return _cached(request, ("communities", limit), lambda snapshot: _analytics(snapshot, structure=True)["communities"][:limit])
+
+@app.get("/analytics/case-overlap")
+def get_case_overlap(request: Request, case_id: str = None, limit: int = Query(100, ge=1, le=10000)):
+    """Case pairs that share participants or teams, most shared staff first"""
+    def build(snapshot):
+        overlap = _analytics(snapshot)["case_overlap"]
+        if case_id:
+            overlap = [o for o in overlap if case_id in (o["case_a"], o["case_b"])]
+        return overlap[:limit]
+    return _cached(request, ("case-overlap", case_id, limit), build)
+
+
+@app.get("/models")
+def get_models():
+    """Loaded summarization models with load time and memory footprint"""
+    return summarizers.stats()
 
 # @app.post("/pipeline")
 # def trigger_pipeline():
@@ -217,36 +721,37 @@ def get_graph_json():
 scheduler = BackgroundScheduler()
 scheduler.add_job(run_pipeline, 'interval', hours=6)
 
-@app.on_event("startup")
+# Keep the summarizer warm between runs unless an idle limit is configured
+SUMMARIZER_IDLE_HOURS = os.getenv("SUMMARIZER_IDLE_HOURS")
+if SUMMARIZER_IDLE_HOURS:
+    scheduler.add_job(
+        lambda: summarizers.unload_idle(float(SUMMARIZER_IDLE_HOURS) * 3600),
+        'interval', minutes=15
+    )
+
+# spacy (default): warm only the small spaCy model at startup | all: also load the
+# summarizer, which costs a BART load on every start | 0: load both on first use
+WARM_MODELS = os.getenv("WARM_MODELS", "spacy").lower()
+
 def startup():
     try:
-        try:
-            store.neo4j_driver = GraphDatabase.driver(
-                NEO4J_URI, 
-                auth=(NEO4J_USER, NEO4J_PASSWORD)
-            )
-            print(f"Connected to Neo4j at {NEO4J_URI}")
-        except Exception as e:
-            print(f"Warning: Could not connect to Neo4j: {e}")
-            store.neo4j_driver = None
-
-        if load_existing_data():
-            pass
-        else:
-            run_pipeline()
-        
+        # Serve whatever is on disk right away; connecting the graph backend,
+        # loading models and warming or building the snapshot all happen in
+        # the background once the server is accepting connections
+        initial_job = warm_snapshot if load_existing_data() else run_pipeline
+        scheduler.add_job(connect_and_warm, args=[initial_job], next_run_time=datetime.now())
+        if WARM_MODELS not in ("0", "false", "no"):
+            scheduler.add_job(warm_models, next_run_time=datetime.now())
         scheduler.start()
     except Exception as e:
         print(f"Startup error: {e}")
 
         
-@app.on_event("shutdown")
 def shutdown():
     scheduler.shutdown()
 
-    if store.neo4j_driver:
-        store.neo4j_driver.close()
-        print("Closed Neo4j connection")
+    if store.graph:
+        store.graph.close()
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,221 @@
+import cProfile
+import os
+import resource
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# Set PROFILE_STAGES=1 to dump a cProfile .prof file per stage (snakeviz/pstats compatible)
+PROFILE_STAGES = os.getenv("PROFILE_STAGES", "").lower() in ("1", "true", "yes")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "data/profiles")
+HISTORY_SIZE = int(os.getenv("PIPELINE_HISTORY_SIZE", "50"))
+
+_lock = threading.Lock()
+_neo4j_round_trips = 0
+
+
+def count_round_trip(n=1):
+    global _neo4j_round_trips
+    with _lock:
+        _neo4j_round_trips += n
+
+
+def neo4j_round_trips():
+    return _neo4j_round_trips
+
+
+def rss_bytes():
+    """Current resident set size, or None where /proc is not available"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process so far"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is kilobytes on Linux but bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class _CountingTransaction:
+    def __init__(self, tx):
+        self._tx = tx
+
+    def run(self, *args, **kwargs):
+        count_round_trip()
+        return self._tx.run(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._tx, name)
+
+
+class _CountingSession:
+    def __init__(self, session):
+        self._session = session
+
+    def __enter__(self):
+        self._session.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._session.__exit__(*exc)
+
+    def run(self, *args, **kwargs):
+        count_round_trip()
+        return self._session.run(*args, **kwargs)
+
+    def execute_write(self, fn, *args, **kwargs):
+        return self._session.execute_write(lambda tx, *a, **k: fn(_CountingTransaction(tx), *a, **k), *args, **kwargs)
+
+    def execute_read(self, fn, *args, **kwargs):
+        return self._session.execute_read(lambda tx, *a, **k: fn(_CountingTransaction(tx), *a, **k), *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+
+class CountingDriver:
+    """Wraps a Neo4j driver so every query sent counts as one round trip"""
+
+    def __init__(self, driver):
+        self._driver = driver
+
+    def session(self, *args, **kwargs):
+        return _CountingSession(self._driver.session(*args, **kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self._driver, name)
+
+
+class RunMetrics:
+    """Timings, counts and resource use for one pipeline run"""
+
+    def __init__(self, run_id):
+        self.run_id = run_id
+        self.started_at = datetime.now(timezone.utc)
+        self.finished_at = None
+        self.state = "running"
+        self.error = None
+        self.stages = []
+        self.seconds = None
+        self._start = time.perf_counter()
+        self._round_trips = neo4j_round_trips()
+
+    @contextmanager
+    def stage(self, name):
+        """Time a stage; set record["items"] inside the block to get throughput"""
+        record = {"stage": name, "items": 0}
+        profiler = cProfile.Profile() if PROFILE_STAGES else None
+        round_trips = neo4j_round_trips()
+        rss_start = rss_bytes()
+        start = time.perf_counter()
+        if profiler:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler:
+                profiler.disable()
+                os.makedirs(PROFILE_DIR, exist_ok=True)
+                record["profile"] = os.path.join(PROFILE_DIR, f"run-{self.run_id}-{name}.prof")
+                profiler.dump_stats(record["profile"])
+            seconds = time.perf_counter() - start
+            rss_end = rss_bytes()
+            record.update(
+                seconds=seconds,
+                throughput=record["items"] / seconds if seconds > 0 else None,
+                rss_start_bytes=rss_start,
+                rss_end_bytes=rss_end,
+                # ru_maxrss only ever grows, so this is the process peak up to the end of the stage
+                process_peak_rss_bytes=peak_rss_bytes(),
+                neo4j_round_trips=neo4j_round_trips() - round_trips,
+            )
+            self.stages.append(record)
+
+    def finish(self, state, error=None):
+        self.state = state
+        self.error = error
+        self.finished_at = datetime.now(timezone.utc)
+        self.seconds = time.perf_counter() - self._start
+
+    def to_dict(self):
+        return {
+            "run_id": self.run_id,
+            "state": self.state,
+            "error": self.error,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "seconds": self.seconds,
+            "process_peak_rss_bytes": peak_rss_bytes(),
+            "neo4j_round_trips": neo4j_round_trips() - self._round_trips,
+            "stages": self.stages,
+        }
+
+
+class PipelineMetrics:
+    """Recent run history plus counters for the /metrics endpoint"""
+
+    def __init__(self, history_size=HISTORY_SIZE):
+        self.history = deque(maxlen=history_size)
+        self.runs_total = Counter()
+        self._next_id = 1
+
+    def start_run(self):
+        run = RunMetrics(self._next_id)
+        self._next_id += 1
+        return run
+
+    def finish_run(self, run, state, error=None):
+        run.finish(state, error)
+        self.runs_total[state] += 1
+        self.history.appendleft(run.to_dict())
+
+    def prometheus(self, gauges=None):
+        """Render Prometheus text exposition format; `gauges` adds {name: (help, value)}"""
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+                lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+        metric("pipeline_runs_total", "counter", "Pipeline runs by final state",
+               [({"state": s}, n) for s, n in sorted(self.runs_total.items())])
+        metric("neo4j_round_trips_total", "counter", "Queries sent to Neo4j", [({}, neo4j_round_trips())])
+        metric("process_peak_rss_bytes", "gauge", "Peak resident set size", [({}, peak_rss_bytes())])
+
+        last = self.history[0] if self.history else None
+        if last:
+            metric("pipeline_last_run_seconds", "gauge", "Wall time of the last run", [({}, last["seconds"])])
+            # Sub-stages (e.g. the chunked stream's extract/upsert/write steps) are flattened as stage.sub
+            stages = []
+            for s in last["stages"]:
+                stages.append(s)
+                for sub, t in s.get("substages", {}).items():
+                    seconds = t["seconds"]
+                    stages.append({"stage": f"{s['stage']}.{sub}", **t,
+                                   "throughput": t["items"] / seconds if seconds > 0 else None})
+            metric("pipeline_stage_seconds", "gauge", "Wall time per stage in the last run",
+                   [({"stage": s["stage"]}, s["seconds"]) for s in stages])
+            metric("pipeline_stage_items", "gauge", "Items processed per stage in the last run",
+                   [({"stage": s["stage"]}, s["items"]) for s in stages])
+            metric("pipeline_stage_throughput", "gauge", "Items per second per stage in the last run",
+                   [({"stage": s["stage"]}, s["throughput"] or 0) for s in stages])
+            metric("pipeline_stage_neo4j_round_trips", "gauge", "Neo4j queries per stage in the last run",
+                   [({"stage": s["stage"]}, s["neo4j_round_trips"]) for s in stages])
+            metric("pipeline_stage_rss_delta_bytes", "gauge",
+                   "Change in resident set size over each stage of the last run",
+                   [({"stage": s["stage"]}, s["rss_end_bytes"] - s["rss_start_bytes"]) for s in last["stages"]
+                    if s.get("rss_start_bytes") is not None and s.get("rss_end_bytes") is not None])
+
+        for name, (help_text, value) in (gauges or {}).items():
+            metric(name, "gauge", help_text, [({}, value)])
+        return "\n".join(lines) + "\n"
@@ -1,100 +1,178 @@
-import dotenv
 import os
-from neo4j import GraphDatabase
 
-load_status = dotenv.load_dotenv("Neo4j-9a89c3df-Created-2025-10-09.txt")
-if load_status is False:
-    raise RuntimeError('Environment variables not loaded.')
+CHUNK_SIZE = int(os.getenv("NEO4J_CHUNK_SIZE", "1000"))
 
-URI = os.getenv("NEO4J_URI")
-AUTH = (os.getenv("NEO4J_USERNAME"), os.getenv("NEO4J_PASSWORD"))
+CONSTRAINTS = [
+    "CREATE CONSTRAINT person_name IF NOT EXISTS FOR (p:Person) REQUIRE p.name IS UNIQUE",
+    "CREATE CONSTRAINT team_name IF NOT EXISTS FOR (t:Team) REQUIRE t.name IS UNIQUE",
+    "CREATE CONSTRAINT case_id IF NOT EXISTS FOR (c:Case) REQUIRE c.id IS UNIQUE",
+    "CREATE CONSTRAINT email_id IF NOT EXISTS FOR (e:Email) REQUIRE e.id IS UNIQUE",
+]
 
-# Test connection
-with GraphDatabase.driver(URI, auth=AUTH) as driver:
-    driver.verify_connectivity()
-    print("Connection established.")
+PERSON_QUERY = """
+    UNWIND $rows AS name
+    MERGE (person:Person {name: name})
+    SET person.color = 'lightblue'
+"""
 
-def build_graph(entity_df, driver):
-    """Build knowledge graph directly in Neo4j"""
+TEAM_QUERY = """
+    UNWIND $rows AS name
+    MERGE (team:Team {name: name})
+    SET team.color = 'orange'
+"""
+
+CASE_QUERY = """
+    UNWIND $rows AS case_id
+    MERGE (case:Case {id: case_id})
+    SET case.color = 'lightgreen'
+"""
+
+COMMUNICATED_QUERY = """
+    UNWIND $rows AS row
+    MATCH (p1:Person {name: row.person1})
+    MATCH (p2:Person {name: row.person2})
+    MERGE (p1)-[r:COMMUNICATED_IN]->(p2)
+    ON CREATE SET r.emails = row.emails
+    ON MATCH SET r.emails = r.emails + [e IN row.emails WHERE NOT e IN r.emails]
+    SET r.weight = size(r.emails)
+"""
+
+INVOLVED_QUERY = """
+    UNWIND $rows AS row
+    MATCH (person:Person {name: row.person})
+    MATCH (case:Case {id: row.case_id})
+    MERGE (person)-[:INVOLVED_IN]->(case)
+"""
+
+HANDLES_QUERY = """
+    UNWIND $rows AS row
+    MATCH (team:Team {name: row.team})
+    MATCH (case:Case {id: row.case_id})
+    MERGE (team)-[:HANDLES]->(case)
+"""
+
+# Email nodes only record which emails are already in the graph
+EMAIL_QUERY = """
+    UNWIND $rows AS email_id
+    MERGE (:Email {id: email_id})
+"""
+
+KNOWN_EMAILS_QUERY = """
+    UNWIND $ids AS email_id
+    MATCH (e:Email {id: email_id})
+    RETURN e.id AS email_id
+"""
+
+DELETE_ALL_QUERY = """
+    MATCH (n)
+    CALL { WITH n DETACH DELETE n } IN TRANSACTIONS OF 10000 ROWS
+"""
+
+def _clean(values):
+    return sorted({v.strip() for v in values if v and v.strip()})
+
+def collect_graph_rows(entity_df):
+    """Flatten the entities DataFrame into de-duplicated UNWIND parameter lists"""
+    persons, teams, cases = set(), set(), set()
+    pair_emails = {}
+    involved, handles = set(), set()
+
+    for email_id, case_ids, participants, team_names in zip(
+        entity_df["email_id"], entity_df["case_ids"], entity_df["participants"], entity_df["teams"]
+    ):
+        case_ids = _clean(case_ids)
+        participants = _clean(participants)
+        team_names = _clean(team_names)
+
+        persons.update(participants)
+        teams.update(team_names)
+        cases.update(case_ids)
+
+        # Pairs are stored in sorted order so A->B and B->A collapse into one edge
+        for i, p1 in enumerate(participants):
+            for p2 in participants[i+1:]:
+                pair_emails.setdefault((p1, p2), []).append(email_id)
+
+        for c in case_ids:
+            involved.update((p, c) for p in participants)
+            handles.update((t, c) for t in team_names)
+
+    return {
+        "persons": sorted(persons),
+        "teams": sorted(teams),
+        "cases": sorted(cases),
+        "communicated": [{"person1": p1, "person2": p2, "emails": e} for (p1, p2), e in pair_emails.items()],
+        "involved": [{"person": p, "case_id": c} for p, c in sorted(involved)],
+        "handles": [{"team": t, "case_id": c} for t, c in sorted(handles)],
+    }
+
+def ensure_constraints(driver):
+    """Uniqueness constraints double as the indexes MERGE/MATCH look nodes up by"""
     with driver.session() as session:
-        session.run("MATCH (n) DETACH DELETE n")
-        
-        for _, row in entity_df.iterrows():
-            email_id = row["email_id"]
-            case_ids = row["case_ids"]
-            participants = row["participants"]
-            teams = row["teams"]
-            
-            # Create Person nodes
-            for p in participants:
-                if p and p.strip():
-                    session.run("""
-                        MERGE (person:Person {name: $name})
-                        SET person.color = 'lightblue'
-                    """, name=p.strip())
-            
-            # Create Team nodes
-            for t in teams:
-                if t and t.strip():
-                    session.run("""
-                        MERGE (team:Team {name: $name})
-                        SET team.color = 'orange'
-                    """, name=t.strip())
-            
-            # Create Case nodes
-            for c in case_ids:
-                if c and c.strip():
-                    session.run("""
-                        MERGE (case:Case {id: $case_id})
-                        SET case.color = 'lightgreen'
-                    """, case_id=c.strip())
-            
-            # Create Person-Person relationships
-            for i, p1 in enumerate(participants):
-                if not p1 or not p1.strip():
-                    continue
-                for p2 in participants[i+1:]:
-                    if not p2 or not p2.strip():
-                        continue
-                    session.run("""
-                        MATCH (p1:Person {name: $person1})
-                        MATCH (p2:Person {name: $person2})
-                        MERGE (p1)-[r:COMMUNICATED_IN]->(p2)
-                        ON CREATE SET r.weight = 1, r.emails = [$email_id]
-                        ON MATCH SET r.weight = r.weight + 1, 
-                                    r.emails = r.emails + $email_id
-                    """, person1=p1.strip(), person2=p2.strip(), email_id=email_id)
-            
-            # Create Person-Case relationships
-            for c in case_ids:
-                if not c or not c.strip():
-                    continue
-                for p in participants:
-                    if p and p.strip():
-                        session.run("""
-                            MATCH (person:Person {name: $person})
-                            MATCH (case:Case {id: $case_id})
-                            MERGE (person)-[:INVOLVED_IN]->(case)
-                        """, person=p.strip(), case_id=c.strip())
-            
-            # Create Team-Case relationships
-            for c in case_ids:
-                if not c or not c.strip():
-                    continue
-                for t in teams:
-                    if t and t.strip():
-                        session.run("""
-                            MATCH (team:Team {name: $team})
-                            MATCH (case:Case {id: $case_id})
-                            MERGE (team)-[:HANDLES]->(case)
-                        """, team=t.strip(), case_id=c.strip())
+        for statement in CONSTRAINTS:
+            session.run(statement).consume()
+
+def _run_unwind(tx, query, rows):
+    tx.run(query, rows=rows).consume()
+
+def write_rows(session, query, rows, chunk_size=CHUNK_SIZE):
+    """Write rows with one UNWIND query per chunk, each in its own transaction"""
+    for start in range(0, len(rows), chunk_size):
+        session.execute_write(_run_unwind, query, rows[start:start + chunk_size])
+
+def known_email_ids(session, email_ids, chunk_size=CHUNK_SIZE):
+    known = set()
+    for start in range(0, len(email_ids), chunk_size):
+        result = session.run(KNOWN_EMAILS_QUERY, ids=email_ids[start:start + chunk_size])
+        known.update(record["email_id"] for record in result)
+    return known
+
+def build_graph(entity_df, driver, chunk_size=CHUNK_SIZE, incremental=True):
+    """Build knowledge graph directly in Neo4j
+
+    In incremental mode only emails not yet recorded in the graph are merged,
+    so the write volume follows new mail. Set incremental=False to wipe and rebuild.
+    """
+    ensure_constraints(driver)
+
+    with driver.session() as session:
+        if incremental:
+            email_ids = entity_df["email_id"].tolist() if not entity_df.empty else []
+            known = known_email_ids(session, email_ids, chunk_size)
+            if known:
+                entity_df = entity_df[~entity_df["email_id"].isin(known)]
+        else:
+            known = set()
+            session.run(DELETE_ALL_QUERY).consume()
+
+        if entity_df.empty:
+            return {"emails_written": 0, "emails_skipped": len(known)}
+        rows = collect_graph_rows(entity_df)
+
+        # Nodes must exist before the relationship queries MATCH on them
+        write_rows(session, PERSON_QUERY, rows["persons"], chunk_size)
+        write_rows(session, TEAM_QUERY, rows["teams"], chunk_size)
+        write_rows(session, CASE_QUERY, rows["cases"], chunk_size)
+        write_rows(session, COMMUNICATED_QUERY, rows["communicated"], chunk_size)
+        write_rows(session, INVOLVED_QUERY, rows["involved"], chunk_size)
+        write_rows(session, HANDLES_QUERY, rows["handles"], chunk_size)
+        # Recorded last, so an interrupted run is retried rather than skipped
+        write_rows(session, EMAIL_QUERY, entity_df["email_id"].tolist(), chunk_size)
+
+    counts = {k: len(v) for k, v in rows.items()}
+    counts.update(emails_written=len(entity_df), emails_skipped=len(known))
+    return counts
+
+def rebuild_graph(entity_df, driver, chunk_size=CHUNK_SIZE):
+    """Drop everything in the graph and rebuild it from entity_df"""
+    return build_graph(entity_df, driver, chunk_size, incremental=False)
 
 def graph_to_json(driver):
     """Export graph from Neo4j to JSON format"""
     with driver.session() as session:
         # Get all nodes
         nodes_result = session.run("""
-            MATCH (n)
+            MATCH (n) WHERE NOT n:Email
             RETURN labels(n)[0] as type, 
                    COALESCE(n.name, n.id) as name,
                    n.color as color
@@ -120,3 +198,121 @@ def graph_to_json(driver):
         
         return {"nodes": nodes, "links": links}
 
+
+NODE_TYPES = ["Person", "Team", "Case"]
+MAX_EGO_DEPTH = 4
+
+# Property each exported label is keyed on; its uniqueness constraint makes it an index to seek and order by
+LABEL_KEYS = {"Case": "id", "Person": "name", "Team": "name"}
+
+def _ego_clause(depth):
+    # Variable-length bounds cannot be parameters, so depth is validated and inlined
+    depth = max(0, min(int(depth), MAX_EGO_DEPTH))
+    return f"""
+        MATCH (c) WHERE (c:Case AND c.id = $center) OR ((c:Person OR c:Team) AND c.name = $center)
+        MATCH (c)-[*0..{depth}]-(n)"""
+
+def _nodes_query(label, center, depth, resume):
+    prop = LABEL_KEYS[label]
+    # A predicate on the key lets the planner read the label's index in order; a first page has no null to compare
+    after = f" AND n.{prop} > $after" if resume else ""
+    if center is None:
+        match = f"""
+        MATCH (n:{label}) WHERE n.{prop} IS NOT NULL{after}"""
+    else:
+        match = _ego_clause(depth) + f"""
+        WITH DISTINCT n WHERE n:{label}{after}"""
+    return match + f"""
+        RETURN n.{prop} AS name, n.color AS color
+        ORDER BY n.{prop}
+        LIMIT $limit
+    """
+
+def _links_query(label, node_types, center, depth, resume):
+    prop = LABEL_KEYS[label]
+    seek = f" AND s.{prop} >= $after_source" if resume else ""
+    after = f"""
+        WHERE s.{prop} > $after_source
+           OR (s.{prop} = $after_source AND (target_type > $after_target_type
+               OR (target_type = $after_target_type AND (target > $after_target
+                   OR (target = $after_target AND relation > $after_relation)))))""" if resume else ""
+    if center is None:
+        # Walk sources in index order and expand each one, instead of scanning every relationship
+        target = "any(label IN labels(t) WHERE label IN $node_types)" if node_types else "NOT t:Email"
+        match = f"""
+        MATCH (s:{label}) WHERE s.{prop} IS NOT NULL{seek}
+        WITH s ORDER BY s.{prop}
+        MATCH (s)-[r]->(t) WHERE {target}"""
+    else:
+        # Expand from the ego network's own nodes; only their relationships are checked against it
+        match = _ego_clause(depth) + f"""
+        WHERE any(label IN labels(n) WHERE label IN $node_types)
+        WITH collect(DISTINCT n) AS scope
+        UNWIND scope AS s
+        WITH scope, s WHERE s:{label}{seek}
+        WITH scope, s ORDER BY s.{prop}
+        MATCH (s)-[r]->(t) WHERE t IN scope"""
+    return match + f"""
+          AND COALESCE(r.weight, 1) >= $min_weight
+        WITH s, r, labels(t)[0] AS target_type, COALESCE(t.name, t.id) AS target, type(r) AS relation{after}
+        RETURN s.{prop} AS source, target_type, target, relation, COALESCE(r.weight, 1) AS weight
+        ORDER BY source, target_type, target, relation
+        LIMIT $limit
+    """
+
+def graph_segments(node_types=None, center=None, depth=1, cursor=None):
+    """(kind, label, query, after params) for each page segment left after `cursor`
+
+    Nodes come label by label, then links by source label, each ordered on the
+    label's indexed key, so a page seeks straight to where the last one ended
+    instead of sorting the whole graph. Keys are tuples: (type, name) for nodes
+    and (source type, source, target type, target, RELATION) for links, built
+    from names so a cursor survives a restart and means the same on either
+    backend.
+    """
+    labels = sorted(t for t in LABEL_KEYS if not node_types or t in node_types)
+    phase, key = cursor or ("node", None)
+    for kind in ("node", "link"):
+        for label in labels:
+            after = None
+            if kind == phase and key is not None:
+                if key[0] > label:
+                    continue
+                if key[0] == label:
+                    after = key[1:]
+            elif kind == "node" and phase == "link":
+                continue
+            if kind == "node":
+                yield kind, label, _nodes_query(label, center, depth, after), {"after": after[0]} if after else {}
+            else:
+                names = ["after_source", "after_target_type", "after_target", "after_relation"]
+                yield kind, label, _links_query(label, node_types, center, depth, after), \
+                    dict(zip(names, after)) if after else {}
+
+def graph_item(kind, label, record):
+    """(kind, key, item) for one record of a graph_segments query"""
+    if kind == "node":
+        return "node", (label, record["name"]), {"id": record["name"], "type": label, "color": record["color"]}
+    key = (label, record["source"], record["target_type"], record["target"], record["relation"])
+    return "link", key, {"source": record["source"],
+                         "target": record["target"],
+                         "relation": record["relation"],
+                         "weight": record["weight"]}
+
+def iter_graph(driver, node_types=None, center=None, depth=1, min_weight=None, cursor=None, limit=None):
+    """Yield (kind, key, item) for nodes then links, straight off the Neo4j result cursors
+
+    `cursor` is the (kind, key) of the last item already seen, so a page can
+    resume mid-nodes or mid-links. `limit` caps the total items yielded.
+    """
+    params = {"center": center, "node_types": node_types or sorted(LABEL_KEYS), "min_weight": min_weight or 0}
+    # Neo4j needs an integer LIMIT, so "no limit" is the largest one it accepts
+    remaining = limit if limit is not None else 2**63 - 1
+
+    with driver.session() as session:
+        for kind, label, query, after in graph_segments(node_types, center, depth, cursor):
+            if remaining <= 0:
+                return
+            for record in session.run(query, params, limit=remaining, **after):
+                remaining -= 1
+                yield graph_item(kind, label, record)
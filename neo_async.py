@@ -0,0 +1,103 @@
+import asyncio
+import os
+import sys
+from contextlib import asynccontextmanager
+from neo import LABEL_KEYS, graph_item, graph_segments
+
+# Pool for the API's read queries; pipeline writes keep using the sync driver in neo.py
+MAX_POOL_SIZE = int(os.getenv("NEO4J_MAX_POOL_SIZE", "50"))
+ACQUISITION_TIMEOUT = float(os.getenv("NEO4J_ACQUISITION_TIMEOUT", "10"))
+CONNECTION_TIMEOUT = float(os.getenv("NEO4J_CONNECTION_TIMEOUT", "5"))
+MAX_CONNECTION_LIFETIME = float(os.getenv("NEO4J_MAX_CONNECTION_LIFETIME", "3600"))
+# Idle connections older than this are pinged before reuse instead of failing mid-request
+LIVENESS_CHECK_TIMEOUT = float(os.getenv("NEO4J_LIVENESS_CHECK_TIMEOUT", "60"))
+KEEP_ALIVE = os.getenv("NEO4J_KEEP_ALIVE", "1").lower() not in ("0", "false", "no")
+
+# Graph queries allowed in flight at once, and how long a request waits for a slot
+MAX_CONCURRENT_QUERIES = int(os.getenv("GRAPH_MAX_CONCURRENT_QUERIES", "20"))
+QUEUE_TIMEOUT = float(os.getenv("GRAPH_QUEUE_TIMEOUT", "5"))
+
+
+class GraphBusy(Exception):
+    """Every query slot stayed taken for the whole queue timeout"""
+
+
+def is_unavailable(e):
+    """True when `e` means the graph is busy or unreachable, as opposed to a bug"""
+    if isinstance(e, GraphBusy):
+        return True
+    # Only the driver raises these, and nothing imports neo4j until a driver is created
+    exceptions = sys.modules.get("neo4j.exceptions")
+    return exceptions is not None and isinstance(e, (exceptions.DriverError, exceptions.TransientError))
+
+
+class AsyncGraphReader:
+    """Read-side graph access on the Neo4j async driver, with a cap on concurrent queries
+
+    The cap sits below the pool size so a burst of requests queues here, where
+    it can time out cleanly, instead of starving the pool.
+    """
+
+    def __init__(self, driver, max_concurrent=MAX_CONCURRENT_QUERIES, queue_timeout=QUEUE_TIMEOUT):
+        self.driver = driver
+        self.max_concurrent = max_concurrent
+        self.queue_timeout = queue_timeout
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self.in_flight = 0
+        self.rejected = 0
+
+    @asynccontextmanager
+    async def slot(self):
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise GraphBusy(f"{self.max_concurrent} graph queries already running")
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+
+    async def iter_graph(self, node_types=None, center=None, depth=1, min_weight=None, cursor=None, limit=None):
+        """Async twin of neo.iter_graph: same queries, same (kind, key, item) items and cursors"""
+        params = {"center": center, "node_types": node_types or sorted(LABEL_KEYS), "min_weight": min_weight or 0}
+        remaining = limit if limit is not None else 2**63 - 1
+
+        async with self.slot():
+            async with self.driver.session() as session:
+                for kind, label, query, after in graph_segments(node_types, center, depth, cursor):
+                    if remaining <= 0:
+                        return
+                    result = await session.run(query, params, limit=remaining, **after)
+                    async for record in result:
+                        remaining -= 1
+                        yield graph_item(kind, label, record)
+
+    def stats(self):
+        return {
+            "max_concurrent": self.max_concurrent,
+            "in_flight": self.in_flight,
+            "rejected": self.rejected,
+            "max_pool_size": MAX_POOL_SIZE,
+        }
+
+    async def close(self):
+        await self.driver.close()
+
+
+def create_reader(uri, user, password):
+    """Build the pooled async driver; no I/O happens until the first query"""
+    from neo4j import AsyncGraphDatabase
+    driver = AsyncGraphDatabase.driver(
+        uri,
+        auth=(user, password),
+        max_connection_pool_size=MAX_POOL_SIZE,
+        connection_acquisition_timeout=ACQUISITION_TIMEOUT,
+        connection_timeout=CONNECTION_TIMEOUT,
+        max_connection_lifetime=MAX_CONNECTION_LIFETIME,
+        liveness_check_timeout=LIVENESS_CHECK_TIMEOUT,
+        keep_alive=KEEP_ALIVE,
+    )
+    return AsyncGraphReader(driver, min(MAX_CONCURRENT_QUERIES, MAX_POOL_SIZE))
@@ -1,17 +1,75 @@
+import os
 import re
-import spacy
+import threading
 import pandas as pd
 from ingest_emails import TEAMS
 
-nlp = spacy.load("en_core_web_sm")
+# extract_entities only reads doc.ents, so skip everything except NER
+DISABLED_COMPONENTS = ["parser", "tagger", "lemmatizer"]
+BATCH_SIZE = int(os.getenv("NLP_BATCH_SIZE", "256"))
+N_PROCESS = int(os.getenv("NLP_N_PROCESS", "1"))
+
+SPACY_MODEL = "en_core_web_sm"
+
+# ner: rules plus spaCy NER for every email (adds persons named in the body).
+# auto: NER only for emails the rules found no case id or no participants in.
+# rules: never load spaCy; participants come from the structured fields only.
+NLP_MODE = os.getenv("NLP_MODE", "ner")
+
+# Team vocabulary for the matcher, e.g. TEAM_VOCABULARY="Team A,Litigation,Records"
+TEAM_VOCABULARY = [t.strip() for t in os.getenv("TEAM_VOCABULARY", ",".join(TEAMS)).split(",") if t.strip()]
+
+HTML_TAG = re.compile(r"<[^>]+>")
+CASE_PATTERN = re.compile(r"Case\s+(\d+)")
+# Longest names first so "Team AB" is not reported as "Team A"; no vocabulary means no team matcher
+TEAM_PATTERN = re.compile(
+    r"\b(" + "|".join(re.escape(t) for t in sorted(TEAM_VOCABULARY, key=len, reverse=True)) + r")\b"
+) if TEAM_VOCABULARY else None
+MONTHS = (r"(?:January|February|March|April|May|June|July|August|September|October|November|December"
+          r"|Jan|Feb|Mar|Apr|Jun|Jul|Aug|Sept|Sep|Oct|Nov|Dec)\.?")
+DATE_PATTERN = re.compile(
+    r"\b\d{4}-\d{2}-\d{2}\b"                                   # 2025-10-03
+    r"|\b\d{1,2}/\d{1,2}/\d{2,4}\b"                             # 10/03/2025
+    rf"|\b{MONTHS} \d{{1,2}}(?:st|nd|rd|th)?(?:, \d{{4}})?\b"    # October 3, 2025
+    rf"|\b\d{{1,2}} {MONTHS}(?: \d{{4}})?\b"                     # 3 Oct 2025
+)
+
+def _ruler_patterns():
+    """Case ids and teams labelled before NER runs, so it cannot tag "Case 1279" as a DATE"""
+    patterns = [{"label": "CASE", "pattern": [{"LOWER": "case"}, {"IS_DIGIT": True}]}]
+    patterns += [{"label": "ORG", "pattern": t} for t in TEAM_VOCABULARY]
+    return patterns
+
+_nlp = None
+_nlp_lock = threading.Lock()
+
+def get_nlp():
+    """Load the spaCy model on first use (importing spaCy alone takes a while)"""
+    global _nlp
+    if _nlp is None:
+        with _nlp_lock:
+            if _nlp is None:
+                import spacy
+                print(f"Loading spaCy model {SPACY_MODEL}...")
+                nlp = spacy.load(SPACY_MODEL, disable=DISABLED_COMPONENTS)
+                if "ner" in nlp.pipe_names:
+                    nlp.add_pipe("entity_ruler", before="ner").add_patterns(_ruler_patterns())
+                _nlp = nlp
+    return _nlp
 
 def strip_html(html_content):
     """Remove HTML tags from content"""
-    return re.sub(r'<[^>]+>', '', html_content)
+    return HTML_TAG.sub('', html_content)
+
+def email_text(email):
+    return email["subject"] + " " + strip_html(email["body"]["content"])
+
+def _unique(values):
+    return list(dict.fromkeys(values))
 
-def extract_entities(email):
-    text = email["subject"] + " " + strip_html(email["body"]["content"])
-    doc = nlp(text)
+def entities_from_rules(email, text=None):
+    """Case ids, teams and dates from the compiled matchers; participants from the address fields"""
+    text = email_text(email) if text is None else text
 
     participants = []
     for field in ["from", "toRecipients", "ccRecipients", "bccRecipients"]:
@@ -21,18 +79,70 @@ def extract_entities(email):
         elif isinstance(val, list):
             participants.extend([r["emailAddress"]["name"] for r in val])
 
-    case_ids = re.findall(r"Case\s+(\d+)", text)
-    teams = [t for t in TEAMS if t in text]
-    persons = [ent.text for ent in doc.ents if ent.label_ == "PERSON"]
-    dates = [ent.text for ent in doc.ents if ent.label_ in ["DATE", "TIME"]]
-
     return {
         "email_id": email["id"],
-        "case_ids": case_ids,
-        "participants": list(set(participants + persons)),
-        "teams": list(set(teams)),
-        "dates": dates
+        "case_ids": _unique(CASE_PATTERN.findall(text)),
+        "participants": _unique(participants),
+        "teams": _unique(TEAM_PATTERN.findall(text)) if TEAM_PATTERN else [],
+        "dates": _unique(DATE_PATTERN.findall(text)),
     }
 
-def preprocess_emails(email_json):
-    return pd.DataFrame([extract_entities(e) for e in email_json["value"]])
\ No newline at end of file
+def entities_from_doc(email, doc):
+    """Rule-based entities plus the persons and dates spaCy's NER found"""
+    entities = entities_from_rules(email, doc.text)
+    persons = [ent.text for ent in doc.ents if ent.label_ == "PERSON"]
+    # Bare numbers are case ids or counts, not dates
+    dates = [ent.text for ent in doc.ents
+             if ent.label_ in ["DATE", "TIME"] and not ent.text.isdigit() and not CASE_PATTERN.search(ent.text)]
+    entities["participants"] = _unique(entities["participants"] + persons)
+    entities["dates"] = _unique(entities["dates"] + dates)
+    return entities
+
+def _needs_ner(entities):
+    return not entities["case_ids"] or not entities["participants"]
+
+def extract_entities(email, mode=NLP_MODE):
+    if mode == "rules":
+        return entities_from_rules(email)
+    if mode == "auto":
+        entities = entities_from_rules(email)
+        if not _needs_ner(entities):
+            return entities
+    return entities_from_doc(email, get_nlp()(email_text(email)))
+
+def extract_entities_stream(emails, batch_size=BATCH_SIZE, n_process=N_PROCESS, mode=NLP_MODE):
+    """Yield entity records for any iterable of emails, batching NER through nlp.pipe"""
+    if mode == "rules":
+        for email in emails:
+            yield entities_from_rules(email)
+        return
+    if mode == "ner":
+        texts = ((email_text(e), e) for e in emails)
+        for doc, email in get_nlp().pipe(texts, as_tuples=True, batch_size=batch_size, n_process=n_process):
+            yield entities_from_doc(email, doc)
+        return
+
+    # auto: the rules decide per email whether NER is worth running; output keeps input order
+    batch = []
+    for email in emails:
+        batch.append(email)
+        if len(batch) == batch_size:
+            yield from _extract_auto(batch, batch_size, n_process)
+            batch = []
+    if batch:
+        yield from _extract_auto(batch, batch_size, n_process)
+
+def _extract_auto(emails, batch_size, n_process):
+    texts = [email_text(e) for e in emails]
+    results = [entities_from_rules(e, t) for e, t in zip(emails, texts)]
+    pending = [i for i, entities in enumerate(results) if _needs_ner(entities)]
+    if pending:
+        docs = get_nlp().pipe((texts[i] for i in pending), batch_size=batch_size, n_process=n_process)
+        for i, doc in zip(pending, docs):
+            results[i] = entities_from_doc(emails[i], doc)
+    return results
+
+def preprocess_emails(email_json, batch_size=BATCH_SIZE, n_process=N_PROCESS, mode=NLP_MODE):
+    """Accepts a Graph messages response or a plain iterable/generator of emails"""
+    emails = email_json["value"] if isinstance(email_json, dict) else email_json
+    return pd.DataFrame(list(extract_entities_stream(emails, batch_size, n_process, mode)))
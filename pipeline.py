@@ -0,0 +1,117 @@
+import os
+import time
+from contextlib import contextmanager
+from itertools import islice
+import pandas as pd
+from metrics import neo4j_round_trips
+from nlp_preprocessing import strip_html, extract_entities_stream
+from summarization import add_case_text
+
+CHUNK_SIZE = int(os.getenv("PIPELINE_CHUNK_SIZE", "500"))
+
+
+@contextmanager
+def _timed(timings, name, items=0):
+    """Add the block's wall time, item count and Neo4j queries to timings[name]"""
+    if timings is None:
+        yield {"items": 0}
+        return
+    entry = timings.setdefault(name, {"seconds": 0.0, "items": 0, "neo4j_round_trips": 0})
+    round_trips = neo4j_round_trips()
+    start = time.perf_counter()
+    try:
+        yield entry
+    finally:
+        entry["seconds"] += time.perf_counter() - start
+        entry["items"] += items
+        entry["neo4j_round_trips"] += neo4j_round_trips() - round_trips
+
+
+def chunked(iterable, size):
+    it = iter(iterable)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def extract_chunks(messages, chunk_size=CHUNK_SIZE, timings=None):
+    """ingest -> strip_html -> extract_entities, yielding (messages, entities DataFrame) per chunk
+
+    Everything is pulled: the mailbox is only read once downstream asks for the
+    next chunk, so at most `chunk_size` messages are in flight.
+    """
+    chunks = chunked(messages, chunk_size)
+    while True:
+        with _timed(timings, "ingest") as entry:
+            chunk = next(chunks, None)
+            entry["items"] += len(chunk or [])
+        if chunk is None:
+            return
+        with _timed(timings, "extract_entities", len(chunk)):
+            entities = pd.DataFrame(list(extract_entities_stream(chunk, batch_size=min(chunk_size, 256))))
+        yield chunk, entities
+
+
+def resolve_chunks(chunks, resolver, timings=None):
+    """Replace each chunk's participant names with canonical people before graph build"""
+    for chunk, entities in chunks:
+        if resolver is not None:
+            with _timed(timings, "entity_resolution", len(chunk)):
+                entities = resolver.resolve_entities(chunk, entities)
+        yield chunk, entities
+
+
+def persist_chunks(chunks, writer, timings=None):
+    """Append each chunk to the snapshot as its own emails/entities part"""
+    for chunk, entities in chunks:
+        with _timed(timings, "snapshot_write", len(chunk)):
+            writer.append(chunk, entities)
+        yield chunk, entities
+
+
+def index_chunks(chunks, index, timings=None):
+    """Add each chunk to the full-text search index"""
+    for chunk, entities in chunks:
+        if index is not None:
+            with _timed(timings, "search_index", len(chunk)):
+                index.add(chunk, entities)
+        yield chunk, entities
+
+
+def accumulate_case_texts(chunks, case_texts, timings=None):
+    """Fold each chunk into per-case summarizer input; yields (entities, touched case ids)"""
+    for chunk, entities in chunks:
+        touched = set()
+        with _timed(timings, "case_texts", len(chunk)):
+            for message, case_ids in zip(chunk, entities["case_ids"]):
+                add_case_text(case_texts, case_ids, strip_html(message["body"]["content"]))
+                touched.update(case_ids)
+        yield entities, touched
+
+
+def run_stream(messages, writer, case_texts=None, chunk_size=CHUNK_SIZE, progress=None, timings=None,
+               index=None, resolver=None):
+    """Drive messages through every streaming stage
+
+    Returns (new entities, touched case ids, message count). Raw messages are
+    dropped after their chunk is persisted; only the compact entity rows are kept.
+    Pass a dict as `timings` to get time, items and Neo4j queries per sub-stage.
+    """
+    case_texts = {} if case_texts is None else case_texts
+    stages = extract_chunks(messages, chunk_size, timings)
+    stages = resolve_chunks(stages, resolver, timings)
+    stages = persist_chunks(stages, writer, timings)
+    stages = index_chunks(stages, index, timings)
+    stages = accumulate_case_texts(stages, case_texts, timings)
+
+    entity_parts, touched, count = [], set(), 0
+    for entities, chunk_touched in stages:
+        entity_parts.append(entities)
+        touched |= chunk_touched
+        count += len(entities)
+        if progress:
+            progress(count)
+    new_entities = pd.concat(entity_parts, ignore_index=True) if entity_parts else pd.DataFrame()
+    return new_entities, touched, count
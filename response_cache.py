@@ -0,0 +1,134 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from email.utils import format_datetime, parsedate_to_datetime
+from fastapi import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this are sent uncompressed; the headers would outweigh the saving
+MIN_COMPRESS_BYTES = 1024
+# Distinct responses kept per snapshot; least recently used ones are dropped first
+MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "256"))
+
+
+def dumps(obj):
+    if orjson is not None:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, default=str, separators=(",", ":")).encode()
+
+
+def _etag_matches(header, etag):
+    if header.strip() == "*":
+        return True
+    # Weak comparison: W/"x" and "x" name the same representation
+    tags = [t.strip().removeprefix("W/") for t in header.split(",")]
+    return etag in tags
+
+
+class CachedResponse:
+    """One serialized body plus its compressed variants, built lazily and kept for the snapshot's life"""
+
+    def __init__(self, body, last_modified):
+        self.body = body
+        self.etag = '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+        self.last_modified = last_modified
+        self._encoded = {"identity": body}
+        self._lock = threading.Lock()
+
+    def _encode(self, encoding):
+        with self._lock:
+            if encoding not in self._encoded:
+                if encoding == "br":
+                    self._encoded["br"] = brotli.compress(self.body, quality=5)
+                else:
+                    self._encoded["gzip"] = gzip.compress(self.body, compresslevel=6)
+            return self._encoded[encoding]
+
+    def _encoding_for(self, accept_encoding):
+        if len(self.body) < MIN_COMPRESS_BYTES:
+            return "identity"
+        accepted = {e.split(";")[0].strip() for e in accept_encoding.lower().split(",")}
+        if brotli is not None and "br" in accepted:
+            return "br"
+        if "gzip" in accepted:
+            return "gzip"
+        return "identity"
+
+    def respond(self, request):
+        headers = {"ETag": self.etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+        if self.last_modified:
+            headers["Last-Modified"] = format_datetime(self.last_modified, usegmt=True)
+
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None:
+            if _etag_matches(if_none_match, self.etag):
+                return Response(status_code=304, headers=headers)
+        elif self.last_modified and request.headers.get("if-modified-since"):
+            try:
+                since = parsedate_to_datetime(request.headers["if-modified-since"])
+                # HTTP dates have whole seconds only
+                if self.last_modified.replace(microsecond=0) <= since:
+                    return Response(status_code=304, headers=headers)
+            except (TypeError, ValueError):
+                pass
+
+        encoding = self._encoding_for(request.headers.get("accept-encoding", ""))
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(self._encode(encoding), media_type="application/json", headers=headers)
+
+
+class ResponseCache:
+    """Serialized responses for the snapshot currently served
+
+    A Snapshot is never mutated, only replaced, so the cache is keyed on the
+    snapshot object itself: the first request after a swap drops every entry.
+    Within a snapshot at most `max_entries` responses are kept, in LRU order.
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._snapshot = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, snapshot, key, build):
+        """Cached response for `key` (built from validated parameters), calling build() -> JSON-able object on a miss"""
+        with self._lock:
+            if self._snapshot is not snapshot:
+                self._snapshot = snapshot
+                self._entries = OrderedDict()
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        entry = CachedResponse(dumps(build()), snapshot.last_modified)
+        with self._lock:
+            if self._snapshot is snapshot:
+                self._entries[key] = entry
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return entry
+
+    def stats(self):
+        return {"entries": len(self._entries), "max_entries": self.max_entries, "hits": self.hits,
+                "misses": self.misses, "evictions": self.evictions}
@@ -0,0 +1,217 @@
+import math
+import os
+import pickle
+import re
+import threading
+from array import array
+from datetime import datetime, timezone
+import numpy as np
+from atomic_file import atomic_write
+from nlp_preprocessing import strip_html
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+# BM25 term-frequency saturation and document-length normalization
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def _timestamp(value):
+    """Epoch seconds for an ISO-8601 string or datetime; naive values are taken as UTC"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+class SearchIndex:
+    """Inverted index over email subject and body with BM25 ranking
+
+    Documents are numbered in the order they are added. Each token maps to a
+    posting list of (doc, term frequency) arrays. Secondary indexes map case id,
+    participant and team to doc lists. A date-sorted permutation serves
+    sentDateTime ranges. Adding emails only ever appends, so every list stays
+    sorted by doc number without re-sorting.
+    """
+
+    def __init__(self, path="data/search_index.pickle"):
+        self.path = path
+        self._lock = threading.RLock()
+        self._reset()
+        self.load()
+
+    def _reset(self):
+        self.email_ids = []
+        self.doc_of = {}
+        self.postings = {}
+        self.lengths = array("I")
+        self.sent = array("d")
+        self.docs = []
+        self.by_case = {}
+        self.by_participant = {}
+        self.by_team = {}
+        self.total_length = 0
+        self._date_order = None
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+
+    def __len__(self):
+        return len(self.email_ids)
+
+    def add(self, messages, entities):
+        """Index messages with their entity rows (entities aligned with messages); returns how many were new"""
+        added = 0
+        with self._lock:
+            for message, case_ids, participants, teams in zip(
+                messages, entities["case_ids"], entities["participants"], entities["teams"]
+            ):
+                if message["id"] in self.doc_of:
+                    continue
+                doc = len(self.email_ids)
+                self.email_ids.append(message["id"])
+                self.doc_of[message["id"]] = doc
+
+                tokens = tokenize(message["subject"] + " " + strip_html(message["body"]["content"]))
+                counts = {}
+                for token in tokens:
+                    counts[token] = counts.get(token, 0) + 1
+                for token, tf in counts.items():
+                    posting = self.postings.get(token)
+                    if posting is None:
+                        posting = self.postings[token] = (array("I"), array("I"))
+                    posting[0].append(doc)
+                    posting[1].append(tf)
+                self.lengths.append(len(tokens))
+                self.total_length += len(tokens)
+                self.sent.append(_timestamp(message["sentDateTime"]))
+
+                case_ids = sorted(set(case_ids))
+                for index, values in ((self.by_case, case_ids),
+                                      (self.by_participant, {p.lower() for p in participants}),
+                                      (self.by_team, {t.lower() for t in teams})):
+                    for value in values:
+                        index.setdefault(value, array("I")).append(doc)
+
+                self.docs.append({
+                    "email_id": message["id"],
+                    "subject": message["subject"],
+                    "sentDateTime": message["sentDateTime"],
+                    "case_ids": case_ids,
+                    "participants": sorted(set(participants)),
+                    "teams": sorted(set(teams)),
+                })
+                added += 1
+            if added:
+                self._date_order = None
+        return added
+
+    def _date_range(self, start, end):
+        """Docs sent in [start, end), by binary search over the date-sorted permutation"""
+        if self._date_order is None:
+            self._date_order = np.argsort(np.frombuffer(self.sent, dtype=np.float64), kind="stable")
+        sent = np.frombuffer(self.sent, dtype=np.float64)[self._date_order]
+        lo = np.searchsorted(sent, _timestamp(start)) if start else 0
+        hi = np.searchsorted(sent, _timestamp(end)) if end else len(sent)
+        return self._date_order[lo:hi]
+
+    def _filter_mask(self, case_id, participant, team, start, end):
+        """Boolean mask of docs passing every filter, or None when there are no filters"""
+        n = len(self.email_ids)
+        mask = None
+        for index, value in ((self.by_case, case_id),
+                             (self.by_participant, participant and participant.lower()),
+                             (self.by_team, team and team.lower())):
+            if value is None:
+                continue
+            keep = np.zeros(n, dtype=bool)
+            docs = index.get(value)
+            if docs:
+                keep[np.frombuffer(docs, dtype=np.uint32)] = True
+            mask = keep if mask is None else mask & keep
+        if start or end:
+            keep = np.zeros(n, dtype=bool)
+            keep[self._date_range(start, end)] = True
+            mask = keep if mask is None else mask & keep
+        return mask
+
+    def _bm25(self, tokens):
+        n = len(self.email_ids)
+        scores = np.zeros(n, dtype=np.float64)
+        lengths = np.frombuffer(self.lengths, dtype=np.uint32).astype(np.float64)
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / max(self.total_length / n, 1))
+        for token in set(tokens):
+            posting = self.postings.get(token)
+            if posting is None:
+                continue
+            docs = np.frombuffer(posting[0], dtype=np.uint32)
+            tf = np.frombuffer(posting[1], dtype=np.uint32).astype(np.float64)
+            idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            scores[docs] += idf * tf * (BM25_K1 + 1) / (tf + norm[docs])
+        return scores
+
+    def search(self, query=None, case_id=None, participant=None, team=None, start=None, end=None,
+               offset=0, limit=20):
+        """BM25-ranked matches for `query` within the filters; with no query, newest first"""
+        with self._lock:
+            n = len(self.email_ids)
+            if not n:
+                return {"total": 0, "offset": offset, "limit": limit, "results": []}
+            tokens = tokenize(query) if query else []
+            if query and not tokens:
+                # Only punctuation: nothing can match, rather than falling back to "everything"
+                return {"total": 0, "offset": offset, "limit": limit, "results": []}
+            mask = self._filter_mask(case_id, participant, team, start, end)
+
+            if tokens:
+                scores = self._bm25(tokens)
+                matched = scores > 0
+                if mask is not None:
+                    matched &= mask
+                hits = np.flatnonzero(matched)
+                # Newest first among equal scores
+                order = np.lexsort((-np.frombuffer(self.sent, dtype=np.float64)[hits], -scores[hits]))
+            else:
+                hits = np.flatnonzero(mask) if mask is not None else np.arange(n)
+                scores = None
+                order = np.argsort(-np.frombuffer(self.sent, dtype=np.float64)[hits], kind="stable")
+
+            page = hits[order[offset:offset + limit]]
+            results = [
+                {**self.docs[doc], "score": float(scores[doc]) if scores is not None else None}
+                for doc in page
+            ]
+            return {"total": int(len(hits)), "offset": offset, "limit": limit, "results": results}
+
+    def stats(self):
+        return {"emails": len(self.email_ids), "tokens": len(self.postings), "cases": len(self.by_case)}
+
+    def load(self):
+        """Replace the in-memory index with the saved one (empty when nothing is saved)"""
+        with self._lock:
+            self._reset()
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "rb") as f:
+                state = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError) as e:
+            print(f"Could not load search index: {e}")
+            return
+        with self._lock:
+            self.__dict__.update(state)
+            self.doc_of = {email_id: doc for doc, email_id in enumerate(self.email_ids)}
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            state = {k: v for k, v in self.__dict__.items()
+                     if k not in ("path", "_lock", "doc_of", "_date_order")}
+            with atomic_write(self.path, "wb") as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
@@ -0,0 +1,321 @@
+import ast
+import json
+import os
+from datetime import datetime, timezone
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from atomic_file import atomic_write
+from nlp_preprocessing import strip_html
+
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "data/snapshot")
+LIST_COLUMNS = ["case_ids", "participants", "teams", "dates"]
+TIMESTAMP_COLUMNS = ["sentDateTime", "receivedDateTime"]
+
+_recipient = pa.struct([("emailAddress", pa.struct([("name", pa.string()), ("address", pa.string())]))])
+
+EMAIL_SCHEMA = pa.schema([
+    ("id", pa.string()),
+    ("conversationId", pa.string()),
+    ("internetMessageId", pa.string()),
+    ("subject", pa.string()),
+    ("bodyPreview", pa.string()),
+    ("body", pa.struct([("contentType", pa.string()), ("content", pa.string())])),
+    ("from", _recipient),
+    ("toRecipients", pa.list_(_recipient)),
+    ("ccRecipients", pa.list_(_recipient)),
+    ("bccRecipients", pa.list_(_recipient)),
+    ("sentDateTime", pa.timestamp("us", tz="UTC")),
+    ("receivedDateTime", pa.timestamp("us", tz="UTC")),
+    ("hasAttachments", pa.bool_()),
+])
+
+ENTITY_SCHEMA = pa.schema([
+    ("email_id", pa.string()),
+    ("case_ids", pa.list_(pa.string())),
+    ("participants", pa.list_(pa.string())),
+    ("teams", pa.list_(pa.string())),
+    ("dates", pa.list_(pa.string())),
+])
+
+SUMMARY_SCHEMA = pa.schema([
+    ("case_id", pa.string()),
+    ("summary", pa.string()),
+])
+
+
+MANIFEST = "manifest.json"
+# Once a commit leaves more parts than this, they are merged into parts of about COMPACT_PART_ROWS rows
+COMPACT_PARTS = int(os.getenv("SNAPSHOT_COMPACT_PARTS", "64"))
+COMPACT_PART_ROWS = int(os.getenv("SNAPSHOT_COMPACT_PART_ROWS", "100000"))
+PART_KINDS = ("emails", "entities")
+
+CASE_TEXT_SCHEMA = pa.schema([
+    ("case_id", pa.string()),
+    ("text", pa.string()),
+])
+
+
+def _part_path(path, kind, part, generation=0):
+    """Parts rewritten by compaction get a generation prefix; generation 0 keeps the original names"""
+    name = f"part-{part:06d}.arrow" if not generation else f"g{generation}-part-{part:06d}.arrow"
+    return os.path.join(path, kind, name)
+
+
+def read_manifest(path=SNAPSHOT_DIR):
+    manifest_path = os.path.join(path, MANIFEST)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, "r") as f:
+        return json.load(f)
+
+
+def exists(path=SNAPSHOT_DIR):
+    return read_manifest(path) is not None
+
+
+def _write_table(table, file_path):
+    """Write an uncompressed Arrow IPC file via a temp file so readers never see half a snapshot"""
+    with atomic_write(file_path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+
+def _read_table(file_path, memory_map):
+    source = pa.memory_map(file_path, "r") if memory_map else pa.OSFile(file_path, "rb")
+    return pa.ipc.open_file(source).read_all()
+
+
+def emails_to_table(emails, context=None):
+    # Timestamps are parsed by Arrow below rather than per row in Python
+    rows = [{**e, **{col: None for col in TIMESTAMP_COLUMNS}} for e in emails]
+    table = pa.Table.from_pylist(rows, schema=EMAIL_SCHEMA)
+    for col in TIMESTAMP_COLUMNS:
+        raw = pa.array([e.get(col) for e in emails], pa.string())
+        table = table.set_column(table.schema.get_field_index(col), col, raw.cast(pa.timestamp("us", tz="UTC")))
+    metadata = {"odata_context": context or ""}
+    return table.replace_schema_metadata(metadata)
+
+
+def table_to_emails(table):
+    """Rebuild the Graph messages response, with timestamps back in ISO-8601 'Z' form"""
+    for col in TIMESTAMP_COLUMNS:
+        formatted = pc.binary_join_element_wise(pc.strftime(table[col], format="%Y-%m-%dT%H:%M:%S"), "Z", "")
+        table = table.set_column(table.schema.get_field_index(col), col, formatted)
+    context = (table.schema.metadata or {}).get(b"odata_context", b"").decode()
+    return {"@odata.context": context, "value": table.to_pylist()}
+
+
+def _frame_to_table(df, schema):
+    if df.empty:
+        return schema.empty_table()
+    if "case_id" in df.columns:
+        df = df.astype({"case_id": str})
+    return pa.Table.from_pandas(df[schema.names], schema=schema, preserve_index=False)
+
+
+def _table_to_frame(table):
+    """Scalar columns convert zero-copy; list columns become plain Python lists"""
+    scalar = [c for c in table.column_names if c not in LIST_COLUMNS]
+    df = table.select(scalar).to_pandas()
+    for col in LIST_COLUMNS:
+        if col in table.column_names:
+            df[col] = table[col].to_pylist()
+    return df[table.column_names]
+
+
+class SnapshotWriter:
+    """Appends one emails/entities part per pipeline chunk
+
+    Parts are invisible to readers until commit() rewrites the manifest, so a
+    crashed run leaves the previous snapshot intact and its parts get overwritten.
+    Summaries and case texts are written to new files per commit and named in
+    the manifest, as is the ingest state the commit covers.
+    A commit that leaves more than `compact_parts` parts also compacts them.
+    """
+
+    def __init__(self, path=SNAPSHOT_DIR, compact_parts=COMPACT_PARTS):
+        self.path = path
+        self.compact_parts = compact_parts
+        manifest = read_manifest(path) or {"parts": 0}
+        self.parts = manifest["parts"]
+        self.generation = manifest.get("generation", 0)
+        self.commits = manifest.get("commit", 0)
+        for kind in PART_KINDS:
+            os.makedirs(os.path.join(path, kind), exist_ok=True)
+
+    def append(self, messages, entities):
+        _write_table(emails_to_table(messages), _part_path(self.path, "emails", self.parts, self.generation))
+        _write_table(_frame_to_table(entities, ENTITY_SCHEMA),
+                     _part_path(self.path, "entities", self.parts, self.generation))
+        self.parts += 1
+
+    def commit(self, summaries, case_texts, created_at=None, ingest=None):
+        """Make the appended parts live; `ingest` is the mailbox state they were read up to. Returns the commit number"""
+        created_at = created_at or datetime.now(timezone.utc)
+        commit = self.commits + 1
+        files = {"summaries": f"summaries-{commit:06d}.arrow", "case_texts": f"case_texts-{commit:06d}.arrow"}
+        _write_table(_frame_to_table(summaries, SUMMARY_SCHEMA), os.path.join(self.path, files["summaries"]))
+        case_text_table = pa.Table.from_pydict(
+            {"case_id": list(case_texts), "text": list(case_texts.values())}, schema=CASE_TEXT_SCHEMA
+        )
+        _write_table(case_text_table, os.path.join(self.path, files["case_texts"]))
+        manifest = {"parts": self.parts, "generation": self.generation, "commit": commit,
+                    "created_at": created_at.isoformat(), **files}
+        if ingest is not None:
+            manifest["ingest"] = ingest
+        _write_manifest(self.path, manifest)
+        self.commits = commit
+        # Summaries and case texts of earlier commits are no longer named anywhere
+        for name in os.listdir(self.path):
+            if name.endswith(".arrow") and name.startswith(("summaries", "case_texts")) and name not in files.values():
+                os.remove(os.path.join(self.path, name))
+        if self.parts > self.compact_parts:
+            self.parts, self.generation = compact(self.path)
+        return commit
+
+
+def _write_manifest(path, manifest):
+    with atomic_write(os.path.join(path, MANIFEST)) as f:
+        json.dump(manifest, f)
+
+
+def compact(path=SNAPSHOT_DIR, part_rows=COMPACT_PART_ROWS, transform=None):
+    """Merge the committed parts into parts of about `part_rows` rows; returns (parts, generation)
+
+    The merged parts are written under the next generation and only become
+    live when the manifest is replaced, so a crash mid-way leaves the old
+    parts in use. Files of other generations are removed afterwards.
+    `transform(messages, entities)`, if given, returns each merged part's
+    entities rewritten, row for row.
+    """
+    manifest = read_manifest(path)
+    old_generation = manifest.get("generation", 0)
+    generation = old_generation + 1
+
+    # emails and entities part i always hold the same rows, so one grouping serves both
+    groups, rows = [[]], 0
+    for i in range(manifest["parts"]):
+        n = _read_table(_part_path(path, "entities", i, old_generation), memory_map=True).num_rows
+        if groups[-1] and rows + n > part_rows:
+            groups.append([])
+            rows = 0
+        groups[-1].append(i)
+        rows += n
+    groups = [g for g in groups if g]
+
+    for new_part, group in enumerate(groups):
+        merged = {}
+        for kind in PART_KINDS:
+            tables = [_read_table(_part_path(path, kind, i, old_generation), memory_map=True) for i in group]
+            # Email parts differ only in their odata_context metadata; keep the first one's
+            tables = [t.replace_schema_metadata(tables[0].schema.metadata) for t in tables]
+            merged[kind] = pa.concat_tables(tables)
+        if transform:
+            entities = transform(table_to_emails(merged["emails"])["value"], _table_to_frame(merged["entities"]))
+            merged["entities"] = _frame_to_table(entities, ENTITY_SCHEMA)
+        for kind in PART_KINDS:
+            _write_table(merged[kind], _part_path(path, kind, new_part, generation))
+
+    _write_manifest(path, {**manifest, "parts": len(groups), "generation": generation})
+    live = {os.path.basename(_part_path(path, "emails", i, generation)) for i in range(len(groups))}
+    for kind in PART_KINDS:
+        for name in os.listdir(os.path.join(path, kind)):
+            if name not in live:
+                os.remove(os.path.join(path, kind, name))
+    print(f"Compacted {manifest['parts']} snapshot parts into {len(groups)}")
+    return len(groups), generation
+
+
+def read_snapshot(path=SNAPSHOT_DIR, memory_map=True):
+    """Return (entities, summaries, case_texts, created_at); emails stay on disk, see iter_emails"""
+    manifest = read_manifest(path)
+    generation = manifest.get("generation", 0)
+    tables = [_read_table(_part_path(path, "entities", i, generation), memory_map) for i in range(manifest["parts"])]
+    entities = _table_to_frame(pa.concat_tables(tables)) if tables else pd.DataFrame(columns=ENTITY_SCHEMA.names)
+    # Manifests from before per-commit file names point at neither
+    summaries_file = manifest.get("summaries", "summaries.arrow")
+    case_texts_file = manifest.get("case_texts", "case_texts.arrow")
+    summaries = _table_to_frame(_read_table(os.path.join(path, summaries_file), memory_map))
+    case_text_table = _read_table(os.path.join(path, case_texts_file), memory_map)
+    case_texts = dict(zip(case_text_table["case_id"].to_pylist(), case_text_table["text"].to_pylist()))
+    return entities, summaries, case_texts, datetime.fromisoformat(manifest["created_at"])
+
+
+def iter_emails(path=SNAPSHOT_DIR, memory_map=True):
+    """Yield stored messages one part at a time"""
+    manifest = read_manifest(path) or {"parts": 0}
+    generation = manifest.get("generation", 0)
+    for i in range(manifest["parts"]):
+        yield from table_to_emails(_read_table(_part_path(path, "emails", i, generation), memory_map))["value"]
+
+
+def _case_texts(messages, entities):
+    from summarization import add_case_text
+    case_texts = {}
+    if not messages:
+        return case_texts
+    for message, case_ids in zip(messages, entities["case_ids"]):
+        add_case_text(case_texts, case_ids, strip_html(message["body"]["content"]))
+    return case_texts
+
+
+def _upgrade_single_file(path):
+    """Convert the earlier emails/entities/summaries.arrow layout to parts + manifest"""
+    single = {name: os.path.join(path, f"{name}.arrow") for name in ("emails", "entities")}
+    if not all(os.path.exists(p) for p in single.values()):
+        return False
+    print(f"Upgrading {path} to the append-only layout")
+    entity_table = _read_table(single["entities"], memory_map=False)
+    created_at = (entity_table.schema.metadata or {}).get(b"created_at")
+    created_at = datetime.fromisoformat(created_at.decode()) if created_at else None
+    messages = table_to_emails(_read_table(single["emails"], memory_map=False))["value"]
+    entities = _table_to_frame(entity_table)
+    summaries = _table_to_frame(_read_table(os.path.join(path, "summaries.arrow"), memory_map=False))
+
+    writer = SnapshotWriter(path)
+    writer.append(messages, entities)
+    writer.commit(summaries, _case_texts(messages, entities), created_at)
+    for p in single.values():
+        os.remove(p)
+    return True
+
+
+def migrate_legacy(data_dir="data", path=SNAPSHOT_DIR):
+    """One-time conversion of entities.csv / summaries.csv / emails.json into a snapshot"""
+    if _upgrade_single_file(path):
+        return True
+    entities_csv = os.path.join(data_dir, "entities.csv")
+    if not os.path.exists(entities_csv):
+        return False
+    print(f"Migrating {data_dir}/*.csv and emails.json to {path}")
+
+    entities = pd.read_csv(entities_csv)
+    for col in LIST_COLUMNS:
+        entities[col] = entities[col].apply(ast.literal_eval)
+
+    summaries_csv = os.path.join(data_dir, "summaries.csv")
+    summaries = pd.read_csv(summaries_csv, dtype={"case_id": str}) if os.path.exists(summaries_csv) \
+        else pd.DataFrame(columns=["case_id", "summary"])
+
+    emails_json = os.path.join(data_dir, "emails.json")
+    emails = {"value": []}
+    if os.path.exists(emails_json):
+        with open(emails_json, "r") as f:
+            emails = json.load(f)
+
+    # entities.csv rows line up with emails.json messages; key by id in case they don't
+    by_id = {e["id"]: e for e in emails["value"]}
+    found = entities["email_id"].isin(by_id)
+    if not found.all():
+        # Part i of emails and of entities must hold the same rows, so unmatched entity rows go too
+        print(f"WARNING: {(~found).sum()} of {len(entities)} rows in entities.csv have no message in "
+              f"emails.json and are not migrated")
+        entities = entities[found].reset_index(drop=True)
+    messages = [by_id[i] for i in entities["email_id"]]
+
+    created_at = datetime.fromtimestamp(os.path.getmtime(entities_csv), timezone.utc)
+    writer = SnapshotWriter(path)
+    writer.append(messages, entities)
+    writer.commit(summaries, _case_texts(messages, entities), created_at)
+    return True
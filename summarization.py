@@ -1,36 +1,371 @@
+import gc
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
-from transformers import pipeline as hf_pipeline
-from nlp_preprocessing import strip_html
+from nlp_preprocessing import strip_html, CASE_PATTERN
 
-def summarize_case(email_json, case_id):
-    print("Loading summarization model (this may take a moment)...")
+MODEL_NAME = os.getenv("SUMMARIZER_MODEL", "facebook/bart-large-cnn")
+# pytorch: float32 weights | int8: dynamically quantized Linear layers | onnx: exported ONNX Runtime graph
+# A distilled model (e.g. sshleifer/distilbart-cnn-12-6) is picked with SUMMARIZER_MODEL and works with any backend
+BACKEND = os.getenv("SUMMARIZER_BACKEND", "pytorch")
+BACKENDS = ("pytorch", "int8", "onnx")
+ONNX_EXPORT_DIR = os.getenv("SUMMARIZER_ONNX_DIR", "data/onnx")
 
-    summarizer = hf_pipeline("summarization", model="facebook/bart-large-cnn")
-    case_texts = []
+
+def model_label(model=MODEL_NAME, backend=BACKEND):
+    """Name a model/backend pair is registered and cached under"""
+    return model if backend == "pytorch" else f"{model}@{backend}"
+
+
+def _load_pytorch(model):
+    from transformers import pipeline as hf_pipeline
+    return hf_pipeline("summarization", model=model)
+
+
+def _load_int8(model):
+    import torch
+    summarizer = _load_pytorch(model)
+    summarizer.model = torch.quantization.quantize_dynamic(summarizer.model, {torch.nn.Linear}, dtype=torch.qint8)
+    return summarizer
+
+
+def _load_onnx(model):
+    """Export once to ONNX_EXPORT_DIR, then load the exported graph on later starts"""
+    from optimum.onnxruntime import ORTModelForSeq2SeqLM
+    from transformers import AutoTokenizer, pipeline as hf_pipeline
+    export_dir = os.path.join(ONNX_EXPORT_DIR, model.replace("/", "--"))
+    if os.path.exists(os.path.join(export_dir, "config.json")):
+        ort_model = ORTModelForSeq2SeqLM.from_pretrained(export_dir)
+        tokenizer = AutoTokenizer.from_pretrained(export_dir)
+    else:
+        print(f"Exporting {model} to ONNX in {export_dir}...")
+        ort_model = ORTModelForSeq2SeqLM.from_pretrained(model, export=True)
+        tokenizer = AutoTokenizer.from_pretrained(model)
+        ort_model.save_pretrained(export_dir)
+        tokenizer.save_pretrained(export_dir)
+    return hf_pipeline("summarization", model=ort_model, tokenizer=tokenizer)
+
+
+LOADERS = {"pytorch": _load_pytorch, "int8": _load_int8, "onnx": _load_onnx}
+
+
+class SummarizerRegistry:
+    """Process-wide cache of loaded summarization pipelines, keyed by model and backend"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get(self, model=MODEL_NAME, backend=BACKEND):
+        """Return a warm pipeline for `model` on `backend`, loading it on first use"""
+        if backend not in LOADERS:
+            raise ValueError(f"Unknown summarizer backend {backend!r}, expected one of {', '.join(BACKENDS)}")
+        label = model_label(model, backend)
+        with self._lock:
+            entry = self._entries.get(label)
+            if entry is None:
+                print(f"Loading summarization model {label} (this may take a moment)...")
+                start = time.perf_counter()
+                # transformers pulls in torch, so it is only imported once a model is needed
+                summarizer = LOADERS[backend](model)
+                entry = {
+                    "pipeline": summarizer,
+                    "backend": backend,
+                    "load_seconds": time.perf_counter() - start,
+                    "memory_bytes": _model_bytes(summarizer),
+                    "loaded_at": time.time(),
+                    "last_used": time.time(),
+                    # get() calls, not summarizations: one lookup serves a whole run
+                    "lookups": 0,
+                }
+                self._entries[label] = entry
+                print(f"Loaded {label} in {entry['load_seconds']:.1f}s")
+            entry["last_used"] = time.time()
+            entry["lookups"] += 1
+            return entry["pipeline"]
+
+    def unload(self, model=None):
+        """Drop one model (or all of them) and release its memory"""
+        with self._lock:
+            names = [model] if model else list(self._entries)
+            dropped = [n for n in names if self._entries.pop(n, None) is not None]
+        if dropped:
+            _release_memory()
+            print(f"Unloaded summarization model(s): {', '.join(dropped)}")
+        return dropped
+
+    def unload_idle(self, idle_seconds):
+        """Unload every model that has not been used for `idle_seconds`"""
+        cutoff = time.time() - idle_seconds
+        with self._lock:
+            idle = [n for n, e in self._entries.items() if e["last_used"] < cutoff]
+        return [n for n in idle if self.unload(n)]
+
+    def stats(self):
+        with self._lock:
+            return {
+                name: {k: v for k, v in entry.items() if k != "pipeline"}
+                for name, entry in self._entries.items()
+            }
+
+
+def _model_bytes(summarizer):
+    """Size of the model weights and buffers held in memory; None for ONNX Runtime sessions"""
+    model = getattr(summarizer, "model", None)
+    if model is None or not hasattr(model, "parameters"):
+        return None
+    tensors = list(model.parameters()) + list(model.buffers())
+    for module in model.modules():
+        # Dynamically quantized Linear layers keep packed int8 weights outside parameters()
+        if callable(getattr(module, "weight", None)):
+            tensors.append(module.weight())
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+def _release_memory():
+    gc.collect()
+    try:
+        import torch
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+    except ImportError:
+        pass
+
+
+summarizers = SummarizerRegistry()
+
+
+MAX_INPUT_CHARS = 1024
+GENERATION_KWARGS = {"max_length": 100, "min_length": 30, "do_sample": False}
+BATCH_SIZE = int(os.getenv("SUMMARY_BATCH_SIZE", "8"))
+
+# truncate: summarize the first MAX_INPUT_CHARS of a case | chunked: map-reduce over the whole case
+SUMMARY_MODE = os.getenv("SUMMARY_MODE", "truncate")
+# Window size in model tokens, kept under bart's 1024-token input limit
+CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", "900"))
+# Generation threads for chunked mode, capped at the core count; torch's intra-op threads are split between them
+SUMMARY_WORKERS = int(os.getenv("SUMMARY_WORKERS", "2"))
+# Each reduce level shrinks a case ~9x, so this is only hit by pathological inputs
+MAX_REDUCE_LEVELS = 4
+# Chunked mode needs every word of a case, so case text is no longer capped
+CASE_TEXT_LIMIT = None if SUMMARY_MODE == "chunked" else MAX_INPUT_CHARS
+
+
+def group_case_texts(email_json, case_ids):
+    """Collect the body text of every email per case in a single pass over the mailbox"""
+    grouped = {str(c): [] for c in case_ids}
     for email in email_json["value"]:
         body_text = strip_html(email["body"]["content"])
-        if f"Case {case_id}" in email["subject"] or f"Case {case_id}" in body_text:
-            case_texts.append(body_text)
-    
+        mentioned = set(CASE_PATTERN.findall(email["subject"])) | set(CASE_PATTERN.findall(body_text))
+        for c in mentioned:
+            if c in grouped:
+                grouped[c].append(body_text)
+    return grouped
+
+
+def combine_case_texts(case_texts, limit=CASE_TEXT_LIMIT):
+    combined = " ".join(case_texts)
+    if limit is not None and len(combined) > limit:
+        combined = combined[:limit]
+    return combined
+
+
+def add_case_text(case_texts, case_ids, body_text, limit=CASE_TEXT_LIMIT):
+    """Append an email body to each case's model input, keeping only what the model will read
+
+    Matches combine_case_texts over the same emails in order, but holds at most
+    `limit` chars per case no matter how much mail a case accumulates.
+    """
+    for c in set(case_ids):
+        current = case_texts.get(c)
+        if current is None:
+            case_texts[c] = body_text[:limit]
+        elif limit is None or len(current) < limit:
+            case_texts[c] = (current + " " + body_text)[:limit]
+        elif len(current) > limit:
+            # Text kept uncapped by an earlier chunked-mode run
+            case_texts[c] = current[:limit]
+
+
+def summarize_case(email_json, case_id, summarizer=None):
+    case_texts = group_case_texts(email_json, [case_id])[str(case_id)]
     if not case_texts:
         return None
 
-    combined = " ".join(case_texts)
-    if len(combined) > 1024:
-        combined = combined[:1024]
-    
     try:
-        summary = summarizer(combined, max_length=100, min_length=30, do_sample=False)[0]["summary_text"]
-        return summary
+        text = combine_case_texts(case_texts)
+        return summarize_cases({str(case_id): text}, summarizer or summarizers.get()).get(str(case_id))
     except Exception as e:
         print(f"Error summarizing case {case_id}: {e}")
         return None
 
-def generate_case_summaries(email_json, case_ids):
-    summaries = []
-    for c in case_ids:
-        print(f"Summarizing Case {c}...")
-        s = summarize_case(email_json, c)
-        if s:
-            summaries.append({"case_id": c, "summary": s})
-    return pd.DataFrame(summaries) if summaries else pd.DataFrame(columns=["case_id", "summary"])
\ No newline at end of file
+
+def summarize_texts(texts, summarizer=None, batch_size=BATCH_SIZE, model=MODEL_NAME, cache=None, backend=BACKEND):
+    """Summarize {case_id: text} in length-sorted batches so each batch pads to a similar length"""
+    results = {}
+    keys = {}
+    if cache is not None:
+        for c, text in texts.items():
+            keys[c] = cache.key(text, model_label(model, backend), GENERATION_KWARGS["max_length"],
+                                GENERATION_KWARGS["min_length"])
+            cached = cache.get(keys[c])
+            if cached is not None:
+                results[c] = cached
+    pending = {c: t for c, t in texts.items() if c not in results}
+    if not pending:
+        return results
+
+    summarizer = summarizer or summarizers.get(model, backend)
+    ordered = sorted(pending.items(), key=lambda item: len(item[1]))
+    for start in range(0, len(ordered), batch_size):
+        batch = ordered[start:start + batch_size]
+        print(f"Summarizing cases {', '.join(c for c, _ in batch)}...")
+        try:
+            outputs = summarizer([t for _, t in batch], batch_size=len(batch), **GENERATION_KWARGS)
+            for (c, _), out in zip(batch, outputs):
+                results[c] = out["summary_text"]
+        except Exception as e:
+            print(f"Batch failed ({e}), retrying cases one at a time")
+            for c, text in batch:
+                try:
+                    results[c] = summarizer(text, **GENERATION_KWARGS)[0]["summary_text"]
+                except Exception as e:
+                    print(f"Error summarizing case {c}: {e}")
+        if cache is not None:
+            for c, _ in batch:
+                if results.get(c):
+                    cache.put(keys[c], results[c])
+    return results
+
+
+def split_windows(text, tokenizer, window_tokens=CHUNK_TOKENS):
+    """Cut text at token boundaries into pieces of at most window_tokens tokens
+
+    Windows are counted from the start, so appending to a text leaves every
+    window but the last one unchanged and their cached summaries still hit.
+    """
+    offsets = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True,
+                        verbose=False)["offset_mapping"]
+    windows = []
+    for start in range(0, len(offsets), window_tokens):
+        window = offsets[start:start + window_tokens]
+        windows.append(text[window[0][0]:window[-1][1]])
+    return windows
+
+
+class _SharedSummarizer:
+    """A pipeline's tokenize -> generate -> decode, callable from several threads at once
+
+    A fast tokenizer changes its padding/truncation state on every batched call
+    and fails with "Already borrowed" when two threads do that together, so
+    tokenizing and decoding hold a lock; generate() runs unlocked and torch
+    releases the GIL inside it.
+    """
+
+    def __init__(self, summarizer):
+        self.summarizer = summarizer
+        self.tokenizer = summarizer.tokenizer
+        self._lock = threading.Lock()
+
+    def __call__(self, texts, batch_size=None, **generation_kwargs):
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        with self._lock:
+            inputs = self.tokenizer(texts, padding=True, truncation=True, return_tensors="pt")
+        output_ids = self.summarizer.model.generate(**inputs, **generation_kwargs)
+        with self._lock:
+            summaries = self.tokenizer.batch_decode(output_ids, skip_special_tokens=True,
+                                                    clean_up_tokenization_spaces=True)
+        return [{"summary_text": s} for s in summaries]
+
+
+def _summarize_parallel(texts, summarizer, batch_size, model, cache, backend, workers):
+    """summarize_texts split across a thread pool sharing one model"""
+    workers = min(workers, os.cpu_count() or 1)
+    if workers <= 1 or len(texts) <= batch_size or not hasattr(getattr(summarizer, "model", None), "generate"):
+        return summarize_texts(texts, summarizer, batch_size, model, cache, backend)
+    shared = _SharedSummarizer(summarizer)
+    # Deal length-sorted texts round-robin so each worker gets similar batches
+    ordered = sorted(texts.items(), key=lambda item: len(item[1]))
+    shards = [dict(ordered[i::workers]) for i in range(workers)]
+    results = {}
+    torch_threads = _split_torch_threads(workers)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for shard_results in pool.map(
+                    lambda shard: summarize_texts(shard, shared, batch_size, model, cache, backend), shards):
+                results.update(shard_results)
+    finally:
+        _split_torch_threads(1, torch_threads)
+    return results
+
+
+def _split_torch_threads(workers, restore=None):
+    """Give each of `workers` concurrent generate() calls its share of the cores; returns the previous setting
+
+    Every generate() would otherwise spread over all cores and the workers
+    would just contend with each other.
+    """
+    try:
+        import torch
+    except ImportError:
+        return None
+    previous = torch.get_num_threads()
+    torch.set_num_threads(restore or max(1, (os.cpu_count() or 1) // workers))
+    return previous
+
+
+def summarize_chunked(texts, summarizer=None, batch_size=BATCH_SIZE, model=MODEL_NAME, cache=None, backend=BACKEND,
+                      workers=SUMMARY_WORKERS, window_tokens=CHUNK_TOKENS):
+    """Map-reduce summaries of {case_id: text} of any length
+
+    Map: every case is cut into model-sized windows, and the windows of all cases
+    are summarized together across the worker pool. Reduce: a case's window
+    summaries are joined in order and summarized again, level by level, until
+    they fit in one window. Every window goes through the summary cache, so
+    new mail on a case only costs its new windows and the reduce above them.
+    """
+    summarizer = summarizer or summarizers.get(model, backend)
+    results = {}
+    pending = {c: t for c, t in texts.items() if t}
+    for level in range(MAX_REDUCE_LEVELS + 1):
+        if not pending:
+            break
+        windows = {c: split_windows(t, summarizer.tokenizer, window_tokens) for c, t in pending.items()}
+        if level == MAX_REDUCE_LEVELS:
+            windows = {c: w[:1] for c, w in windows.items()}
+        jobs = {f"{c}#{level}.{i}": w for c, ws in windows.items() for i, w in enumerate(ws)}
+        outputs = _summarize_parallel(jobs, summarizer, batch_size, model, cache, backend, workers)
+
+        pending = {}
+        for c, ws in windows.items():
+            parts = [outputs.get(f"{c}#{level}.{i}") for i in range(len(ws))]
+            parts = [p for p in parts if p]
+            if not parts:
+                continue
+            if len(ws) == 1:
+                results[c] = parts[0]
+            else:
+                pending[c] = " ".join(parts)
+    return results
+
+
+def summarize_cases(texts, summarizer=None, batch_size=BATCH_SIZE, model=MODEL_NAME, cache=None, backend=BACKEND,
+                    mode=SUMMARY_MODE):
+    """Summarize {case_id: text} with the configured SUMMARY_MODE"""
+    if mode == "chunked":
+        return summarize_chunked(texts, summarizer, batch_size, model, cache, backend)
+    # Snapshots written in chunked mode hold whole cases; the model only takes the start
+    texts = {c: t[:MAX_INPUT_CHARS] for c, t in texts.items()}
+    return summarize_texts(texts, summarizer, batch_size, model, cache, backend)
+
+
+def generate_case_summaries(email_json, case_ids, batch_size=BATCH_SIZE, model=MODEL_NAME, cache=None,
+                            summarizer=None):
+    grouped = group_case_texts(email_json, case_ids)
+    texts = {c: combine_case_texts(t) for c, t in grouped.items() if t}
+    results = summarize_cases(texts, summarizer, batch_size=batch_size, model=model, cache=cache)
+    summaries = [{"case_id": c, "summary": results[c]} for c in grouped if results.get(c)]
+    return pd.DataFrame(summaries) if summaries else pd.DataFrame(columns=["case_id", "summary"])
@@ -0,0 +1,71 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from atomic_file import atomic_write
+
+
+class SummaryCache:
+    """Persistent LRU cache of case summaries keyed by a hash of the model input"""
+
+    def __init__(self, path="data/summary_cache.json", max_entries=5000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.load()
+
+    @staticmethod
+    def key(text, model, max_length, min_length):
+        payload = json.dumps([model, max_length, min_length, text])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            summary = self._entries.get(key)
+            if summary is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return summary
+
+    def put(self, key, summary):
+        with self._lock:
+            self._entries[key] = summary
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Could not load summary cache: {e}")
+            return
+        with self._lock:
+            self._entries = OrderedDict(entries[-self.max_entries:])
+
+    def save(self):
+        """Write entries oldest-first so LRU order survives a restart"""
+        with self._lock:
+            entries = list(self._entries.items())
+        with atomic_write(self.path) as f:
+            json.dump(entries, f)
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,15 @@
+import pytest
+from atomic_file import atomic_write
+
+
+def test_replaces_the_file_only_when_the_write_succeeds(tmp_path):
+    path = str(tmp_path / "state" / "file.json")
+    with atomic_write(path) as f:
+        f.write("old")
+
+    with pytest.raises(RuntimeError):
+        with atomic_write(path) as f:
+            f.write("half")
+            raise RuntimeError("crash")
+    assert open(path).read() == "old"
+    assert sorted(p.name for p in (tmp_path / "state").iterdir()) == ["file.json"]
@@ -0,0 +1,73 @@
+import pandas as pd
+from entity_resolution import PersonResolver, name_tokens
+
+
+def message(email_id, sender, recipients=()):
+    def address(name, addr):
+        return {"emailAddress": {"name": name, "address": addr}}
+    return {"id": email_id, "from": address(*sender),
+            "toRecipients": [address(*r) for r in recipients], "ccRecipients": []}
+
+
+def resolve(resolver, messages, participants):
+    entities = pd.DataFrame({"email_id": [m["id"] for m in messages], "participants": participants})
+    return resolver.resolve_entities(messages, entities)["participants"].tolist()
+
+
+def test_name_tokens_drop_filler_titles_and_suffixes():
+    assert name_tokens("Inform Thomas") == ["thomas"]
+    assert name_tokens("Dawn Aguirre MD") == ["dawn", "aguirre"]
+    assert name_tokens("Dr. Anita Smith") == ["anita", "smith"]
+
+
+def test_address_fields_and_mentions_resolve_to_one_person():
+    resolver = PersonResolver(None)
+    messages = [message("1", ("Dawn Aguirre", "dawn@x.com"), [("Tom Lee", "tom@x.com")])]
+    result = resolve(resolver, messages, [["Dawn Aguirre", "Tom Lee", "Dawn Aguirre MD", "Inform Tom"]])
+    assert result == [["Dawn Aguirre", "Tom Lee"]]
+
+
+def test_fuzzy_full_name_match_within_block():
+    resolver = PersonResolver(None)
+    messages = [message("1", ("Anita Smith", "anita@x.com")), message("2", ("Tom Lee", "tom@x.com"))]
+    result = resolve(resolver, messages, [["Anita Smith"], ["Tom Lee", "Anita Smyth"]])
+    assert result[1] == ["Tom Lee", "Anita Smith"]
+
+
+def test_same_name_on_two_addresses_stays_two_people():
+    resolver = PersonResolver(None)
+    messages = [message("1", ("Anita Smith", "anita@x.com")), message("2", ("Anita Smith", "anita@y.com"))]
+    assert resolve(resolver, messages, [["Anita Smith"], ["Anita Smith"]]) == [
+        ["Anita Smith"], ["Anita Smith <anita@y.com>"]]
+
+
+def test_first_name_mention_follows_each_messages_participants():
+    resolver = PersonResolver(None)
+    messages = [
+        message("1", ("John Carter", "carter@x.com"), [("Amy Wu", "amy@x.com")]),
+        message("2", ("John Baker", "baker@x.com"), [("Amy Wu", "amy@x.com")]),
+        message("3", ("Amy Wu", "amy@x.com"), [("John Carter", "carter@x.com")]),
+    ]
+    result = resolve(resolver, messages, [["Amy Wu", "John"], ["Amy Wu", "John"], ["Amy Wu", "John"]])
+    assert result == [["Amy Wu", "John Carter"], ["Amy Wu", "John Baker"], ["Amy Wu", "John Carter"]]
+
+
+def test_ambiguous_first_name_is_not_frozen():
+    resolver = PersonResolver(None)
+    first = message("1", ("Amy Wu", "amy@x.com"))
+    assert resolve(resolver, [first], [["Amy Wu", "John"]]) == [["Amy Wu", "John"]]
+    later = message("2", ("John Carter", "carter@x.com"), [("Amy Wu", "amy@x.com")])
+    assert resolve(resolver, [later], [["Amy Wu", "John"]]) == [["Amy Wu", "John Carter"]]
+
+
+def test_map_survives_save_and_load(tmp_path):
+    path = str(tmp_path / "person_map.json")
+    resolver = PersonResolver(path)
+    messages = [message("1", ("Anita Smith", "anita@x.com")), message("2", ("Anita Smith", "anita@y.com"))]
+    resolve(resolver, messages, [["Anita Smith"], ["Anita Smith", "Inform Thomas"]])
+    resolver.save()
+
+    loaded = PersonResolver(path)
+    assert loaded.people == resolver.people
+    assert loaded.aliases == resolver.aliases
+    assert resolve(loaded, [message("3", ("Tom Lee", "tom@x.com"))], [["Anita Smith"]]) == [["Anita Smith"]]
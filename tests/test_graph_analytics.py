@@ -0,0 +1,61 @@
+import pandas as pd
+from graph_analytics import AnalyticsCache, build_adjacency, case_overlap, compute_analytics, compute_structure, \
+    with_structure
+
+
+def entities(rows):
+    return pd.DataFrame([
+        {"email_id": f"e{i}", "case_ids": cases, "participants": people, "teams": teams, "dates": []}
+        for i, (cases, people, teams) in enumerate(rows)
+    ])
+
+
+def overlap(rows, top_k=0):
+    _, _, person_case, team_case, cases = build_adjacency(entities(rows))
+    return [(r["case_a"], r["case_b"], r["shared_participants"], r["shared_teams"])
+            for r in case_overlap(person_case, team_case, cases, top_k=top_k)]
+
+
+def test_case_overlap_counts_shared_participants_and_teams():
+    rows = [
+        (["1"], ["Ann", "Bob"], ["Fraud"]),
+        (["2"], ["Ann", "Bob"], ["Fraud"]),
+        (["3"], ["Bob"], []),
+        # Shares only a team with the others, so it is not listed
+        (["4"], ["Cy"], ["Fraud"]),
+    ]
+    assert overlap(rows) == [("1", "2", 2, 1), ("1", "3", 1, 0), ("2", "3", 1, 0)]
+
+
+def test_case_overlap_keeps_each_cases_top_k():
+    rows = [
+        (["1"], ["Ann", "Bob", "Cy"], []),
+        (["2"], ["Ann", "Bob"], []),
+        (["3"], ["Cy"], []),
+        (["4"], ["Ann"], []),
+    ]
+    # 2-4 is nobody's strongest pair: 2 prefers 1, 4 ties 1 and 2 and takes the lower id
+    assert overlap(rows, top_k=1) == [("1", "2", 2, 0), ("1", "3", 1, 0), ("1", "4", 1, 0)]
+
+
+def test_structure_merges_into_analytics():
+    df = entities([(["1"], ["Ann", "Bob"], ["Fraud"]), (["2"], ["Bob", "Cy"], [])])
+    analytics = compute_analytics(df)
+    assert "communities" not in analytics
+    assert all("betweenness" not in n for n in analytics["nodes"])
+
+    merged = with_structure(analytics, compute_structure(df))
+    nodes = {(n["type"], n["id"]): n for n in merged["nodes"]}
+    # Bob is on every path between the two cases' other people
+    assert max(nodes.values(), key=lambda n: n["betweenness"])["id"] == "Bob"
+    assert all(n["community"] is not None for n in nodes.values())
+    assert sum(c["size"] for c in merged["communities"]) == len(nodes)
+
+
+def test_unchanged_components_are_reused():
+    cache = AnalyticsCache()
+    rows = [(["1"], ["Ann", "Bob"], []), (["2"], ["Cy", "Dee"], [])]
+    assert compute_structure(entities(rows), cache)["recomputed_components"] == 2
+    rows.append((["2"], ["Cy", "Eve"], []))
+    structure = compute_structure(entities(rows), cache)
+    assert (structure["components"], structure["recomputed_components"]) == (2, 1)
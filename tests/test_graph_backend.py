@@ -0,0 +1,71 @@
+import pandas as pd
+from graph_backend import NetworkXBackend
+
+
+def entities(rows):
+    return pd.DataFrame([
+        {"email_id": f"e{i}", "case_ids": cases, "participants": people, "teams": teams, "dates": []}
+        for i, (cases, people, teams) in enumerate(rows)
+    ])
+
+
+def backend(rows):
+    graph = NetworkXBackend(path=None)
+    graph.upsert(entities(rows))
+    return graph
+
+
+def pages(graph, size, **filters):
+    items, cursor = [], None
+    while True:
+        page = list(graph.iter_graph(cursor=cursor, limit=size, **filters))
+        items += page
+        if len(page) < size:
+            return items
+        cursor = page[-1][:2]
+
+
+ROWS = [
+    (["1"], ["Bob", "Ann"], ["Fraud"]),
+    (["2"], ["Ann", "Cy"], []),
+    (["2"], ["Cy", "Ann"], []),
+]
+
+
+def test_links_are_keyed_the_way_neo4j_stores_them():
+    links = [(key, item) for kind, key, item in backend(ROWS).iter_graph() if kind == "link"]
+    assert ("Person", "Ann", "Person", "Cy", "COMMUNICATED_IN") in [key for key, _ in links]
+    # Towards the case, whichever end networkx holds first
+    assert all(item["target"] in ("1", "2") for key, item in links if key[2] == "Case")
+    assert [key for key, _ in links] == sorted(key for key, _ in links)
+
+
+def test_pages_add_up_to_the_full_graph():
+    graph = backend(ROWS)
+    for filters in ({}, {"node_types": ["Person", "Case"]}, {"min_weight": 2}, {"center": "2"}):
+        full = list(graph.iter_graph(**filters))
+        assert full
+        for size in (1, 2, 5):
+            assert pages(graph, size, **filters) == full
+
+
+def test_upsert_and_rebuild_refresh_the_pages():
+    graph = backend(ROWS[:1])
+    before = len(list(graph.iter_graph()))
+    graph.upsert(entities(ROWS))
+    assert len(list(graph.iter_graph())) > before
+    graph.rebuild(entities(ROWS[:1]))
+    assert len(list(graph.iter_graph())) == before
+
+
+def test_watermark_is_saved_with_the_graph_and_reset_by_rebuild(tmp_path):
+    path = str(tmp_path / "graph.pickle")
+    graph = NetworkXBackend(path=path)
+    assert graph.read_watermark() == 0
+    graph.upsert(entities(ROWS))
+    graph.write_watermark(3)
+    graph.save()
+    assert NetworkXBackend(path=path).read_watermark() == 3
+
+    graph.rebuild(entities(ROWS[:1]))
+    assert graph.read_watermark() == 0
@@ -0,0 +1,102 @@
+from mailbox_ingest import GraphDeltaSource, MailboxIngestor
+
+
+def message(i, received="2025-01-01T00:00:00Z", internet_id=None):
+    return {"id": f"m{i}", "internetMessageId": internet_id or f"<{i}@example.com>", "receivedDateTime": received}
+
+
+class ListSource:
+    """Pages of messages, each page ending on the cursor given with it"""
+
+    def __init__(self, pages):
+        self._pages = pages
+        self.cursors = []
+
+    def pages(self, cursor=None):
+        self.cursors.append(cursor)
+        yield from self._pages
+
+
+def test_ingest_skips_seen_and_duplicate_messages(tmp_path):
+    ingestor = MailboxIngestor(str(tmp_path / "state.json"))
+    ingestor.seed([message(1)])
+    source = ListSource([
+        ([message(1), message(2)], None),
+        # Same message id again, and a new id for a message already delivered
+        ([message(2), message(3, internet_id="<2@example.com>"), message(4)], "delta-1"),
+    ])
+    ids = [m["id"] for m in ingestor.ingest(source)["value"]]
+    assert ids == ["m2", "m4"]
+    assert ingestor.duplicates == 3
+
+
+def test_nothing_is_seen_until_commit(tmp_path):
+    ingestor = MailboxIngestor(str(tmp_path / "state.json"))
+    source = ListSource([([message(1, "2025-01-02T00:00:00Z")], "delta-1")])
+    assert len(ingestor.ingest(source)["value"]) == 1
+    assert ingestor.cursor is None and ingestor.high_water_mark is None
+    # A failed run fetches the same delta again
+    assert len(ingestor.ingest(source)["value"]) == 1
+
+    ingestor.commit()
+    assert ingestor.cursor == "delta-1"
+    assert ingestor.high_water_mark == "2025-01-02T00:00:00Z"
+    assert ingestor.ingest(source)["value"] == []
+    assert source.cursors == [None, None, "delta-1"]
+
+
+def test_commit_persists_state(tmp_path):
+    path = str(tmp_path / "state.json")
+    ingestor = MailboxIngestor(path)
+    ingestor.ingest(ListSource([([message(1), message(2, "2025-01-03T00:00:00Z")], "delta-1")]))
+    ingestor.commit()
+
+    reloaded = MailboxIngestor(path)
+    assert reloaded.cursor == "delta-1"
+    assert reloaded.high_water_mark == "2025-01-03T00:00:00Z"
+    assert list(reloaded.seen_ids) == ["m1", "m2"]
+    source = ListSource([([message(2), message(3)], "delta-2")])
+    assert [m["id"] for m in reloaded.ingest(source)["value"]] == ["m3"]
+    assert source.cursors == ["delta-1"]
+
+
+def test_seen_ids_are_bounded_by_the_window(tmp_path):
+    path = str(tmp_path / "state.json")
+    ingestor = MailboxIngestor(path, window=2)
+    days = [f"2025-01-0{i}T00:00:00Z" for i in range(1, 5)]
+    ingestor.ingest(ListSource([([message(i, days[i - 1]) for i in (1, 2, 3)], "delta-1")]))
+    ingestor.commit()
+    assert list(ingestor.seen_ids) == ["m2", "m3"]
+    assert ingestor.evicted_until == days[0]
+
+    reloaded = MailboxIngestor(path, window=2)
+    # m1 left the window but is no newer than what was evicted, so it is still a duplicate
+    source = ListSource([([message(1, days[0]), message(3, days[2]), message(4, days[3])], "delta-2")])
+    assert [m["id"] for m in reloaded.ingest(source)["value"]] == ["m4"]
+
+def test_recover_catches_up_with_the_snapshot_commit(tmp_path):
+    path = str(tmp_path / "state.json")
+    ingestor = MailboxIngestor(path)
+    ingestor.ingest(ListSource([([message(1), message(2, "2025-01-03T00:00:00Z")], "delta-1")]))
+    state = ingestor.pending_state()
+    assert state == {"cursor": "delta-1", "high_water_mark": "2025-01-03T00:00:00Z"}
+
+    # The snapshot committed the delta, but the run died before the ingestor did
+    crashed = MailboxIngestor(path)
+    assert crashed.snapshot_commit is None
+    crashed.recover(state, [message(1), message(2)], snapshot_commit=1)
+    reloaded = MailboxIngestor(path)
+    assert (reloaded.cursor, reloaded.snapshot_commit) == ("delta-1", 1)
+    source = ListSource([([message(2), message(3)], "delta-2")])
+    assert [m["id"] for m in reloaded.ingest(source)["value"]] == ["m3"]
+    assert source.cursors == ["delta-1"]
+
+def test_graph_delta_source_follows_next_links():
+    responses = {
+        "start": {"value": [message(1)], "@odata.nextLink": "page-2"},
+        "page-2": {"value": [message(2)], "@odata.deltaLink": "delta-1"},
+    }
+    source = GraphDeltaSource("start")
+    source._get = responses.__getitem__
+    pages = [([m["id"] for m in page], cursor) for page, cursor in source.pages()]
+    assert pages == [(["m1"], None), (["m2"], "delta-1")]
@@ -0,0 +1,42 @@
+import importlib
+
+import nlp_preprocessing
+import pytest
+
+
+def email(subject, body):
+    return {"id": "m1", "subject": subject, "body": {"content": body},
+            "from": {"emailAddress": {"name": "Anita Smith", "address": "anita@x.com"}},
+            "toRecipients": [{"emailAddress": {"name": "Tom Lee", "address": "tom@x.com"}}],
+            "ccRecipients": [], "bccRecipients": []}
+
+
+@pytest.fixture
+def reload_with_vocabulary(monkeypatch):
+    def reload(vocabulary):
+        monkeypatch.setenv("TEAM_VOCABULARY", vocabulary)
+        return importlib.reload(nlp_preprocessing)
+    yield reload
+    monkeypatch.delenv("TEAM_VOCABULARY")
+    importlib.reload(nlp_preprocessing)
+
+
+def test_rules_extract_cases_teams_dates_and_participants():
+    found = nlp_preprocessing.entities_from_rules(email(
+        "Case 1001 and Case 1002", "<p>Team A and Litigation meet on 2025-10-03, again October 5. Case 1001</p>"))
+    assert found["case_ids"] == ["1001", "1002"]
+    assert found["teams"] == ["Team A", "Litigation"]
+    assert found["dates"] == ["2025-10-03", "October 5"]
+    assert found["participants"] == ["Anita Smith", "Tom Lee"]
+
+
+def test_custom_vocabulary_prefers_longest_name(reload_with_vocabulary):
+    module = reload_with_vocabulary("Team A, Team AB")
+    assert module.entities_from_rules(email("Hi", "Team AB and Team A"))["teams"] == ["Team AB", "Team A"]
+
+
+@pytest.mark.parametrize("vocabulary", ["", " , "])
+def test_blank_vocabulary_finds_no_teams(reload_with_vocabulary, vocabulary):
+    module = reload_with_vocabulary(vocabulary)
+    assert module.TEAM_PATTERN is None
+    assert module.entities_from_rules(email("Case 7", "Team A"))["teams"] == []
@@ -0,0 +1,83 @@
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from types import SimpleNamespace
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from response_cache import ResponseCache
+
+MODIFIED = datetime(2024, 5, 1, 12, 0, 0, 500000, tzinfo=timezone.utc)
+
+
+def make_client(cache, state):
+    app = FastAPI()
+
+    @app.get("/items")
+    def items(request: Request, n: int = 10):
+        snapshot = state["snapshot"]
+        return cache.get(snapshot, ("items", n), lambda: list(range(n))).respond(request)
+
+    return TestClient(app)
+
+
+def snapshot(modified=MODIFIED):
+    return SimpleNamespace(last_modified=modified)
+
+
+def test_etag_and_if_none_match():
+    cache = ResponseCache()
+    client = make_client(cache, {"snapshot": snapshot()})
+    response = client.get("/items")
+    assert response.status_code == 200
+    assert response.json() == list(range(10))
+    etag = response.headers["etag"]
+
+    assert client.get("/items", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/items", headers={"If-None-Match": "W/" + etag}).status_code == 304
+    assert client.get("/items", headers={"If-None-Match": '"other"'}).status_code == 200
+
+
+def test_if_modified_since_uses_whole_seconds():
+    cache = ResponseCache()
+    state = {"snapshot": snapshot()}
+    client = make_client(cache, state)
+    last_modified = client.get("/items").headers["last-modified"]
+    assert last_modified == format_datetime(MODIFIED, usegmt=True)
+    assert client.get("/items", headers={"If-Modified-Since": last_modified}).status_code == 304
+
+    state["snapshot"] = snapshot(MODIFIED.replace(second=1))
+    assert client.get("/items", headers={"If-Modified-Since": last_modified}).status_code == 200
+
+
+def test_new_snapshot_drops_entries():
+    cache = ResponseCache()
+    state = {"snapshot": snapshot()}
+    client = make_client(cache, state)
+    client.get("/items")
+    client.get("/items")
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    state["snapshot"] = snapshot()
+    client.get("/items")
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_entries_are_capped_lru():
+    cache = ResponseCache(max_entries=2)
+    client = make_client(cache, {"snapshot": snapshot()})
+    for n in (1, 2, 1, 3):
+        client.get("/items", params={"n": n})
+    assert cache.stats()["entries"] == 2
+    assert cache.evictions == 1
+    client.get("/items", params={"n": 1})
+    assert cache.hits == 2
+
+
+def test_large_bodies_are_compressed():
+    cache = ResponseCache()
+    client = make_client(cache, {"snapshot": snapshot()})
+    response = client.get("/items", params={"n": 2000}, headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] in ("gzip", "br")
+    assert response.json() == list(range(2000))
+    small = client.get("/items", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in small.headers
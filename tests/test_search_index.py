@@ -0,0 +1,76 @@
+from datetime import datetime
+
+import pandas as pd
+from search_index import SearchIndex, tokenize
+
+
+def message(email_id, subject, body, sent):
+    return {"id": email_id, "subject": subject, "body": {"contentType": "html", "content": body},
+            "sentDateTime": sent}
+
+
+MESSAGES = [
+    message("a", "Case 1001 filing", "<p>The filing deadline for the appeal is Friday.</p>", "2025-01-01T09:00:00Z"),
+    message("b", "Case 1002 update", "<p>Deadline deadline deadline moved again.</p>", "2025-01-02T09:00:00Z"),
+    message("c", "Lunch", "<p>Anyone for lunch?</p>", "2025-01-03T09:00:00Z"),
+    message("d", "Case 1001 evidence", "<p>Evidence was filed with the appeal.</p>", "2025-01-04T09:00:00Z"),
+]
+ENTITIES = pd.DataFrame({
+    "email_id": ["a", "b", "c", "d"],
+    "case_ids": [["1001"], ["1002"], [], ["1001"]],
+    "participants": [["Anita Smith"], ["Tom Lee"], ["Tom Lee"], ["Anita Smith", "Tom Lee"]],
+    "teams": [["Litigation"], [], [], ["Litigation"]],
+})
+
+
+def build():
+    index = SearchIndex(None)
+    assert index.add(MESSAGES, ENTITIES) == 4
+    return index
+
+
+def ids(result):
+    return [r["email_id"] for r in result["results"]]
+
+
+def test_tokenize_lowercases_and_splits_on_punctuation():
+    assert tokenize("Case-1001: Filing!") == ["case", "1001", "filing"]
+
+
+def test_bm25_ranks_by_term_frequency_and_rarity():
+    index = build()
+    assert ids(index.search("deadline")) == ["b", "a"]
+    # "appeal" is in two emails, "evidence" only in d, so d wins on the rarer term
+    assert ids(index.search("appeal evidence"))[0] == "d"
+
+
+def test_filters_narrow_query_results():
+    index = build()
+    assert ids(index.search("appeal", case_id="1001")) == ["d", "a"]
+    assert ids(index.search("appeal", participant="tom lee")) == ["d"]
+    assert ids(index.search(team="litigation")) == ["d", "a"]
+    assert ids(index.search(start="2025-01-02T00:00:00Z", end=datetime(2025, 1, 4))) == ["c", "b"]
+
+
+def test_no_query_lists_newest_first_with_paging():
+    index = build()
+    result = index.search(offset=1, limit=2)
+    assert result["total"] == 4
+    assert ids(result) == ["c", "b"]
+
+
+def test_query_without_tokens_matches_nothing():
+    assert build().search("!!!")["total"] == 0
+
+
+def test_add_skips_indexed_emails_and_survives_save(tmp_path):
+    path = str(tmp_path / "index.pickle")
+    index = SearchIndex(path)
+    index.add(MESSAGES, ENTITIES)
+    assert index.add(MESSAGES[:2], ENTITIES.iloc[:2]) == 0
+    index.save()
+
+    loaded = SearchIndex(path)
+    assert len(loaded) == 4
+    assert ids(loaded.search("deadline")) == ["b", "a"]
+    assert loaded.add(MESSAGES[:1], ENTITIES.iloc[:1]) == 0
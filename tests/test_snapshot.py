@@ -0,0 +1,156 @@
+import os
+from datetime import datetime, timezone
+
+import pandas as pd
+import snapshot
+from ingest_emails import BulkGenerator
+
+CREATED = datetime(2025, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+
+
+def corpus(n):
+    messages = list(BulkGenerator(seed=1, n_cases=10, n_people=50).messages(n))
+    entities = pd.DataFrame({
+        "email_id": [m["id"] for m in messages],
+        "case_ids": [[str(1000 + i % 10)] for i in range(n)],
+        "participants": [[m["from"]["emailAddress"]["name"]] for m in messages],
+        "teams": [[] for _ in range(n)],
+        "dates": [[m["sentDateTime"][:10]] for m in messages],
+    })
+    return messages, entities
+
+
+def write(path, messages, entities, chunk, **kwargs):
+    writer = snapshot.SnapshotWriter(path, **kwargs)
+    for start in range(0, len(messages), chunk):
+        writer.append(messages[start:start + chunk], entities.iloc[start:start + chunk])
+    summaries = pd.DataFrame({"case_id": ["1000"], "summary": ["A summary"]})
+    writer.commit(summaries, {"1000": "case text"}, created_at=CREATED)
+    return writer
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "snapshot")
+    messages, entities = corpus(30)
+    write(path, messages, entities, chunk=10)
+
+    read_entities, summaries, case_texts, created_at = snapshot.read_snapshot(path)
+    assert read_entities["email_id"].tolist() == entities["email_id"].tolist()
+    assert read_entities["case_ids"].tolist() == entities["case_ids"].tolist()
+    assert summaries.to_dict("records") == [{"case_id": "1000", "summary": "A summary"}]
+    assert case_texts == {"1000": "case text"}
+    assert created_at == CREATED
+
+    stored = list(snapshot.iter_emails(path))
+    assert [m["id"] for m in stored] == [m["id"] for m in messages]
+    assert stored[0]["sentDateTime"] == messages[0]["sentDateTime"]
+    assert stored[0]["body"] == messages[0]["body"]
+
+
+def test_each_commit_writes_its_own_summaries(tmp_path):
+    path = str(tmp_path / "snapshot")
+    messages, entities = corpus(20)
+    write(path, messages[:10], entities.iloc[:10], chunk=10)
+    writer = snapshot.SnapshotWriter(path)
+    writer.append(messages[10:], entities.iloc[10:])
+    summaries = pd.DataFrame({"case_id": ["1001"], "summary": ["Newer"]})
+    assert writer.commit(summaries, {"1001": "newer text"}, ingest={"cursor": "delta-2", "high_water_mark": None}) == 2
+
+    manifest = snapshot.read_manifest(path)
+    assert (manifest["summaries"], manifest["case_texts"]) == ("summaries-000002.arrow", "case_texts-000002.arrow")
+    assert manifest["ingest"]["cursor"] == "delta-2"
+    # The first commit's files are gone once nothing names them
+    assert sorted(n for n in os.listdir(path) if n.endswith(".arrow")) == \
+        ["case_texts-000002.arrow", "summaries-000002.arrow"]
+    _, read_summaries, case_texts, _ = snapshot.read_snapshot(path)
+    assert read_summaries["summary"].tolist() == ["Newer"]
+    assert case_texts == {"1001": "newer text"}
+
+def test_uncommitted_parts_are_invisible(tmp_path):
+    path = str(tmp_path / "snapshot")
+    messages, entities = corpus(20)
+    write(path, messages[:10], entities.iloc[:10], chunk=10)
+    snapshot.SnapshotWriter(path).append(messages[10:], entities.iloc[10:])
+    assert len(snapshot.read_snapshot(path)[0]) == 10
+    assert len(list(snapshot.iter_emails(path))) == 10
+
+
+def test_compaction_merges_parts_and_keeps_rows(tmp_path):
+    path = str(tmp_path / "snapshot")
+    messages, entities = corpus(50)
+    writer = write(path, messages, entities, chunk=5, compact_parts=4)
+    assert writer.generation == 1
+    assert snapshot.read_manifest(path)["parts"] == 1
+    assert len(os.listdir(os.path.join(path, "emails"))) == 1
+
+    assert snapshot.read_snapshot(path)[0]["email_id"].tolist() == entities["email_id"].tolist()
+    assert [m["id"] for m in snapshot.iter_emails(path)] == [m["id"] for m in messages]
+
+    # Later runs append to the compacted generation
+    more, more_entities = corpus(55)
+    write(path, more[50:], more_entities.iloc[50:], chunk=5, compact_parts=4)
+    assert [m["id"] for m in snapshot.iter_emails(path)] == [m["id"] for m in more]
+
+
+def test_compaction_respects_part_rows(tmp_path):
+    path = str(tmp_path / "snapshot")
+    messages, entities = corpus(40)
+    write(path, messages, entities, chunk=5, compact_parts=1000)
+    parts, generation = snapshot.compact(path, part_rows=20)
+    assert (parts, generation) == (2, 1)
+    assert len(snapshot.read_snapshot(path)[0]) == 40
+
+
+def test_compaction_transform_rewrites_entities(tmp_path):
+    path = str(tmp_path / "snapshot")
+    messages, entities = corpus(20)
+    write(path, messages, entities, chunk=5, compact_parts=1000)
+    seen = []
+
+    def sender_ids(part_messages, part_entities):
+        seen.extend(m["id"] for m in part_messages)
+        part_entities = part_entities.copy()
+        part_entities["participants"] = [[m["from"]["emailAddress"]["address"]] for m in part_messages]
+        return part_entities
+
+    snapshot.compact(path, part_rows=10, transform=sender_ids)
+    assert seen == [m["id"] for m in messages]
+    stored = snapshot.read_snapshot(path)[0]
+    assert stored["participants"].tolist() == [[m["from"]["emailAddress"]["address"]] for m in messages]
+    assert [m["id"] for m in snapshot.iter_emails(path)] == seen
+
+
+def write_legacy(data_dir, messages, entities):
+    import json
+    os.makedirs(data_dir, exist_ok=True)
+    entities.to_csv(os.path.join(data_dir, "entities.csv"), index=False)
+    pd.DataFrame({"case_id": ["1000"], "summary": ["A summary"]}).to_csv(
+        os.path.join(data_dir, "summaries.csv"), index=False)
+    with open(os.path.join(data_dir, "emails.json"), "w") as f:
+        json.dump({"@odata.context": "ctx", "value": messages}, f)
+
+
+def test_migrate_legacy_csv(tmp_path):
+    data_dir, path = str(tmp_path / "data"), str(tmp_path / "snapshot")
+    messages, entities = corpus(12)
+    write_legacy(data_dir, messages, entities)
+    assert snapshot.migrate_legacy(data_dir, path)
+
+    read_entities, summaries, case_texts, _ = snapshot.read_snapshot(path)
+    assert read_entities["email_id"].tolist() == entities["email_id"].tolist()
+    assert read_entities["case_ids"].tolist() == entities["case_ids"].tolist()
+    assert summaries["case_id"].tolist() == ["1000"]
+    assert set(case_texts) == set(c for ids in entities["case_ids"] for c in ids)
+    assert [m["id"] for m in snapshot.iter_emails(path)] == entities["email_id"].tolist()
+
+
+def test_migrate_legacy_drops_entity_rows_without_messages(tmp_path):
+    data_dir, path = str(tmp_path / "data"), str(tmp_path / "snapshot")
+    messages, entities = corpus(12)
+    write_legacy(data_dir, messages[:-3], entities)
+    assert snapshot.migrate_legacy(data_dir, path)
+
+    read_entities = snapshot.read_snapshot(path)[0]
+    stored = [m["id"] for m in snapshot.iter_emails(path)]
+    assert stored == [m["id"] for m in messages[:-3]]
+    assert read_entities["email_id"].tolist() == stored
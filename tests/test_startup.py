@@ -0,0 +1,14 @@
+import os
+
+from benchmarks.check_startup import HEAVY_MODULES, probe
+
+BUDGET_SECONDS = float(os.getenv("STARTUP_BUDGET_SECONDS", "2.0"))
+
+
+def test_import_main_is_fast_and_lazy():
+    env = {**os.environ, "GRAPH_BACKEND": "networkx"}
+    # Best of a few runs, as the script does, so one slow cold start does not fail the suite
+    results = [probe(env)[0] for _ in range(3)]
+    best = min(results, key=lambda r: r["seconds"])
+    assert best["seconds"] < BUDGET_SECONDS
+    assert [m for m in HEAVY_MODULES if m in best["heavy"]] == []
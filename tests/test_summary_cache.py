@@ -0,0 +1,52 @@
+from summary_cache import SummaryCache
+
+
+def test_key_depends_on_text_model_and_lengths():
+    key = SummaryCache.key("text", "bart", 100, 30)
+    assert key == SummaryCache.key("text", "bart", 100, 30)
+    assert key != SummaryCache.key("text.", "bart", 100, 30)
+    assert key != SummaryCache.key("text", "distilbart", 100, 30)
+    assert key != SummaryCache.key("text", "bart", 120, 30)
+
+
+def test_hits_misses_and_lru_eviction(tmp_path):
+    cache = SummaryCache(str(tmp_path / "cache.json"), max_entries=2)
+    cache.put("a", "summary a")
+    cache.put("b", "summary b")
+    assert cache.get("a") == "summary a"
+    # "b" is now the least recently used entry
+    cache.put("c", "summary c")
+    assert cache.get("b") is None
+    assert cache.get("c") == "summary c"
+    assert cache.stats() == {"entries": 2, "max_entries": 2, "hits": 2, "misses": 1, "evictions": 1}
+
+
+def test_save_and_load_keep_lru_order(tmp_path):
+    path = str(tmp_path / "cache.json")
+    cache = SummaryCache(path, max_entries=3)
+    for key in "abc":
+        cache.put(key, key.upper())
+    cache.get("a")
+    cache.save()
+
+    reloaded = SummaryCache(path, max_entries=3)
+    reloaded.put("d", "D")
+    # "b" was the oldest when saved, so it is evicted first after the restart
+    assert reloaded.get("b") is None
+    assert [reloaded.get(k) for k in "cad"] == ["C", "A", "D"]
+
+
+def test_load_keeps_the_newest_entries_when_the_limit_shrinks(tmp_path):
+    path = str(tmp_path / "cache.json")
+    cache = SummaryCache(path, max_entries=3)
+    for key in "abc":
+        cache.put(key, key.upper())
+    cache.save()
+    assert SummaryCache(path, max_entries=2).stats()["entries"] == 2
+    assert SummaryCache(path, max_entries=2).get("a") is None
+
+
+def test_unreadable_file_starts_empty(tmp_path):
+    path = tmp_path / "cache.json"
+    path.write_text("{not json")
+    assert SummaryCache(str(path)).stats()["entries"] == 0